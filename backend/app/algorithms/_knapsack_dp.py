@@ -0,0 +1,63 @@
+"""
+Kernel de knapsack 0-1 por programación dinámica.
+
+Compilado con Numba cuando está disponible; si no, usa una versión
+vectorizada con NumPy que produce exactamente la misma selección.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    # Firma explícita: se compila (o se lee del cache en disco) al importar el módulo
+    @njit("boolean[::1](int64[:], float64[:], int64)", cache=True)
+    def knapsack_dp(weights, values, capacity):
+        """Retorna la máscara booleana de items seleccionados (weights int64, values float64)"""
+        n = weights.shape[0]
+        dp = np.zeros(capacity + 1, dtype=np.float64)
+        keep = np.zeros((n, capacity + 1), dtype=np.bool_)
+        for i in range(n):
+            w = weights[i]
+            v = values[i]
+            for c in range(capacity, w - 1, -1):
+                if dp[c - w] + v > dp[c]:
+                    dp[c] = dp[c - w] + v
+                    keep[i, c] = True
+
+        selected = np.zeros(n, dtype=np.bool_)
+        c = capacity
+        for i in range(n - 1, -1, -1):
+            if keep[i, c]:
+                selected[i] = True
+                c -= weights[i]
+        return selected
+else:
+    def knapsack_dp(weights, values, capacity):
+        """Retorna la máscara booleana de items seleccionados (weights int64, values float64)"""
+        n = weights.shape[0]
+        dp = np.zeros(capacity + 1, dtype=np.float64)
+        keep = np.zeros((n, capacity + 1), dtype=np.bool_)
+        for i in range(n):
+            w = int(weights[i])
+            if w > capacity:
+                continue
+            # Cada fila solo lee valores de la fila anterior (c - w < c),
+            # igual que el recorrido descendente del loop escalar
+            candidate = dp[:capacity + 1 - w] + values[i]
+            improved = candidate > dp[w:]
+            dp[w:][improved] = candidate[improved]
+            keep[i, w:] = improved
+
+        selected = np.zeros(n, dtype=np.bool_)
+        c = capacity
+        for i in range(n - 1, -1, -1):
+            if keep[i, c]:
+                selected[i] = True
+                c -= int(weights[i])
+        return selected
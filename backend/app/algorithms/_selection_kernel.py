@@ -0,0 +1,94 @@
+"""
+Kernel de selección de variantes por item.
+
+Recibe los candidatos de todos los items aplanados en columnas (estilo CSR:
+`offsets[i]:offsets[i + 1]` son los candidatos del item i) y retorna, por item,
+el índice del mejor candidato según el objetivo, del más barato y del más caro.
+Compilado con Numba cuando está disponible.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Objetivos de optimización (cualquier otro valor se trata como balanced)
+MODE_PRICE = 0
+MODE_SUSTAINABILITY = 1
+MODE_HEALTH = 2
+MODE_BALANCED = 3
+
+OPTIMIZE_MODES = {
+    "price": MODE_PRICE,
+    "sustainability": MODE_SUSTAINABILITY,
+    "health": MODE_HEALTH,
+}
+
+
+def _select_candidates(prices, overall_scores, health_scores, offsets, forced, mode):
+    """Retorna (mejor, más barato, más caro) como índices globales por item"""
+    n_items = offsets.shape[0] - 1
+    best = np.empty(n_items, dtype=np.int64)
+    cheapest = np.empty(n_items, dtype=np.int64)
+    priciest = np.empty(n_items, dtype=np.int64)
+
+    for i in range(n_items):
+        lo = offsets[i]
+        hi = offsets[i + 1]
+
+        # Primer mínimo y primer máximo de precio (mismo desempate que min()/max())
+        min_idx = lo
+        max_idx = lo
+        for j in range(lo + 1, hi):
+            if prices[j] < prices[min_idx]:
+                min_idx = j
+            if prices[j] > prices[max_idx]:
+                max_idx = j
+        cheapest[i] = min_idx
+        priciest[i] = max_idx
+
+        if forced[i] >= 0:
+            best[i] = forced[i]
+        elif mode == MODE_PRICE:
+            best[i] = min_idx
+        elif mode == MODE_SUSTAINABILITY:
+            best_idx = lo
+            for j in range(lo + 1, hi):
+                if overall_scores[j] > overall_scores[best_idx]:
+                    best_idx = j
+            best[i] = best_idx
+        elif mode == MODE_HEALTH:
+            best_idx = lo
+            for j in range(lo + 1, hi):
+                if health_scores[j] > health_scores[best_idx]:
+                    best_idx = j
+            best[i] = best_idx
+        else:
+            min_price = prices[min_idx]
+            price_range = prices[max_idx] - min_price
+            # Sin rango de precios todos los candidatos obtienen 100
+            inv_range = 0.0 if price_range == 0 else 100.0 / price_range
+            best_idx = lo
+            best_score = -np.inf
+            for j in range(lo, hi):
+                price_score = 100.0 - (prices[j] - min_price) * inv_range
+                score = 0.4 * price_score + 0.4 * overall_scores[j] + 0.2 * health_scores[j]
+                if score > best_score:
+                    best_score = score
+                    best_idx = j
+            best[i] = best_idx
+
+    return best, cheapest, priciest
+
+
+if NUMBA_AVAILABLE:
+    # Firma explícita: se compila (o se lee del cache en disco) al importar el módulo
+    select_candidates = njit(
+        "UniTuple(int64[::1], 3)(float64[:], float64[:], float64[:], int64[:], int64[:], int64)",
+        cache=True,
+    )(_select_candidates)
+else:
+    select_candidates = _select_candidates
@@ -0,0 +1,155 @@
+"""
+Kernels numéricos del motor de sustitución.
+
+Calculan, para todos los candidatos a la vez, la similitud con el producto
+original y el score ponderado de sustitución. Compilados con Numba cuando
+está disponible; si no, se usa la versión vectorizada con NumPy. Ambas
+suman los componentes en el mismo orden y en float64, por lo que producen
+los mismos valores.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    # Firmas explícitas: se compilan (o se leen del cache en disco) al importar el
+    # módulo, no en el primer request. nogil: pueden correr en paralelo desde varios hilos
+    @njit(
+        "float64[::1](float64, float64[:], float64[:], boolean[:], boolean[:], boolean[:], "
+        "float64[:], float64[:], boolean[:], float64[:], float64[:, :])",
+        cache=True, nogil=True,
+    )
+    def candidate_similarity(
+        price_o, prices, category_score, brand_mask, same_brand,
+        label_mask, intersection, union, nutrition_mask, nutrition_o, nutrition
+    ):
+        """Similitud (0-1) del producto original con cada candidato"""
+        n = prices.shape[0]
+        n_metrics = nutrition_o.shape[0]
+        result = np.empty(n, dtype=np.float64)
+        for i in range(n):
+            score = 0.0
+            components = 0.0
+
+            # 1. Categoría (exacta 0.4, similar 0.2)
+            score += category_score[i]
+            components += 0.4
+
+            # 2. Marca
+            if brand_mask[i]:
+                if same_brand[i]:
+                    score += 0.1
+                components += 0.1
+
+            # 3. Labels comunes (Jaccard)
+            if label_mask[i]:
+                score += intersection[i] / union[i] * 0.2
+                components += 0.2
+
+            # 4. Similitud nutricional (promedio sobre macros no nulos)
+            if nutrition_mask[i]:
+                total = 0.0
+                count = 0
+                for m in range(n_metrics):
+                    val1 = nutrition_o[m]
+                    val2 = nutrition[i, m]
+                    if val1 == 0 and val2 == 0:
+                        continue
+                    max_val = max(val1, val2)
+                    if max_val > 0:
+                        total += 1 - abs(val1 - val2) / max_val
+                        count += 1
+                nutrition_similarity = total / count if count > 0 else 0.0
+                score += nutrition_similarity * 0.15
+                components += 0.15
+
+            # 5. Rango de precio similar (dentro del 30%)
+            if min(price_o, prices[i]) / max(price_o, prices[i]) >= 0.7:
+                score += 0.15
+            components += 0.15
+
+            result[i] = score / components
+        return result
+
+    @njit(
+        "float64[::1](float64[:], float64[:], float64[:], float64[:], "
+        "float64, float64, float64, float64)",
+        cache=True, nogil=True,
+    )
+    def substitution_scores(
+        price_diff_pct, sustainability_improvement, health_improvement, similarity,
+        w_price, w_sustainability, w_health, w_similarity
+    ):
+        """Score ponderado de sustitución (0-100) para cada candidato"""
+        n = similarity.shape[0]
+        result = np.empty(n, dtype=np.float64)
+        for i in range(n):
+            price_score = min(100.0, max(0.0, 50 + price_diff_pct[i]))  # 50 = neutral
+            sustainability_score = min(100.0, max(0.0, 50 + sustainability_improvement[i]))
+            health_score = min(100.0, max(0.0, 50 + health_improvement[i]))
+            similarity_score = similarity[i] * 100
+            result[i] = (
+                w_price * price_score
+                + w_sustainability * sustainability_score
+                + w_health * health_score
+                + w_similarity * similarity_score
+            )
+        return result
+else:
+    def candidate_similarity(
+        price_o, prices, category_score, brand_mask, same_brand,
+        label_mask, intersection, union, nutrition_mask, nutrition_o, nutrition
+    ):
+        """Similitud (0-1) del producto original con cada candidato"""
+        n = prices.shape[0]
+        score = np.zeros(n) + category_score
+        components = np.full(n, 0.4)
+
+        score = np.where(brand_mask & same_brand, score + 0.1, score)
+        components = np.where(brand_mask, components + 0.1, components)
+
+        label_overlap = intersection / np.where(label_mask, union, 1.0)
+        score = np.where(label_mask, score + label_overlap * 0.2, score)
+        components = np.where(label_mask, components + 0.2, components)
+
+        total = np.zeros(n)
+        count = np.zeros(n)
+        for m in range(nutrition_o.shape[0]):
+            val1 = nutrition_o[m]
+            val2 = nutrition[:, m]
+            max_val = np.maximum(val1, val2)
+            valid = ~((val1 == 0) & (val2 == 0)) & (max_val > 0)
+            similarity = 1 - np.abs(val1 - val2) / np.where(valid, max_val, 1.0)
+            total = np.where(valid, total + similarity, total)
+            count = count + valid
+        nutrition_similarity = np.where(count > 0, total / np.maximum(count, 1), 0.0)
+        score = np.where(nutrition_mask, score + nutrition_similarity * 0.15, score)
+        components = np.where(nutrition_mask, components + 0.15, components)
+
+        price_ratio = np.minimum(price_o, prices) / np.maximum(price_o, prices)
+        score = np.where(price_ratio >= 0.7, score + 0.15, score)
+        components = components + 0.15
+
+        return score / components
+
+    def substitution_scores(
+        price_diff_pct, sustainability_improvement, health_improvement, similarity,
+        w_price, w_sustainability, w_health, w_similarity
+    ):
+        """Score ponderado de sustitución (0-100) para cada candidato"""
+        price_score = np.clip(50 + price_diff_pct, 0.0, 100.0)  # 50 = neutral
+        sustainability_score = np.clip(50 + sustainability_improvement, 0.0, 100.0)
+        health_score = np.clip(50 + health_improvement, 0.0, 100.0)
+        similarity_score = similarity * 100
+        return (
+            w_price * price_score
+            + w_sustainability * sustainability_score
+            + w_health * health_score
+            + w_similarity * similarity_score
+        )
@@ -8,10 +8,37 @@ Lógica correcta:
 4. Calcular ahorro real (costo sin optimizar vs optimizado)
 """
 
-from typing import List, Dict, Tuple, Optional
+import math
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Dict, Tuple, Optional, FrozenSet
+
+import numpy as np
+
 from ..models.product import Product, SustainabilityScore
 from ..models.shopping_list import ShoppingListItem, ShoppingList, OptimizedProduct, OptimizedShoppingList, SavingsOpportunity
-from .sustainability_scorer import SustainabilityScorer
+from .sustainability_scorer import SustainabilityScorer, label_profile
+from ._knapsack_dp import knapsack_dp
+from ._selection_kernel import select_candidates, OPTIMIZE_MODES, MODE_PRICE, MODE_BALANCED
+
+
+@dataclass(slots=True)
+class _CategoryIndex:
+    """Productos de una categoría en columnas (SoA) para filtrar sin recorrer objetos"""
+    products: List[Product]
+    prices: np.ndarray
+    names_lc: List[str]
+    label_sets: List[FrozenSet[str]]
+    token_index: Dict[str, List[int]]
+
+
+@dataclass(slots=True)
+class Selection:
+    """Item de la lista con sus candidatos, el producto elegido y el de referencia"""
+    item: ShoppingListItem
+    candidates: List[Product]
+    selected: Optional[Product]
+    default: Optional[Product]
 
 
 class MultiObjectiveKnapsackOptimizer:
@@ -19,8 +46,19 @@ class MultiObjectiveKnapsackOptimizer:
     Optimizador de listas de compras con restricción de presupuesto real
     """
 
+    # Unidades enteras por unidad de precio para la DP (CLP no tiene centavos)
+    PRICE_SCALE = 1
+    # Valor de cada prioridad (1 = esencial vale 5, 5 = opcional vale 1), indexado por prioridad
+    PRIORITY_VALUE = (0, 5, 4, 3, 2, 1)
+    # Máximo de celdas n·C para usar knapsack 0-1 exacto; sobre eso, greedy
+    DP_MAX_CELLS = 2_000_000
+
     def __init__(self, sustainability_scorer: Optional[SustainabilityScorer] = None):
         self.scorer = sustainability_scorer or SustainabilityScorer()
+        # Scores calculados durante la optimización en curso (por product.id)
+        self._score_cache: Dict[str, SustainabilityScore] = {}
+        # Índices columnares por categoría (por nombre de categoría)
+        self._category_index: Dict[str, _CategoryIndex] = {}
 
     def optimize(
         self,
@@ -32,7 +70,10 @@ class MultiObjectiveKnapsackOptimizer:
         """
         items = shopping_list.items
         budget = shopping_list.budget or float('inf')
+        has_budget = budget < float('inf')
         optimize_for = shopping_list.optimize_for
+        self._score_cache = {}
+        self._category_index = {}
 
         # Fase 1: Encontrar candidatos para cada item
         item_candidates: List[Tuple[ShoppingListItem, List[Product]]] = []
@@ -64,21 +105,29 @@ class MultiObjectiveKnapsackOptimizer:
             result.items_not_found = items_not_found
             return result
 
+        # Los objetivos distintos de precio puntúan todos los candidatos: calcularlos en lote
+        if optimize_for != "price":
+            self._prefetch_scores(item_candidates)
+
         # Fase 2: Seleccionar mejor variante para cada item
         selections = []
-        for item, candidates in item_candidates:
-            best_product = self._select_best_product(item, candidates, optimize_for)
-            default_product = self._get_default_product(candidates)  # Para calcular ahorro
-            selections.append((item, candidates, best_product, default_product))
+        cheapest_products = []  # Variante más barata por item, reutilizada en Fase 3
+        original_cost = 0  # Costo de las mejores variantes, acumulado al seleccionarlas
+        choices = self._select_products(item_candidates, optimize_for)
+        for (item, candidates), (best_product, cheapest, default_product) in zip(item_candidates, choices):
+            # default_product (el más caro) sirve para calcular ahorro
+            selections.append(Selection(item, candidates, best_product, default_product))
+            cheapest_products.append(cheapest)
+            original_cost += best_product.price * item.quantity
 
         # Fase 3: Ajustar al presupuesto (excluir items de baja prioridad)
         original_count = len(selections)
-        if budget < float('inf'):
-            selections = self._fit_to_budget(selections, budget)
+        if has_budget and original_cost > budget:
+            selections = self._fit_to_budget(selections, budget, cheapest_products, original_cost)
 
         # Detectar items excluidos por presupuesto
         if len(selections) < original_count:
-            included_names = {s[0].product_name for s in selections}
+            included_names = {s.item.product_name for s in selections}
             for item, candidates in item_candidates:
                 if item.product_name not in included_names:
                     warnings.append(f"'{item.product_name}' excluido por límite de presupuesto")
@@ -107,234 +156,330 @@ class MultiObjectiveKnapsackOptimizer:
         self, item: ShoppingListItem, available_products: Dict[str, List[Product]]
     ) -> List[Product]:
         """Encuentra productos candidatos que coincidan con el item"""
-        exact_matches = []
-        partial_matches = []
-        category_matches = []
         search_name = (item.product_name or "").lower().strip()
-        search_words = search_name.split()
+        # Preferencias repetidas cuentan cada vez, como en la lista original
+        preferences = Counter(pref.lower() for pref in item.preferences) if item.preferences else None
 
-        category_products = available_products.get(item.category, [])
+        index = self._get_category_index(item.category, available_products)
+        products = index.products
+        names_lc = index.names_lc
 
-        for product in category_products:
-            # Filtrar por precio máximo
-            if item.max_price and product.price > item.max_price:
-                continue
+        # Filtrar por precio máximo sobre la columna de precios
+        if item.max_price:
+            positions = np.flatnonzero(index.prices <= item.max_price).tolist()
+        else:
+            positions = range(len(products))
 
-            # Filtrar por preferencias
-            if item.preferences and not self._matches_preferences(product, item.preferences):
-                continue
+        # Filtrar por preferencias en una pasada previa, fuera del loop de nombres
+        if preferences:
+            label_sets = index.label_sets
+            positions = [i for i in positions if self._matches_preferences(label_sets[i], preferences)]
 
-            product_name_lower = product.name.lower()
+        # Si no hay nombre de búsqueda, incluir todos de la categoría
+        if not search_name:
+            return [products[i] for i in positions]
 
-            if search_name:
-                # Match exacto o casi exacto
-                if search_name == product_name_lower or search_name in product_name_lower:
-                    exact_matches.append(product)
-                # Match parcial - al menos la primera palabra coincide
-                elif search_words and search_words[0] in product_name_lower:
-                    partial_matches.append(product)
-                # Guardar todos los productos de la categoría como posibles alternativas
-                else:
-                    category_matches.append(product)
+        allowed = positions if isinstance(positions, range) else set(positions)
+        first_word = search_name.split()[0]
+        # Todo match (exacto o parcial) contiene la primera palabra: recorrer solo esos
+        word_hits = self._word_positions(index, first_word)
+        exact_matches = []
+        partial_matches = []
+
+        for i in word_hits:
+            if i not in allowed:
+                continue
+            product_name_lower = names_lc[i]
+            # Match exacto o casi exacto
+            if search_name in product_name_lower:
+                exact_matches.append(products[i])
+            # Match parcial - al menos la primera palabra coincide
             else:
-                # Si no hay nombre de búsqueda, incluir todos de la categoría
-                partial_matches.append(product)
+                partial_matches.append(products[i])
 
-        # Siempre incluir productos similares de la categoría como alternativas
+        # Si hay match exacto, agregar también los parciales como alternativas
         if exact_matches:
-            # Si hay match exacto, agregar también los parciales y algunos de la categoría
-            # para tener alternativas disponibles
-            all_candidates = exact_matches + partial_matches
-            # Agregar productos de la misma categoría que coincidan con la primera palabra
-            if search_words:
-                for product in category_matches:
-                    if search_words[0] in product.name.lower():
-                        all_candidates.append(product)
-            return all_candidates if all_candidates else exact_matches
+            return exact_matches + partial_matches
         elif partial_matches:
             return partial_matches
         else:
             # Como fallback, buscar la primera palabra en todos los productos
-            if search_words:
-                for product in category_products:
-                    if search_words[0] in product.name.lower():
-                        partial_matches.append(product)
-            return partial_matches
+            return [products[i] for i in word_hits]
 
-    def _matches_preferences(self, product: Product, preferences: List[str]) -> bool:
-        """Verifica si un producto cumple con las preferencias"""
+    def _word_positions(self, index: _CategoryIndex, word: str) -> List[int]:
+        """
+        Posiciones (en orden de catálogo) cuyo nombre contiene `word`.
+        Como `word` no tiene espacios, solo puede aparecer dentro de un token del
+        nombre, así que basta con revisar el vocabulario del índice invertido.
+        """
+        hits = set()
+        for token, posting in index.token_index.items():
+            if word in token:
+                hits.update(posting)
+        return sorted(hits)
+
+    def _get_category_index(
+        self, category: str, available_products: Dict[str, List[Product]]
+    ) -> _CategoryIndex:
+        """Índice columnar de una categoría, construido una vez por optimización"""
+        index = self._category_index.get(category)
+        if index is None:
+            products = available_products.get(category, [])
+            names_lc = [p.name.lower() for p in products]
+            token_index: Dict[str, List[int]] = {}
+            for i, name in enumerate(names_lc):
+                for token in set(name.split()):
+                    token_index.setdefault(token, []).append(i)
+            index = _CategoryIndex(
+                products=products,
+                prices=np.fromiter((p.price for p in products), dtype=np.float64, count=len(products)),
+                names_lc=names_lc,
+                label_sets=[label_profile(p.labels).lower for p in products],
+                token_index=token_index,
+            )
+            self._category_index[category] = index
+        return index
+
+    def _score(self, product: Product) -> SustainabilityScore:
+        """Score de sostenibilidad memoizado durante la optimización en curso"""
+        score = self._score_cache.get(product.id)
+        if score is None:
+            score = self.scorer.calculate_score(product)
+            self._score_cache[product.id] = score
+        return score
+
+    def _prefetch_scores(self, item_candidates: List[Tuple[ShoppingListItem, List[Product]]]) -> None:
+        """Llena la cache de scores con un solo cálculo vectorizado de los candidatos"""
+        pending: Dict[str, Product] = {}
+        for _, candidates in item_candidates:
+            for product in candidates:
+                if product.id not in self._score_cache:
+                    pending.setdefault(product.id, product)
+        if pending:
+            scores = self.scorer.calculate_scores_batch(list(pending.values()))
+            self._score_cache.update(zip(pending.keys(), scores))
+
+    def _matches_preferences(self, product_labels: FrozenSet[str], preferences: Counter) -> bool:
+        """Verifica si las labels de un producto cumplen con las preferencias (en minúsculas, con repeticiones)"""
         if not preferences:
             return True
-        product_labels = [label.lower() for label in (product.labels or [])]
-        matches = sum(1 for pref in preferences if pref.lower() in product_labels)
-        return matches >= len(preferences) * 0.5
-
-    def _select_best_product(
-        self, item: ShoppingListItem, candidates: List[Product], optimize_for: str
-    ) -> Product:
-        """Selecciona el mejor producto según el objetivo de optimización"""
-        if not candidates:
-            return None
+        matches = sum(count for pref, count in preferences.items() if pref in product_labels)
+        return matches >= preferences.total() * 0.5
 
-        # Si el usuario escribió un nombre de producto específico (largo), priorizarlo
-        search_name = (item.product_name or "").lower().strip()
-        if len(search_name) > 15:  # Nombre específico de producto
-            for candidate in candidates:
-                if search_name in candidate.name.lower() or candidate.name.lower() in search_name:
-                    return candidate
-
-        if optimize_for == "price":
-            # Menor precio
-            return min(candidates, key=lambda p: p.price)
-
-        elif optimize_for == "sustainability":
-            # Mayor score de sostenibilidad
-            return max(candidates, key=lambda p: self.scorer.calculate_score(p).overall_score)
-
-        elif optimize_for == "health":
-            # Mayor score de salud
-            return max(candidates, key=lambda p: self.scorer.calculate_score(p).health_score)
-
-        else:  # balanced
-            # Score combinado: precio + sostenibilidad
-            def balanced_score(p):
-                sus = self.scorer.calculate_score(p)
-                # Normalizar precio (inverso, menor es mejor)
-                max_price = max(c.price for c in candidates)
-                min_price = min(c.price for c in candidates)
-                if max_price == min_price:
-                    price_score = 100
-                else:
-                    price_score = 100 * (1 - (p.price - min_price) / (max_price - min_price))
-                # Combinar 40% precio + 40% sostenibilidad + 20% salud
-                return 0.4 * price_score + 0.4 * sus.overall_score + 0.2 * sus.health_score
+    def _select_products(
+        self, item_candidates: List[Tuple[ShoppingListItem, List[Product]]], optimize_for: str
+    ) -> List[Tuple[Product, Product, Product]]:
+        """
+        Selecciona (mejor, más barato, más caro) para cada item en una sola llamada
+        al kernel, con los candidatos de todos los items aplanados en columnas.
+        """
+        flat: List[Product] = []
+        offsets = [0]
+        forced = []
+        for item, candidates in item_candidates:
+            preferred = self._preferred_candidate(item, candidates)
+            forced.append(len(flat) + preferred if preferred >= 0 else -1)
+            flat.extend(candidates)
+            offsets.append(len(flat))
+
+        n = len(flat)
+        mode = OPTIMIZE_MODES.get(optimize_for, MODE_BALANCED)
+        prices = np.fromiter((p.price for p in flat), dtype=np.float64, count=n)
+        if mode == MODE_PRICE:
+            # En modo precio no se necesitan scores
+            overall_scores = health_scores = np.zeros(n)
+        else:
+            scores = [self._score(p) for p in flat]
+            overall_scores = np.fromiter((s.overall_score for s in scores), dtype=np.float64, count=n)
+            health_scores = np.fromiter((s.health_score for s in scores), dtype=np.float64, count=n)
 
-            return max(candidates, key=balanced_score)
+        best, cheapest, priciest = select_candidates(
+            prices, overall_scores, health_scores,
+            np.asarray(offsets, dtype=np.int64), np.asarray(forced, dtype=np.int64), mode
+        )
+        return [
+            (flat[b], flat[c], flat[d])
+            for b, c, d in zip(best.tolist(), cheapest.tolist(), priciest.tolist())
+        ]
 
-    def _get_default_product(self, candidates: List[Product]) -> Product:
-        """Obtiene el producto por defecto (más caro) para calcular ahorro real"""
-        if not candidates:
-            return None
-        # Usar el más caro como referencia para mostrar ahorro real
-        return max(candidates, key=lambda p: p.price)
+    def _preferred_candidate(self, item: ShoppingListItem, candidates: List[Product]) -> int:
+        """
+        Si el usuario escribió un nombre de producto específico (largo), posición
+        del primer candidato que coincide; -1 si no aplica
+        """
+        search_name = (item.product_name or "").lower().strip()
+        if len(search_name) > 15:  # Nombre específico de producto
+            for i, candidate in enumerate(candidates):
+                name = candidate.name.lower()
+                if search_name in name or name in search_name:
+                    return i
+        return -1
 
     def _fit_to_budget(
         self,
-        selections: List[Tuple[ShoppingListItem, List[Product], Product, Product]],
-        budget: float
-    ) -> List[Tuple[ShoppingListItem, List[Product], Product, Product]]:
+        selections: List[Selection],
+        budget: float,
+        cheapest_products: List[Optional[Product]],
+        original_cost: float
+    ) -> List[Selection]:
         """
-        Ajusta la selección al presupuesto usando algoritmo greedy.
-        Primero intenta variantes más baratas, luego excluye items.
+        Ajusta la selección al presupuesto.
+        `cheapest_products` es la variante más barata de cada selección (None sin candidatos)
+        y `original_cost` el costo ya acumulado de `selections`.
+        Primero intenta variantes más baratas, luego excluye items (DP exacta o greedy).
         """
         # Paso 1: Verificar si las selecciones originales caben en el presupuesto
-        original_cost = sum(sel[2].price * sel[0].quantity for sel in selections if sel[2])
         if original_cost <= budget:
             return selections
 
         # Paso 2: Crear versión con variantes más baratas
-        cheap_selections = []
-        for item, candidates, best, default in selections:
-            if candidates:
-                cheapest = min(candidates, key=lambda p: p.price)
-                cheap_selections.append((item, candidates, cheapest, default))
-            else:
-                cheap_selections.append((item, candidates, best, default))
-
-        # Verificar si las variantes baratas caben
-        cheap_cost = sum(sel[2].price * sel[0].quantity for sel in cheap_selections if sel[2])
-        if cheap_cost <= budget:
-            # Cabe todo con variantes baratas, intentar mejorar con presupuesto restante
-            return self._upgrade_selections(cheap_selections, budget, selections)
-
-        # Paso 3: No cabe todo, usar knapsack greedy para seleccionar items
-        # Ordenar por eficiencia: prioridad / costo
-        def efficiency_ratio(sel):
-            item, _, product, _ = sel
-            if not product:
-                return 0
-            cost = product.price * item.quantity
-            if cost == 0:
-                return float('inf')
+        if all(cheapest is None or cheapest is sel.selected for sel, cheapest in zip(selections, cheapest_products)):
+            # Ya son las más baratas (p. ej. modo precio): su costo ya excede el presupuesto
+            cheap_selections = selections
+        else:
+            cheap_selections = [
+                Selection(sel.item, sel.candidates, cheapest if cheapest is not None else sel.selected, sel.default)
+                for sel, cheapest in zip(selections, cheapest_products)
+            ]
+
+            # Verificar si las variantes baratas caben
+            cheap_cost = sum(sel.selected.price * sel.item.quantity for sel in cheap_selections if sel.selected)
+            if cheap_cost <= budget:
+                # Cabe todo con variantes baratas, intentar mejorar con presupuesto restante
+                return self._upgrade_selections(cheap_selections, budget, selections, cheap_cost)
+
+        # Paso 3: No cabe todo. Con pocos items/presupuesto, knapsack 0-1 exacto
+        included = self._knapsack_dp(cheap_selections, budget)
+        if included is not None:
+            current_cost = sum(sel.selected.price * sel.item.quantity for sel in included)
+            return self._upgrade_selections(included, budget, selections, current_cost)
+
+        # Si la tabla DP es demasiado grande, usar knapsack greedy
+        # Precalcular (eficiencia, costo) una sola vez por selección: prioridad / costo
+        priority_value = self.PRIORITY_VALUE
+        # (las selecciones sin producto nunca se incluyen)
+        decorated = []
+        for sel in cheap_selections:
+            if not sel.selected:
+                continue
+            cost = sel.selected.price * sel.item.quantity
             # Mayor prioridad (menor número) = más valor
-            value = 6 - item.priority  # Convertir 1-5 a 5-1
-            return value / cost
+            ratio = priority_value[sel.item.priority] / cost if cost else float('inf')
+            decorated.append((ratio, cost, sel))
 
-        sorted_by_efficiency = sorted(cheap_selections, key=efficiency_ratio, reverse=True)
+        # Orden estable por la clave precalculada (decorate-sort-undecorate)
+        decorated.sort(key=lambda entry: entry[0], reverse=True)
 
-        # Incluir items hasta llenar presupuesto
+        # Columnas de costos en orden de eficiencia, y el costo mínimo que queda desde cada posición
+        costs = np.fromiter((entry[1] for entry in decorated), dtype=np.float64, count=len(decorated))
+        min_remaining = np.minimum.accumulate(costs[::-1])[::-1].tolist()
+        costs = costs.tolist()
+
+        # Incluir items hasta llenar presupuesto (saltando los que no caben)
         included = []
         current_cost = 0
 
-        for sel in sorted_by_efficiency:
-            item, candidates, product, default = sel
-            if product:
-                item_cost = product.price * item.quantity
-                if current_cost + item_cost <= budget:
-                    current_cost += item_cost
-                    included.append(sel)
+        for k, item_cost in enumerate(costs):
+            if current_cost + min_remaining[k] > budget:
+                break  # Ni el item más barato restante cabe
+            if current_cost + item_cost <= budget:
+                current_cost += item_cost
+                included.append(decorated[k][2])
 
         # Intentar mejorar las selecciones incluidas
-        return self._upgrade_selections(included, budget, selections)
+        return self._upgrade_selections(included, budget, selections, current_cost)
+
+    def _knapsack_dp(
+        self,
+        selections: List[Selection],
+        budget: float
+    ) -> Optional[List[Selection]]:
+        """
+        Knapsack 0-1 exacto por programación dinámica O(n·C).
+        Valor = peso de prioridad (1-5 -> 5-1) × cantidad; peso = costo escalado a enteros.
+        Retorna None si n·C supera DP_MAX_CELLS.
+        """
+        candidates = [sel for sel in selections if sel.selected]
+        capacity = int(math.floor(budget * self.PRICE_SCALE))
+        n = len(candidates)
+        if n == 0 or capacity < 0:
+            return []
+        if n * (capacity + 1) > self.DP_MAX_CELLS:
+            return None
+
+        priority_value = self.PRIORITY_VALUE
+        # La cantidad puede ser fraccionaria (p. ej. 0.5 kg): valores en float
+        values = np.fromiter(
+            (priority_value[sel.item.priority] * sel.item.quantity for sel in candidates),
+            dtype=np.float64, count=n
+        )
+        # Redondear hacia arriba para que la selección nunca exceda el presupuesto real
+        weights = np.fromiter(
+            (math.ceil(round(sel.selected.price * sel.item.quantity * self.PRICE_SCALE, 6))
+             for sel in candidates),
+            dtype=np.int64, count=n
+        )
+
+        selected = knapsack_dp(weights, values, capacity)
+        return [sel for sel, keep in zip(candidates, selected) if keep]
 
     def _upgrade_selections(
         self,
-        cheap_selections: List[Tuple[ShoppingListItem, List[Product], Product, Product]],
+        cheap_selections: List[Selection],
         budget: float,
-        original_selections: List[Tuple[ShoppingListItem, List[Product], Product, Product]]
-    ) -> List[Tuple[ShoppingListItem, List[Product], Product, Product]]:
+        original_selections: List[Selection],
+        current_cost: float
+    ) -> List[Selection]:
         """
         Intenta mejorar las selecciones baratas usando el presupuesto restante.
         Reemplaza variantes baratas por las óptimas originales cuando sea posible.
+        `current_cost` es el costo ya acumulado de `cheap_selections`.
         """
         # Crear mapa de selecciones originales por nombre de producto
-        original_map = {}
-        for item, candidates, best, default in original_selections:
-            original_map[item.product_name] = (item, candidates, best, default)
+        original_map = {sel.item.product_name: sel for sel in original_selections}
 
-        # Calcular costo actual
-        current_cost = sum(sel[2].price * sel[0].quantity for sel in cheap_selections if sel[2])
         remaining_budget = budget - current_cost
 
         # Intentar upgrades ordenados por prioridad
         upgraded = []
-        for item, candidates, cheap_product, default in sorted(cheap_selections, key=lambda s: s[0].priority):
-            original = original_map.get(item.product_name)
-            if original and original[2] and cheap_product:
-                best_product = original[2]
-                upgrade_cost = (best_product.price - cheap_product.price) * item.quantity
+        for sel in sorted(cheap_selections, key=lambda s: s.item.priority):
+            original = original_map.get(sel.item.product_name)
+            cheap_product = sel.selected
+            if original and original.selected and cheap_product:
+                best_product = original.selected
+                upgrade_cost = (best_product.price - cheap_product.price) * sel.item.quantity
 
                 if upgrade_cost <= remaining_budget and upgrade_cost > 0:
                     # Upgrade a la variante óptima
-                    upgraded.append((item, candidates, best_product, default))
+                    upgraded.append(Selection(sel.item, sel.candidates, best_product, sel.default))
                     remaining_budget -= upgrade_cost
                 else:
                     # Mantener variante barata
-                    upgraded.append((item, candidates, cheap_product, default))
+                    upgraded.append(sel)
             else:
-                upgraded.append((item, candidates, cheap_product, default))
+                upgraded.append(sel)
 
         return upgraded
 
     def _optimize_essentials_for_budget(
         self,
-        essential_selections: List[Tuple[ShoppingListItem, List[Product], Product, Product]],
+        essential_selections: List[Selection],
         budget: float
-    ) -> List[Tuple[ShoppingListItem, List[Product], Product, Product]]:
+    ) -> List[Selection]:
         """
         Si los esenciales exceden el presupuesto, elegir las variantes más baratas
         """
         optimized = []
-        for item, candidates, best, default in essential_selections:
+        for sel in essential_selections:
             # Elegir el más barato
-            cheapest = min(candidates, key=lambda p: p.price) if candidates else best
-            optimized.append((item, candidates, cheapest, default))
+            cheapest = min(sel.candidates, key=lambda p: p.price) if sel.candidates else sel.selected
+            optimized.append(Selection(sel.item, sel.candidates, cheapest, sel.default))
         return optimized
 
     def _build_result(
         self,
         shopping_list: ShoppingList,
-        selections: List[Tuple[ShoppingListItem, List[Product], Product, Product]],
+        selections: List[Selection],
         budget: float
     ) -> OptimizedShoppingList:
         """Construye el resultado de la optimización"""
@@ -344,14 +489,22 @@ class MultiObjectiveKnapsackOptimizer:
         total_carbon = 0
         total_water = 0
         recyclable_count = 0
-        sustainability_scores = []
+        # Sumas acumuladas para el promedio de sostenibilidad
+        economic_sum = environmental_sum = social_sum = health_sum = overall_sum = 0
+        score_count = 0
 
-        for item, candidates, selected, default in selections:
+        for sel in selections:
+            item, candidates, selected, default = sel.item, sel.candidates, sel.selected, sel.default
             if not selected:
                 continue
 
-            sus_score = self.scorer.calculate_score(selected)
-            sustainability_scores.append(sus_score)
+            sus_score = self._score(selected)
+            economic_sum += sus_score.economic_score
+            environmental_sum += sus_score.environmental_score
+            social_sum += sus_score.social_score
+            health_sum += sus_score.health_score
+            overall_sum += sus_score.overall_score
+            score_count += 1
 
             # Calcular ahorro real (comparado con el producto por defecto)
             default_price = default.price if default else selected.price
@@ -360,8 +513,14 @@ class MultiObjectiveKnapsackOptimizer:
             # Costo sin optimización (producto por defecto)
             total_cost_without_optimization += default_price * item.quantity
 
-            # Alternativas (otros productos disponibles)
-            alternatives = [c for c in candidates[:4] if c.id != selected.id]
+            # Alternativas (hasta 3 otros productos disponibles, en una pasada)
+            alternatives = []
+            selected_id = selected.id
+            for candidate in candidates:
+                if candidate.id != selected_id:
+                    alternatives.append(candidate)
+                    if len(alternatives) == 3:
+                        break
 
             # Razón de selección
             reason = self._generate_reason(selected, sus_score, shopping_list.optimize_for)
@@ -370,9 +529,9 @@ class MultiObjectiveKnapsackOptimizer:
                 OptimizedProduct(
                     original_item=item,
                     selected_product=selected,
-                    alternatives=alternatives[:3],
+                    alternatives=alternatives,
                     reason=reason,
-                    savings=round(savings, 2),
+                    savings=savings,
                     sustainability_impact=self._get_impact_level(sus_score.environmental_score),
                 )
             )
@@ -387,13 +546,13 @@ class MultiObjectiveKnapsackOptimizer:
                 recyclable_count += 1
 
         # Calcular sostenibilidad promedio
-        if sustainability_scores:
+        if score_count:
             overall_sustainability = SustainabilityScore(
-                economic_score=sum(s.economic_score for s in sustainability_scores) / len(sustainability_scores),
-                environmental_score=sum(s.environmental_score for s in sustainability_scores) / len(sustainability_scores),
-                social_score=sum(s.social_score for s in sustainability_scores) / len(sustainability_scores),
-                health_score=sum(s.health_score for s in sustainability_scores) / len(sustainability_scores),
-                overall_score=sum(s.overall_score for s in sustainability_scores) / len(sustainability_scores),
+                economic_score=economic_sum / score_count,
+                environmental_score=environmental_sum / score_count,
+                social_score=social_sum / score_count,
+                health_score=health_sum / score_count,
+                overall_score=overall_sum / score_count,
             )
         else:
             overall_sustainability = SustainabilityScore(
@@ -403,15 +562,15 @@ class MultiObjectiveKnapsackOptimizer:
         # Ahorro total real
         total_savings = max(0, total_cost_without_optimization - total_cost)
 
-        # Presupuesto usado
-        budget_used = (total_cost / budget * 100) if budget < float('inf') else 0
+        # Presupuesto usado (sin presupuesto no hay restricción que medir)
+        has_budget = budget < float('inf')
+        budget_used = (total_cost / budget * 100) if has_budget else 0
 
         # Tiendas recomendadas
-        store_counts = {}
-        for opt_item in optimized_items:
-            store = opt_item.selected_product.store or "Tienda General"
-            store_counts[store] = store_counts.get(store, 0) + 1
-        recommended_stores = sorted(store_counts.keys(), key=lambda s: store_counts[s], reverse=True)
+        store_counts = Counter(
+            opt_item.selected_product.store or "Tienda General" for opt_item in optimized_items
+        )
+        recommended_stores = [store for store, _ in store_counts.most_common(3)]
 
         # Calcular oportunidades de ahorro
         savings_opportunities = self._calculate_savings_opportunities(
@@ -421,28 +580,26 @@ class MultiObjectiveKnapsackOptimizer:
         return OptimizedShoppingList(
             original_list=shopping_list,
             optimized_items=optimized_items,
-            total_cost=round(total_cost, 2),
-            estimated_savings=round(total_savings, 2),
-            budget_used_percentage=round(budget_used, 2),
+            total_cost=total_cost,
+            estimated_savings=total_savings,
+            budget_used_percentage=budget_used,
             overall_sustainability=overall_sustainability,
-            total_carbon_footprint=round(total_carbon, 2),
-            total_water_usage=round(total_water, 2),
-            recyclable_percentage=round(
-                (recyclable_count / len(optimized_items) * 100) if optimized_items else 0, 2
-            ),
+            total_carbon_footprint=total_carbon,
+            total_water_usage=total_water,
+            recyclable_percentage=(recyclable_count / len(optimized_items) * 100) if optimized_items else 0,
             optimization_algorithm="Smart Budget Optimizer",
-            constraints_met=total_cost <= budget if budget < float('inf') else True,
+            constraints_met=total_cost <= budget if has_budget else True,
             items_substituted=0,
-            optimization_score=round(overall_sustainability.overall_score, 2),
-            recommended_stores=recommended_stores[:3],
-            estimated_shopping_time=len(recommended_stores) * 15 + len(optimized_items) * 2,
+            optimization_score=overall_sustainability.overall_score,
+            recommended_stores=recommended_stores,
+            estimated_shopping_time=len(store_counts) * 15 + len(optimized_items) * 2,
             savings_opportunities=savings_opportunities,
         )
 
     def _calculate_savings_opportunities(
         self,
         optimized_items: List[OptimizedProduct],
-        selections: List[Tuple[ShoppingListItem, List[Product], Product, Product]],
+        selections: List[Selection],
         optimize_for: str
     ) -> List[SavingsOpportunity]:
         """
@@ -482,17 +639,15 @@ class MultiObjectiveKnapsackOptimizer:
             else:
                 # Si no hay alternativa más barata, buscar mejor sostenibilidad
                 if optimize_for == "price":
+                    sel_overall = self._score(selected).overall_score
                     more_sustainable = [
                         alt for alt in alternatives
-                        if self.scorer.calculate_score(alt).overall_score >
-                           self.scorer.calculate_score(selected).overall_score
+                        if self._score(alt).overall_score > sel_overall
                     ]
                     if more_sustainable:
                         best_alt = max(more_sustainable,
-                                      key=lambda p: self.scorer.calculate_score(p).overall_score)
-                        alt_score = self.scorer.calculate_score(best_alt)
-                        sel_score = self.scorer.calculate_score(selected)
-                        improvement = alt_score.overall_score - sel_score.overall_score
+                                      key=lambda p: self._score(p).overall_score)
+                        improvement = self._score(best_alt).overall_score - sel_overall
 
                         opportunities.append(SavingsOpportunity(
                             current_product=selected,
@@ -9,11 +9,31 @@ Encuentra sustitutos óptimos para productos basándose en:
 Implementación: Algoritmo de scoring multi-dimensional con similarity matching
 """
 
+from collections import defaultdict
+import heapq
+from operator import attrgetter
 from typing import List, Tuple, Optional, Dict
 import math
+
+import numpy as np
+
 from ..models.product import Product
 from ..models.recommendation import SubstitutionSuggestion
-from .sustainability_scorer import SustainabilityScorer
+from .sustainability_scorer import SustainabilityScorer, label_profile
+from ._substitution_kernel import candidate_similarity, substitution_scores
+
+
+# Macronutrientes comparados en la similitud nutricional
+NUTRITION_METRICS = ("energy_kcal", "proteins", "carbohydrates", "fats", "fiber")
+_NUTRITION_VALUES = attrgetter(*NUTRITION_METRICS)
+_NO_NUTRITION = (0.0,) * len(NUTRITION_METRICS)
+
+
+def _nutrition_row(nutrition) -> Tuple[float, ...]:
+    """Macronutrientes como tupla (None -> 0)"""
+    if not nutrition:
+        return _NO_NUTRITION
+    return tuple(value or 0 for value in _NUTRITION_VALUES(nutrition))
 
 
 class IntelligentSubstitutionEngine:
@@ -38,6 +58,19 @@ class IntelligentSubstitutionEngine:
             "balanced": {"price": 0.25, "sustainability": 0.25, "health": 0.25, "similarity": 0.25},
         }
 
+        # Mapeo de categorías similares: categoría -> id de grupo
+        similar_groups = [
+            {"dairy", "milk", "yogurt", "cheese"},
+            {"fruit", "fruits", "fresh_fruit"},
+            {"vegetable", "vegetables", "fresh_vegetables"},
+            {"meat", "poultry", "beef", "chicken"},
+            {"bread", "bakery", "cereals"},
+            {"beverages", "drinks", "juice", "soda"},
+        ]
+        self._category_group: Dict[str, int] = {
+            category: group_id for group_id, group in enumerate(similar_groups) for category in group
+        }
+
     def find_substitutions(
         self,
         original_product: Product,
@@ -63,38 +96,63 @@ class IntelligentSubstitutionEngine:
         # Calcular score del producto original
         original_score = self.scorer.calculate_score(original_product)
 
-        for candidate in candidate_products:
-            # No sugerir el mismo producto
-            if candidate.id == original_product.id:
-                continue
-
-            # Calcular similitud
-            similarity = self._calculate_similarity(original_product, candidate)
-
-            # Filtrar productos muy diferentes
-            if similarity < self.similarity_threshold:
-                continue
-
-            # Calcular score del candidato
-            candidate_score = self.scorer.calculate_score(candidate)
-
-            # Calcular diferencias
-            price_diff = original_product.price - candidate.price
-            price_diff_pct = (price_diff / original_product.price) * 100
+        # No sugerir el mismo producto
+        candidates = [c for c in candidate_products if c.id != original_product.id]
+        if not candidates:
+            return suggestions
+
+        # Calcular similitud de todos los candidatos en columnas (SoA)
+        columns = self._vectorize_catalog(candidates)
+        similarities = self._calculate_similarities(original_product, candidates, columns)
+
+        # Filtrar productos muy diferentes
+        kept = np.flatnonzero(similarities >= self.similarity_threshold)
+        if kept.size == 0:
+            return suggestions
+        kept_candidates = [candidates[i] for i in kept.tolist()]
+        similarity = similarities[kept]
+
+        # Calcular score de los candidatos en lote
+        candidate_scores = self.scorer.calculate_scores_batch(kept_candidates)
+        overall = np.fromiter((cs.overall_score for cs in candidate_scores), dtype=np.float64, count=kept.size)
+        health = np.fromiter((cs.health_score for cs in candidate_scores), dtype=np.float64, count=kept.size)
+
+        # Calcular diferencias
+        price_diff = original_product.price - columns["price"][kept]
+        price_diff_pct = (price_diff / original_product.price) * 100
+        sustainability_improvement = overall - original_score.overall_score
+        health_improvement = health - original_score.health_score
+
+        # Calcular score de sustitución
+        substitution_scores = self._calculate_substitution_score(
+            price_diff_pct=price_diff_pct,
+            sustainability_improvement=sustainability_improvement,
+            health_improvement=health_improvement,
+            similarity=similarity,
+            weights=weights,
+        )
 
-            sustainability_improvement = (
-                candidate_score.overall_score - original_score.overall_score
-            )
-            health_improvement = candidate_score.health_score - original_score.health_score
-
-            # Calcular score de sustitución
-            substitution_score = self._calculate_substitution_score(
-                price_diff_pct=price_diff_pct,
-                sustainability_improvement=sustainability_improvement,
-                health_improvement=health_improvement,
-                similarity=similarity,
-                weights=weights,
-            )
+        # Top-k por score redondeado (mismo orden y desempate que ordenar la lista completa)
+        rounded_scores = [round(score, 2) for score in substitution_scores.tolist()]
+        if max_suggestions >= 0:
+            top = heapq.nlargest(max_suggestions, range(len(rounded_scores)), key=rounded_scores.__getitem__)
+        else:
+            top = sorted(range(len(rounded_scores)), key=rounded_scores.__getitem__, reverse=True)[:max_suggestions]
+
+        # Construir sugerencias solo para los candidatos que sobreviven;
+        # sus métricas pasan a floats de Python de una vez
+        top_metrics = zip(
+            top,
+            similarity[top].tolist(),
+            price_diff[top].tolist(),
+            price_diff_pct[top].tolist(),
+            sustainability_improvement[top].tolist(),
+            health_improvement[top].tolist(),
+            substitution_scores[top].tolist(),
+        )
+        for i, sim, diff, diff_pct, sus_improvement, health_impr, score in top_metrics:
+            candidate = kept_candidates[i]
+            candidate_score = candidate_scores[i]
 
             # Generar razones y trade-offs
             reasons, trade_offs = self._generate_reasons_and_tradeoffs(
@@ -102,26 +160,26 @@ class IntelligentSubstitutionEngine:
                 candidate,
                 original_score,
                 candidate_score,
-                price_diff,
-                price_diff_pct,
+                diff,
+                diff_pct,
             )
 
             # Determinar tipo de sustitución
             substitution_type = self._determine_substitution_type(
-                original_product, candidate, similarity
+                original_product, candidate, sim
             )
 
             # Determinar confianza
-            confidence = self._determine_confidence(similarity, substitution_score)
+            confidence = self._determine_confidence(sim, score)
 
             suggestion = SubstitutionSuggestion(
                 original_product=original_product,
                 suggested_product=candidate,
-                substitution_score=round(substitution_score, 2),
-                price_difference=round(price_diff, 2),
-                price_difference_percentage=round(price_diff_pct, 2),
-                sustainability_improvement=round(sustainability_improvement, 2),
-                health_improvement=round(health_improvement, 2),
+                substitution_score=rounded_scores[i],
+                price_difference=round(diff, 2),
+                price_difference_percentage=round(diff_pct, 2),
+                sustainability_improvement=round(sus_improvement, 2),
+                health_improvement=round(health_impr, 2),
                 reasons=reasons,
                 trade_offs=trade_offs,
                 substitution_type=substitution_type,
@@ -130,136 +188,112 @@ class IntelligentSubstitutionEngine:
 
             suggestions.append(suggestion)
 
-        # Ordenar por score de sustitución
-        suggestions.sort(key=lambda s: s.substitution_score, reverse=True)
+        return suggestions
 
-        return suggestions[:max_suggestions]
+    def _vectorize_catalog(self, products: List[Product]) -> Dict[str, object]:
+        """
+        Extrae los campos usados por la similitud en columnas NumPy (SoA)
+        """
+        n = len(products)
+        # Matriz (n, métricas) construida en una sola llamada
+        nutrition = np.array(
+            [_nutrition_row(p.nutrition) for p in products], dtype=np.float64
+        ).reshape(n, len(NUTRITION_METRICS))
+
+        return {
+            "price": np.fromiter((p.price for p in products), dtype=np.float64, count=n),
+            "category": [p.category for p in products],
+            "brand": [p.brand for p in products],
+            # Labels como bitmask sobre el vocabulario global (0 = sin labels)
+            "label_bits": [label_profile(p.labels).bits for p in products],
+            "has_nutrition": np.fromiter((bool(p.nutrition) for p in products), dtype=bool, count=n),
+            "nutrition": nutrition,
+        }
 
-    def _calculate_similarity(self, product1: Product, product2: Product) -> float:
+    def _calculate_similarities(
+        self, original: Product, candidates: List[Product], columns: Dict[str, object]
+    ) -> np.ndarray:
         """
-        Calcula similitud entre dos productos (0-1)
-        Considera: categoría, ingredientes, labels, valores nutricionales
+        Calcula la similitud (0-1) del producto original con cada candidato
+        Considera: categoría, marca, labels, valores nutricionales y precio
         """
-        similarity_score = 0.0
-        components = 0
-
-        # 1. Categoría exacta (peso alto)
-        if product1.category == product2.category:
-            similarity_score += 0.4
-        elif self._similar_category(product1.category, product2.category):
-            similarity_score += 0.2
-        components += 0.4
-
-        # 2. Similitud de marca
-        if product1.brand and product2.brand:
-            if product1.brand == product2.brand:
-                similarity_score += 0.1
-            components += 0.1
+        n = len(candidates)
+
+        # 1. Categoría exacta (peso alto) o similar, resuelta una vez por categoría
+        # (sin grupo de categorías similares, solo cuenta la coincidencia exacta)
+        group_o = self._category_group.get(original.category.lower())
+        category_weight = {}
+        for category in set(columns["category"]):
+            if category == original.category:
+                category_weight[category] = 0.4
+            elif group_o is not None and self._category_group.get(category.lower()) == group_o:
+                category_weight[category] = 0.2
+            else:
+                category_weight[category] = 0.0
+        category_score = np.fromiter(
+            (category_weight[c] for c in columns["category"]), dtype=np.float64, count=n
+        )
+
+        # 2. Similitud de marca (solo si ambos tienen marca)
+        brands = columns["brand"]
+        brand_mask = np.fromiter((bool(original.brand and b) for b in brands), dtype=bool, count=n)
+        same_brand = np.fromiter((b == original.brand for b in brands), dtype=bool, count=n)
 
         # 3. Labels comunes (orgánico, vegano, etc.)
-        if product1.labels and product2.labels:
-            labels1 = set(label.lower() for label in product1.labels)
-            labels2 = set(label.lower() for label in product2.labels)
-            if labels1 and labels2:
-                label_overlap = len(labels1 & labels2) / len(labels1 | labels2)
-                similarity_score += label_overlap * 0.2
-            components += 0.2
+        label_bits = columns["label_bits"]
+        bits_o = label_profile(original.labels).bits
+        label_mask = np.fromiter((bool(bits_o and bits) for bits in label_bits), dtype=bool, count=n)
+        intersection = np.fromiter(
+            ((bits & bits_o).bit_count() for bits in label_bits), dtype=np.float64, count=n
+        )
+        union = np.fromiter(
+            ((bits | bits_o).bit_count() or 1 for bits in label_bits), dtype=np.float64, count=n
+        )
 
         # 4. Similitud nutricional
-        if product1.nutrition and product2.nutrition:
-            nutrition_similarity = self._calculate_nutrition_similarity(
-                product1.nutrition, product2.nutrition
-            )
-            similarity_score += nutrition_similarity * 0.15
-            components += 0.15
-
-        # 5. Rango de precio similar
-        price_ratio = min(product1.price, product2.price) / max(product1.price, product2.price)
-        if price_ratio >= 0.7:  # Precios dentro del 30% de diferencia
-            similarity_score += 0.15
-        components += 0.15
+        if original.nutrition:
+            nutrition_o = np.array(_nutrition_row(original.nutrition), dtype=np.float64)
+            nutrition_mask = columns["has_nutrition"]
+        else:
+            nutrition_o = np.zeros(len(NUTRITION_METRICS))
+            nutrition_mask = np.zeros(n, dtype=bool)
 
-        # Normalizar
-        return similarity_score / components if components > 0 else 0
+        # 5. Rango de precio similar y normalización, dentro del kernel
+        return candidate_similarity(
+            float(original.price), columns["price"], category_score, brand_mask, same_brand,
+            label_mask, intersection, union, nutrition_mask, nutrition_o, columns["nutrition"],
+        )
 
     def _similar_category(self, cat1: str, cat2: str) -> bool:
         """Verifica si dos categorías son similares"""
-        # Mapeo de categorías similares
-        similar_groups = [
-            {"dairy", "milk", "yogurt", "cheese"},
-            {"fruit", "fruits", "fresh_fruit"},
-            {"vegetable", "vegetables", "fresh_vegetables"},
-            {"meat", "poultry", "beef", "chicken"},
-            {"bread", "bakery", "cereals"},
-            {"beverages", "drinks", "juice", "soda"},
-        ]
-
-        cat1_lower = cat1.lower()
-        cat2_lower = cat2.lower()
-
-        for group in similar_groups:
-            if cat1_lower in group and cat2_lower in group:
-                return True
-
-        return False
-
-    def _calculate_nutrition_similarity(self, nutr1, nutr2) -> float:
-        """Calcula similitud entre perfiles nutricionales"""
-        if not nutr1 or not nutr2:
-            return 0
-
-        # Comparar macronutrientes principales
-        metrics = ["energy_kcal", "proteins", "carbohydrates", "fats", "fiber"]
-        similarities = []
-
-        for metric in metrics:
-            val1 = getattr(nutr1, metric, 0) or 0
-            val2 = getattr(nutr2, metric, 0) or 0
-
-            if val1 == 0 and val2 == 0:
-                continue
-
-            max_val = max(val1, val2)
-            if max_val > 0:
-                similarity = 1 - abs(val1 - val2) / max_val
-                similarities.append(similarity)
-
-        return sum(similarities) / len(similarities) if similarities else 0
+        group = self._category_group.get(cat1.lower())
+        if group is None:
+            return False
+        return self._category_group.get(cat2.lower()) == group
 
     def _calculate_substitution_score(
         self,
-        price_diff_pct: float,
-        sustainability_improvement: float,
-        health_improvement: float,
-        similarity: float,
+        price_diff_pct: np.ndarray,
+        sustainability_improvement: np.ndarray,
+        health_improvement: np.ndarray,
+        similarity: np.ndarray,
         weights: Dict[str, float],
-    ) -> float:
+    ) -> np.ndarray:
         """
-        Calcula score final de sustitución (0-100)
+        Calcula score final de sustitución (0-100) para cada candidato
         """
-        # Normalizar componentes a 0-100
-        # Precio: ahorro positivo = mejor score
-        price_score = min(100, max(0, 50 + price_diff_pct))  # 50 = neutral
-
-        # Sostenibilidad: mejora directa
-        sustainability_score = min(100, max(0, 50 + sustainability_improvement))
-
-        # Salud: mejora directa
-        health_score = min(100, max(0, 50 + health_improvement))
-
-        # Similitud: convertir a score
-        similarity_score = similarity * 100
-
-        # Score ponderado
-        final_score = (
-            weights["price"] * price_score
-            + weights["sustainability"] * sustainability_score
-            + weights["health"] * health_score
-            + weights["similarity"] * similarity_score
+        # Componentes normalizados a 0-100 (50 = neutral) y ponderados en el kernel
+        return substitution_scores(
+            price_diff_pct,
+            sustainability_improvement,
+            health_improvement,
+            similarity,
+            weights["price"],
+            weights["sustainability"],
+            weights["health"],
+            weights["similarity"],
         )
 
-        return final_score
-
     def _generate_reasons_and_tradeoffs(
         self,
         original: Product,
@@ -349,10 +383,22 @@ class IntelligentSubstitutionEngine:
         """
         results = {}
 
+        # Agrupar el catálogo por categoría una sola vez (conserva el orden)
+        catalog_by_category: Dict[str, List[Product]] = defaultdict(list)
+        for p in product_catalog:
+            catalog_by_category[p.category].append(p)
+
+        processed: Dict[str, Product] = {}
         for product in products:
-            # Filtrar candidatos de la misma categoría
+            # Un producto repetido e idéntico produce las mismas sugerencias
+            previous = processed.get(product.id)
+            if previous is not None and (previous is product or previous == product):
+                continue
+            processed[product.id] = product
+
+            # Candidatos de la misma categoría
             candidates = [
-                p for p in product_catalog if p.category == product.category and p.id != product.id
+                p for p in catalog_by_category.get(product.category, ()) if p.id != product.id
             ]
 
             suggestions = self.find_substitutions(product, candidates, focus=focus)
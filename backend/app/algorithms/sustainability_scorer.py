@@ -8,9 +8,62 @@ Calcula puntuaciones de sostenibilidad considerando:
 """
 
 import math
-from typing import Dict, List, Optional
+import threading
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
 from ..models.product import Product, SustainabilityScore, NutritionInfo
 
+# Palabras clave de labels por dimensión
+ECO_LABELS = ("organic", "eco", "sustainable", "recycled")
+SOCIAL_LABELS = ("fair trade", "local", "artisan", "cooperative", "ethical")
+HEALTH_LABELS = ("organic", "whole grain", "low fat", "no sugar", "vegan", "vegetarian")
+
+
+class LabelProfile(NamedTuple):
+    """Labels normalizadas de un producto, calculadas una vez por lista de labels"""
+    lower: FrozenSet[str]
+    bits: int  # bit i = label i del vocabulario global (_LABEL_BITS)
+    eco: int
+    social: int
+    health: int
+
+
+# Vocabulario global de labels en minúsculas -> posición de bit
+_LABEL_BITS: Dict[str, int] = {}
+# Asignar un bit nuevo es leer-y-escribir: los scorers corren en varios hilos
+_LABEL_BITS_LOCK = threading.Lock()
+_EMPTY_PROFILE = LabelProfile(frozenset(), 0, 0, 0, 0)
+
+
+def label_profile(labels: Optional[List[str]]) -> LabelProfile:
+    """Perfil de labels (memoizado por contenido, seguro ante productos modificados)"""
+    if not labels:
+        return _EMPTY_PROFILE
+    return _label_profile(tuple(labels))
+
+
+@lru_cache(maxsize=65536)
+def _label_profile(labels: Tuple[str, ...]) -> LabelProfile:
+    lowered = [label.lower() for label in labels]
+    bits = 0
+    for label in lowered:
+        bit = _LABEL_BITS.get(label)
+        if bit is None:
+            with _LABEL_BITS_LOCK:
+                bit = _LABEL_BITS.setdefault(label, len(_LABEL_BITS))
+        bits |= 1 << bit
+
+    def count(keywords: Tuple[str, ...]) -> int:
+        # Cuenta labels (con repetición) que contienen alguna palabra clave
+        return sum(1 for label in lowered if any(keyword in label for keyword in keywords))
+
+    return LabelProfile(
+        frozenset(lowered), bits, count(ECO_LABELS), count(SOCIAL_LABELS), count(HEALTH_LABELS)
+    )
+
 
 class SustainabilityScorer:
     """
@@ -22,6 +75,7 @@ class SustainabilityScorer:
         self,
         weights: Optional[Dict[str, float]] = None,
         price_reference: float = 5000.0,  # precio de referencia en CLP
+        cache_size: int = 100_000,
     ):
         # Pesos por defecto para cada dimensión (deben sumar 1.0)
         self.weights = weights or {
@@ -36,6 +90,12 @@ class SustainabilityScorer:
         self.carbon_reference = 5.0  # kg CO2 promedio
         self.water_reference = 100.0  # litros promedio
 
+        # Scores ya calculados, por id + campos que afectan el score
+        self.cache_size = cache_size
+        self._score_cache: Dict[Tuple, SustainabilityScore] = {}
+        # El scorer se comparte entre hilos (p. ej. savings-opportunities en paralelo)
+        self._cache_lock = threading.Lock()
+
     def calculate_score(self, product: Product) -> SustainabilityScore:
         """
         Calcula el score de sostenibilidad completo para un producto
@@ -43,11 +103,158 @@ class SustainabilityScorer:
         Returns:
             SustainabilityScore con todas las dimensiones calculadas
         """
-        economic_score = self._calculate_economic_score(product)
-        environmental_score = self._calculate_environmental_score(product)
-        social_score = self._calculate_social_score(product)
-        health_score = self._calculate_health_score(product)
+        key = self._score_key(product)
+        score = self._score_cache.get(key)
+        if score is None:
+            score = self._compute_score(product)
+            self._remember(key, score)
+        return score
+
+    def _remember(self, key: Tuple, score: SustainabilityScore) -> None:
+        """Guarda un score en cache descartando el más antiguo si está llena"""
+        with self._cache_lock:
+            if len(self._score_cache) >= self.cache_size:
+                # Descartar la entrada más antigua
+                del self._score_cache[next(iter(self._score_cache))]
+            self._score_cache[key] = score
+
+    def clear_cache(self) -> None:
+        """Descarta los scores cacheados (p. ej. tras cambiar los pesos)"""
+        self._score_cache.clear()
+
+    def _score_key(self, product: Product) -> Tuple:
+        """
+        Clave de cache: el id más los campos que usa el scoring, para que un
+        producto modificado (p. ej. cambio de precio) no reutilice un score viejo
+        """
+        sus = product.sustainability
+        nutrition = product.nutrition
+        return (
+            product.id,
+            product.price,
+            product.quantity,
+            (
+                sus.carbon_footprint_kg, sus.water_usage_liters,
+                sus.packaging_recyclable, sus.fair_trade, sus.local_product,
+            ) if sus else None,
+            (nutrition.fats, nutrition.salt, nutrition.proteins, nutrition.fiber) if nutrition else None,
+            tuple(product.labels) if product.labels else None,
+            len(product.allergens) if product.allergens else 0,
+        )
+
+    def _compute_score(self, product: Product) -> SustainabilityScore:
+        """Calcula el score sin pasar por la cache"""
+        return self._build_score(product, *self._score_all(product))
+
+    def calculate_scores_batch(self, products: List[Product]) -> List[SustainabilityScore]:
+        """
+        Calcula los scores de varios productos a la vez.
+        Las dimensiones se calculan vectorizadas con NumPy y dan el mismo
+        resultado que `calculate_score` producto a producto.
+        """
+        keys = [self._score_key(p) for p in products]
+        scores: List[Optional[SustainabilityScore]] = [self._score_cache.get(k) for k in keys]
+
+        # Productos sin score en cache (una vez por clave)
+        pending: Dict[Tuple, int] = {}
+        for i, (key, score) in enumerate(zip(keys, scores)):
+            if score is None and key not in pending:
+                pending[key] = i
+        if pending:
+            positions = list(pending.values())
+            computed = self._compute_scores_batch([products[i] for i in positions])
+            by_key = dict(zip(pending.keys(), computed))
+            for key, score in by_key.items():
+                self._remember(key, score)
+            scores = [score if score is not None else by_key[key] for key, score in zip(keys, scores)]
+
+        return scores
+
+    def _compute_scores_batch(self, products: List[Product]) -> List[SustainabilityScore]:
+        """Versión vectorizada de las cuatro dimensiones (mismo orden de operaciones)"""
+        n = len(products)
+
+        def column(values) -> np.ndarray:
+            return np.fromiter(values, dtype=np.float64, count=n)
+
+        # Económico
+        prices = column(p.price for p in products)
+        quantities = column(p.quantity or 0.0 for p in products)
+        price_score = 100 * (1 - np.minimum(prices / (self.price_reference * 2), 1.0))
+        value_score = np.where(quantities > 1, np.minimum(100, 50 + (quantities * 10)), 50.0)
+        economic = (price_score * 0.7) + (value_score * 0.3)
+
+        # Ambiental y social (solo con datos de sostenibilidad)
+        sus = [p.sustainability for p in products]
+        has_sus = np.fromiter((s is not None for s in sus), dtype=bool, count=n)
+        has_carbon = np.fromiter(
+            (s is not None and s.carbon_footprint_kg is not None for s in sus), dtype=bool, count=n
+        )
+        has_water = np.fromiter(
+            (s is not None and s.water_usage_liters is not None for s in sus), dtype=bool, count=n
+        )
+        carbon = column(s.carbon_footprint_kg if s is not None and s.carbon_footprint_kg is not None else 0.0 for s in sus)
+        water = column(s.water_usage_liters if s is not None and s.water_usage_liters is not None else 0.0 for s in sus)
+        recyclable = np.fromiter((bool(s and s.packaging_recyclable) for s in sus), dtype=bool, count=n)
+        fair_trade = np.fromiter((bool(s and s.fair_trade) for s in sus), dtype=bool, count=n)
+        local = np.fromiter((bool(s and s.local_product) for s in sus), dtype=bool, count=n)
+        profiles = [label_profile(p.labels) for p in products]
+        eco_count = column(lp.eco for lp in profiles)
+        social_count = column(lp.social for lp in profiles)
+
+        environmental = np.full(n, 50.0)
+        carbon_score = 100 * (1 - np.minimum(carbon / self.carbon_reference, 1.0))
+        environmental = np.where(has_carbon, environmental + (carbon_score - 50) * 0.4, environmental)
+        water_score = 100 * (1 - np.minimum(water / self.water_reference, 1.0))
+        environmental = np.where(has_water, environmental + (water_score - 50) * 0.3, environmental)
+        environmental = np.where(recyclable, environmental + 15, environmental)
+        environmental = environmental + np.minimum(eco_count * 5, 15)
+        environmental = np.where(has_sus, np.clip(environmental, 0, 100), 50.0)
+
+        social = np.full(n, 50.0)
+        social = np.where(fair_trade, social + 25, social)
+        social = np.where(local, social + 25, social)
+        social = social + np.minimum(social_count * 10, 20)
+        social = np.where(has_sus, np.clip(social, 0, 100), 50.0)
+
+        # Salud (solo con información nutricional)
+        nutrition = [p.nutrition for p in products]
+        has_nutrition = np.fromiter((nut is not None for nut in nutrition), dtype=bool, count=n)
+        fats = column((nut.fats or 0.0) if nut else 0.0 for nut in nutrition)
+        salt = column((nut.salt or 0.0) if nut else 0.0 for nut in nutrition)
+        proteins = column((nut.proteins or 0.0) if nut else 0.0 for nut in nutrition)
+        fiber = column((nut.fiber or 0.0) if nut else 0.0 for nut in nutrition)
+        health_count = column(lp.health for lp in profiles)
+        many_allergens = np.fromiter(
+            (bool(p.allergens) and len(p.allergens) > 3 for p in products), dtype=bool, count=n
+        )
 
+        health = np.full(n, 70.0)
+        health = np.where(fats > 10, health - np.minimum((fats - 10) * 2, 20), health)
+        health = np.where(salt > 1, health - np.minimum((salt - 1) * 15, 25), health)
+        health = np.where(proteins > 5, health + np.minimum(proteins * 2, 15), health)
+        health = np.where(fiber > 3, health + np.minimum(fiber * 3, 15), health)
+        health = health + np.minimum(health_count * 5, 15)
+        health = np.where(many_allergens, health - 10, health)
+        health = np.where(has_nutrition, np.clip(health, 0, 100), 50.0)
+
+        return [
+            self._build_score(product, econ, env, soc, hea)
+            for product, econ, env, soc, hea in zip(
+                products, economic.tolist(), environmental.tolist(), social.tolist(), health.tolist()
+            )
+        ]
+
+    def _build_score(
+        self,
+        product: Product,
+        economic_score: float,
+        environmental_score: float,
+        social_score: float,
+        health_score: float,
+    ) -> SustainabilityScore:
+        """Combina las dimensiones en el SustainabilityScore final"""
+        sustainability = product.sustainability
         # Score general ponderado
         overall_score = (
             economic_score * self.weights["economic"]
@@ -62,35 +269,23 @@ class SustainabilityScorer:
             social_score=round(social_score, 2),
             health_score=round(health_score, 2),
             overall_score=round(overall_score, 2),
-            carbon_footprint_kg=getattr(
-                product.sustainability, "carbon_footprint_kg", None
-            )
-            if product.sustainability
-            else None,
-            water_usage_liters=getattr(
-                product.sustainability, "water_usage_liters", None
-            )
-            if product.sustainability
-            else None,
-            packaging_recyclable=getattr(
-                product.sustainability, "packaging_recyclable", False
-            )
-            if product.sustainability
-            else False,
-            fair_trade=getattr(product.sustainability, "fair_trade", False)
-            if product.sustainability
-            else False,
-            local_product=getattr(product.sustainability, "local_product", False)
-            if product.sustainability
-            else False,
+            carbon_footprint_kg=sustainability.carbon_footprint_kg if sustainability else None,
+            water_usage_liters=sustainability.water_usage_liters if sustainability else None,
+            packaging_recyclable=sustainability.packaging_recyclable if sustainability else False,
+            fair_trade=sustainability.fair_trade if sustainability else False,
+            local_product=sustainability.local_product if sustainability else False,
         )
 
-    def _calculate_economic_score(self, product: Product) -> float:
+    def _score_all(self, product: Product) -> Tuple[float, float, float, float]:
         """
-        Score económico basado en precio y valor por dinero
-        Menor precio = mayor score
+        Calcula las cuatro dimensiones (económica, ambiental, social, salud)
+        en una sola pasada sobre el producto
         """
-        # Normalizar precio (invertido: precio bajo = score alto)
+        sustainability = product.sustainability
+        nutrition = product.nutrition
+        labels = label_profile(product.labels)
+
+        # Económico: precio normalizado (invertido: precio bajo = score alto)
         price_score = 100 * (1 - min(product.price / (self.price_reference * 2), 1.0))
 
         # Ajustar por cantidad (valor por dinero)
@@ -98,129 +293,86 @@ class SustainabilityScorer:
         if product.quantity and product.quantity > 1:
             value_score = min(100, 50 + (product.quantity * 10))
 
-        return (price_score * 0.7) + (value_score * 0.3)
+        economic = (price_score * 0.7) + (value_score * 0.3)
 
-    def _calculate_environmental_score(self, product: Product) -> float:
-        """
-        Score ambiental basado en huella de carbono, agua y packaging
-        """
-        score = 50.0  # Score base neutral
-
-        if not product.sustainability:
-            return score
-
-        # Huella de carbono (menor es mejor)
-        if product.sustainability.carbon_footprint_kg is not None:
-            carbon_ratio = product.sustainability.carbon_footprint_kg / self.carbon_reference
-            carbon_score = 100 * (1 - min(carbon_ratio, 1.0))
-            score += (carbon_score - 50) * 0.4
-
-        # Uso de agua (menor es mejor)
-        if product.sustainability.water_usage_liters is not None:
-            water_ratio = product.sustainability.water_usage_liters / self.water_reference
-            water_score = 100 * (1 - min(water_ratio, 1.0))
-            score += (water_score - 50) * 0.3
-
-        # Packaging reciclable (+20 puntos)
-        if product.sustainability.packaging_recyclable:
-            score += 15
-
-        # Labels ecológicas
-        if product.labels:
-            eco_labels = ["organic", "eco", "sustainable", "recycled"]
-            eco_count = sum(
-                1 for label in product.labels if any(eco in label.lower() for eco in eco_labels)
-            )
-            score += min(eco_count * 5, 15)
+        # Ambiental y social: score base neutral sin datos de sostenibilidad
+        environmental = 50.0
+        social = 50.0
+        if sustainability:
+            # Huella de carbono (menor es mejor)
+            if sustainability.carbon_footprint_kg is not None:
+                carbon_ratio = sustainability.carbon_footprint_kg / self.carbon_reference
+                carbon_score = 100 * (1 - min(carbon_ratio, 1.0))
+                environmental += (carbon_score - 50) * 0.4
 
-        return max(0, min(100, score))
+            # Uso de agua (menor es mejor)
+            if sustainability.water_usage_liters is not None:
+                water_ratio = sustainability.water_usage_liters / self.water_reference
+                water_score = 100 * (1 - min(water_ratio, 1.0))
+                environmental += (water_score - 50) * 0.3
 
-    def _calculate_social_score(self, product: Product) -> float:
-        """
-        Score social basado en comercio justo, producción local, certificaciones
-        """
-        score = 50.0  # Score base neutral
-
-        if not product.sustainability:
-            return score
-
-        # Comercio justo (+25 puntos)
-        if product.sustainability.fair_trade:
-            score += 25
-
-        # Producto local (+25 puntos)
-        if product.sustainability.local_product:
-            score += 25
-
-        # Certificaciones sociales
-        if product.labels:
-            social_labels = ["fair trade", "local", "artisan", "cooperative", "ethical"]
-            social_count = sum(
-                1
-                for label in product.labels
-                if any(social in label.lower() for social in social_labels)
-            )
-            score += min(social_count * 10, 20)
+            # Packaging reciclable (+15 puntos)
+            if sustainability.packaging_recyclable:
+                environmental += 15
 
-        return max(0, min(100, score))
+            # Labels ecológicas
+            environmental += min(labels.eco * 5, 15)
+            environmental = max(0, min(100, environmental))
 
-    def _calculate_health_score(self, product: Product) -> float:
-        """
-        Score de salud basado en información nutricional y aditivos
-        Usa el sistema Nutri-Score simplificado
-        """
-        if not product.nutrition:
-            return 50.0  # Score neutral si no hay info nutricional
+            # Comercio justo y producto local (+25 puntos cada uno)
+            if sustainability.fair_trade:
+                social += 25
+            if sustainability.local_product:
+                social += 25
 
-        score = 70.0  # Score base bueno
+            # Certificaciones sociales
+            social += min(labels.social * 10, 20)
+            social = max(0, min(100, social))
 
-        nutrition = product.nutrition
+        # Salud: Nutri-Score simplificado, neutral sin info nutricional
+        health = 50.0
+        if nutrition:
+            health = 70.0  # Score base bueno
 
-        # Penalizar alto contenido de grasas saturadas, azúcar, sal
-        if nutrition.fats and nutrition.fats > 10:
-            score -= min((nutrition.fats - 10) * 2, 20)
+            # Penalizar alto contenido de grasas saturadas, azúcar, sal
+            if nutrition.fats and nutrition.fats > 10:
+                health -= min((nutrition.fats - 10) * 2, 20)
 
-        if nutrition.salt and nutrition.salt > 1:
-            score -= min((nutrition.salt - 1) * 15, 25)
+            if nutrition.salt and nutrition.salt > 1:
+                health -= min((nutrition.salt - 1) * 15, 25)
 
-        # Bonificar proteínas y fibra
-        if nutrition.proteins and nutrition.proteins > 5:
-            score += min(nutrition.proteins * 2, 15)
+            # Bonificar proteínas y fibra
+            if nutrition.proteins and nutrition.proteins > 5:
+                health += min(nutrition.proteins * 2, 15)
 
-        if nutrition.fiber and nutrition.fiber > 3:
-            score += min(nutrition.fiber * 3, 15)
+            if nutrition.fiber and nutrition.fiber > 3:
+                health += min(nutrition.fiber * 3, 15)
 
-        # Labels saludables
-        if product.labels:
-            health_labels = ["organic", "whole grain", "low fat", "no sugar", "vegan", "vegetarian"]
-            health_count = sum(
-                1
-                for label in product.labels
-                if any(health in label.lower() for health in health_labels)
-            )
-            score += min(health_count * 5, 15)
+            # Labels saludables
+            health += min(labels.health * 5, 15)
+
+            # Penalizar alérgenos múltiples
+            if product.allergens and len(product.allergens) > 3:
+                health -= 10
 
-        # Penalizar alérgenos múltiples
-        if product.allergens and len(product.allergens) > 3:
-            score -= 10
+            health = max(0, min(100, health))
 
-        return max(0, min(100, score))
+        return economic, environmental, social, health
 
     def compare_products(self, product1: Product, product2: Product) -> Dict:
         """
         Compara dos productos en todas las dimensiones de sostenibilidad
         """
-        score1 = self.calculate_score(product1)
-        score2 = self.calculate_score(product2)
+        score1, score2 = self.calculate_scores_batch([product1, product2])
 
         return {
             "product1": {
                 "name": product1.name,
-                "scores": score1.dict(),
+                "scores": score1.model_dump(mode="json"),
             },
             "product2": {
                 "name": product2.name,
-                "scores": score2.dict(),
+                "scores": score2.model_dump(mode="json"),
             },
             "winner": product1.name if score1.overall_score > score2.overall_score else product2.name,
             "score_difference": abs(score1.overall_score - score2.overall_score),
@@ -239,5 +391,27 @@ class SustainabilityScorer:
         Returns:
             Lista de tuplas (Product, SustainabilityScore) ordenada de mejor a peor
         """
-        scored_products = [(p, self.calculate_score(p)) for p in products]
-        return sorted(scored_products, key=lambda x: x[1].overall_score, reverse=True)
+        return self.rank_products_topk(products, len(products))
+
+    def rank_products_topk(
+        self, products: List[Product], k: int
+    ) -> List[tuple[Product, SustainabilityScore]]:
+        """
+        Los k productos con mejor score de sostenibilidad, de mejor a peor
+        (mismo orden que `rank_products`, empates en el orden de entrada)
+        """
+        if not products or k <= 0:
+            return []
+
+        scores = self.calculate_scores_batch(products)
+        overall = np.fromiter((s.overall_score for s in scores), dtype=np.float64, count=len(scores))
+
+        if k < len(products):
+            # Umbral del k-ésimo mejor; se conservan todos los empatados con él
+            kth = -np.partition(-overall, k - 1)[k - 1]
+            candidates = np.flatnonzero(overall >= kth)
+        else:
+            candidates = np.arange(len(products))
+        order = candidates[np.argsort(-overall[candidates], kind="stable")][:k]
+
+        return [(products[i], scores[i]) for i in order.tolist()]
@@ -0,0 +1,103 @@
+"""
+Bulk loading helpers for PostgreSQL
+"""
+
+import io
+import json
+from typing import Any, Dict, List
+
+from sqlalchemy import func, null
+from sqlalchemy.dialects.postgresql import JSONB, insert
+
+from .database import engine
+from .db_models import ProductDB, label_flags
+from .stats_view import refresh_stats_view
+
+# Batches at or above this size are streamed with COPY; smaller ones use a
+# single multi-VALUES INSERT
+COPY_THRESHOLD = 10_000
+
+# Columns loaded in bulk (timestamps are left to the database)
+PRODUCT_COLUMNS = [
+    column.name for column in ProductDB.__table__.columns
+    if column.name not in ("created_at", "updated_at")
+]
+JSON_COLUMNS = {
+    column.name for column in ProductDB.__table__.columns if isinstance(column.type, JSONB)
+}
+
+
+def _format_value_for_copy(value: Any, is_json: bool = False) -> str:
+    """Format a value as a COPY CSV field (unquoted empty field = NULL)"""
+    if value is None:
+        return ""
+    if is_json:
+        value = json.dumps(value, default=str)
+    elif isinstance(value, bool):
+        return "true" if value else "false"
+    elif isinstance(value, (int, float)):
+        return repr(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _products_csv(rows: List[Dict[str, Any]]) -> io.StringIO:
+    """Serialize product rows into an in-memory CSV buffer for COPY"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(
+            _format_value_for_copy(row.get(name), name in JSON_COLUMNS) for name in PRODUCT_COLUMNS
+        ))
+        buffer.write("\n")
+    buffer.seek(0)
+    return buffer
+
+
+def bulk_upsert_products(rows: List[Dict[str, Any]]) -> int:
+    """
+    Insert or update products by id in bulk
+
+    Large batches go through COPY into a temp table followed by
+    INSERT ... SELECT ... ON CONFLICT; smaller ones use one multi-row INSERT.
+    Returns the number of rows processed.
+    """
+    if not rows:
+        return 0
+    rows = [{**row, "label_flags": label_flags(row.get("labels"))} for row in rows]
+
+    columns = ", ".join(PRODUCT_COLUMNS)
+    updates = ", ".join(f"{name} = EXCLUDED.{name}" for name in PRODUCT_COLUMNS if name != "id")
+
+    with engine.begin() as conn:
+        if len(rows) < COPY_THRESHOLD:
+            # None in JSONB columns is stored as SQL NULL (as with COPY), not JSON 'null'
+            values = []
+            for row in rows:
+                value = {name: row.get(name) for name in PRODUCT_COLUMNS}
+                for name in JSON_COLUMNS:
+                    if value[name] is None:
+                        value[name] = null()
+                values.append(value)
+            stmt = insert(ProductDB).values(values)
+            set_ = {name: stmt.excluded[name] for name in PRODUCT_COLUMNS if name != "id"}
+            set_["updated_at"] = func.now()
+            stmt = stmt.on_conflict_do_update(index_elements=[ProductDB.id], set_=set_)
+            conn.execute(stmt)
+        else:
+            conn.exec_driver_sql(
+                "CREATE TEMP TABLE tmp_products (LIKE products INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            cursor = conn.connection.cursor()
+            try:
+                cursor.copy_expert(
+                    f"COPY tmp_products ({columns}) FROM STDIN WITH (FORMAT csv)", _products_csv(rows)
+                )
+            finally:
+                cursor.close()
+            conn.exec_driver_sql(
+                f"INSERT INTO products ({columns}) SELECT {columns} FROM tmp_products "
+                f"ON CONFLICT (id) DO UPDATE SET {updates}, updated_at = now()"
+            )
+
+    # Core statements skip the ORM events that refresh the stats view
+    refresh_stats_view()
+    return len(rows)
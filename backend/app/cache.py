@@ -3,21 +3,78 @@ Redis cache service for caching frequently accessed data
 """
 
 import redis
+import hashlib
+import inspect
 import json
+import logging
 import os
-from typing import Any, Optional
+import time
+from typing import Any, Dict, Iterable, List, Optional
 from functools import wraps
 
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
 # Redis configuration
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
-# Create Redis client
-redis_client = redis.from_url(
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "64"))
+
+# Create Redis client over a bounded connection pool
+# (redis-py uses the hiredis parser automatically when it is installed)
+redis_pool = redis.ConnectionPool.from_url(
     REDIS_URL,
-    decode_responses=True,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    decode_responses=False,  # values are stored as raw bytes
     socket_connect_timeout=5,
     socket_timeout=5,
+    socket_keepalive=True,
+    health_check_interval=30,
 )
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+
+if ORJSON_AVAILABLE:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def _dumps(value: Any) -> bytes:
+        """Serialize a value for storage"""
+        return orjson.dumps(value, default=str, option=_ORJSON_OPTIONS)
+
+    _loads = orjson.loads
+else:
+    def _dumps(value: Any) -> bytes:
+        """Serialize a value for storage"""
+        return json.dumps(value, default=str).encode("utf-8")
+
+    _loads = json.loads
+
+
+def _canonical(value: Any) -> bytes:
+    """Canonical serialization (sorted keys) used for hashing"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(value, default=str, option=_ORJSON_OPTIONS | orjson.OPT_SORT_KEYS)
+    return json.dumps(value, default=str, sort_keys=True).encode("utf-8")
+
+
+def _digest(payload: bytes) -> str:
+    """128-bit hex digest (xxh3 when available, blake2b otherwise)"""
+    if XXHASH_AVAILABLE:
+        return xxhash.xxh3_128_hexdigest(payload)
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
 
 
 class CacheService:
@@ -29,60 +86,158 @@ class CacheService:
     CATEGORY_PREFIX = "category:"
     STATS_PREFIX = "stats:"
     OPTIMIZATION_PREFIX = "optimization:"
+    STORES_PREFIX = "stores:"
+    PLACE_PREFIX = "place:v2:"  # Raw weekday_text; "place:" held resolved hours
+    API_PREFIX = "api:"  # Endpoint responses (see `cached`)
 
     # Default TTL in seconds
     DEFAULT_TTL = 3600  # 1 hour
     SHORT_TTL = 300     # 5 minutes
     LONG_TTL = 86400    # 24 hours
+    STATS_TTL = 60      # 1 minute
+
+    # How long (seconds) a ping result is trusted
+    AVAILABLE_CHECK_TTL = 5.0
+    UNAVAILABLE_CHECK_TTL = 1.0
+
+    # Consecutive failed operations before Redis is skipped for OUTAGE_BACKOFF seconds
+    FAILURE_THRESHOLD = 5
+    OUTAGE_BACKOFF = 30.0
 
     def __init__(self):
         self.client = redis_client
+        self._available = False
+        self._checked_until = 0.0
+        self._consecutive_failures = 0
+        self._suspended_until = 0.0
+
+    def _suspended(self) -> bool:
+        """True while Redis is being skipped after repeated failures"""
+        return time.monotonic() < self._suspended_until
+
+    def _record_failure(self, operation: str, error: Exception) -> None:
+        """Log a failed operation and suspend Redis after too many in a row"""
+        self._consecutive_failures += 1
+        if self._consecutive_failures == 1:
+            logger.warning("Redis %s failed: %s", operation, error)
+        if self._consecutive_failures >= self.FAILURE_THRESHOLD:
+            logger.warning(
+                "Redis failed %d times in a row, skipping it for %.0f s",
+                self._consecutive_failures, self.OUTAGE_BACKOFF,
+            )
+            self._suspended_until = time.monotonic() + self.OUTAGE_BACKOFF
+            self._available = False
+            self._checked_until = self._suspended_until
+            self._consecutive_failures = 0
 
     def is_available(self) -> bool:
-        """Check if Redis is available"""
+        """Check if Redis is available (ping result cached for a few seconds)"""
+        now = time.monotonic()
+        if now < self._checked_until:
+            return self._available
         try:
-            return self.client.ping()
+            self._available = bool(self.client.ping())
         except:
-            return False
+            self._available = False
+        ttl = self.AVAILABLE_CHECK_TTL if self._available else self.UNAVAILABLE_CHECK_TTL
+        self._checked_until = now + ttl
+        return self._available
 
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
+        if self._suspended():
+            return None
         try:
             value = self.client.get(key)
+            self._consecutive_failures = 0
             if value:
-                return json.loads(value)
+                return _loads(value)
             return None
         except Exception as e:
-            print(f"Redis GET error: {e}")
+            self._record_failure("GET", e)
             return None
 
     def set(self, key: str, value: Any, ttl: int = None) -> bool:
         """Set value in cache with optional TTL"""
+        if self._suspended():
+            return False
         try:
             ttl = ttl or self.DEFAULT_TTL
-            serialized = json.dumps(value, default=str)
-            return self.client.setex(key, ttl, serialized)
+            serialized = _dumps(value)
+            result = self.client.setex(key, ttl, serialized)
+            self._consecutive_failures = 0
+            return result
         except Exception as e:
-            print(f"Redis SET error: {e}")
+            self._record_failure("SET", e)
             return False
 
+    def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Get several values in a single round-trip (None for misses)"""
+        if not keys:
+            return []
+        if self._suspended():
+            return [None] * len(keys)
+        try:
+            values = self.client.mget(keys)
+            self._consecutive_failures = 0
+            return [_loads(value) if value else None for value in values]
+        except Exception as e:
+            self._record_failure("MGET", e)
+            return [None] * len(keys)
+
+    def mset(self, mapping: Dict[str, Any], ttl: int = None) -> bool:
+        """Set several values with TTL in a single pipelined round-trip"""
+        if not mapping:
+            return True
+        if self._suspended():
+            return False
+        try:
+            ttl = ttl or self.DEFAULT_TTL
+            with self.client.pipeline(transaction=False) as pipe:
+                for key, value in mapping.items():
+                    pipe.setex(key, ttl, _dumps(value))
+                results = pipe.execute()
+            self._consecutive_failures = 0
+            return all(results)
+        except Exception as e:
+            self._record_failure("MSET", e)
+            return False
+
+    def try_lock(self, key: str, ttl: int) -> bool:
+        """Take a short-lived lock (SET NX EX); True when Redis is unavailable"""
+        if self._suspended():
+            return True
+        try:
+            acquired = self.client.set(key, b"1", nx=True, ex=ttl)
+            self._consecutive_failures = 0
+            return bool(acquired)
+        except Exception as e:
+            self._record_failure("LOCK", e)
+            return True
+
     def delete(self, key: str) -> bool:
         """Delete key from cache"""
+        if self._suspended():
+            return False
         try:
-            return self.client.delete(key) > 0
+            deleted = self.client.delete(key)
+            self._consecutive_failures = 0
+            return deleted > 0
         except Exception as e:
-            print(f"Redis DELETE error: {e}")
+            self._record_failure("DELETE", e)
             return False
 
     def delete_pattern(self, pattern: str) -> int:
         """Delete all keys matching pattern"""
+        if self._suspended():
+            return 0
         try:
             keys = self.client.keys(pattern)
             if keys:
                 return self.client.delete(*keys)
             return 0
         except Exception as e:
-            print(f"Redis DELETE PATTERN error: {e}")
+            self._record_failure("DELETE PATTERN", e)
             return 0
 
     def clear_all(self) -> bool:
@@ -90,9 +245,19 @@ class CacheService:
         try:
             return self.client.flushdb()
         except Exception as e:
-            print(f"Redis FLUSH error: {e}")
+            self._record_failure("FLUSH", e)
             return False
 
+    @staticmethod
+    def hash_key(value: Any) -> str:
+        """Stable content hash for building cache keys, identical across processes"""
+        return _digest(_canonical(value))
+
+    @staticmethod
+    def hash_bytes(payload: bytes) -> str:
+        """Content hash of raw bytes (e.g. a serialized response body)"""
+        return _digest(payload)
+
     # Specific cache methods
 
     def cache_product(self, product_id: str, product_data: dict) -> bool:
@@ -105,6 +270,15 @@ class CacheService:
         key = f"{self.PRODUCT_PREFIX}{product_id}"
         return self.get(key)
 
+    def cache_products(self, products: Dict[str, dict]) -> bool:
+        """Cache several products at once"""
+        mapping = {f"{self.PRODUCT_PREFIX}{pid}": data for pid, data in products.items()}
+        return self.mset(mapping, self.LONG_TTL)
+
+    def get_cached_products(self, product_ids: List[str]) -> List[Optional[dict]]:
+        """Get cached products, aligned with product_ids (None for misses)"""
+        return self.mget([f"{self.PRODUCT_PREFIX}{pid}" for pid in product_ids])
+
     def cache_search_results(self, query_hash: str, results: list) -> bool:
         """Cache search results"""
         key = f"{self.SEARCH_PREFIX}{query_hash}"
@@ -125,16 +299,42 @@ class CacheService:
         key = f"{self.CATEGORY_PREFIX}{category.lower()}"
         return self.get(key)
 
-    def cache_stats(self, stats: dict) -> bool:
-        """Cache API stats"""
+    def cache_stats(self, stats: dict, etag: Optional[str] = None) -> bool:
+        """Cache API stats (and the ETag of their serialized response)"""
         key = f"{self.STATS_PREFIX}general"
-        return self.set(key, stats, self.SHORT_TTL)
+        if etag is None:
+            return self.set(key, stats, self.STATS_TTL)
+        return self.mset({key: stats, f"{key}:etag": etag}, self.STATS_TTL)
 
     def get_cached_stats(self) -> Optional[dict]:
         """Get cached stats"""
         key = f"{self.STATS_PREFIX}general"
         return self.get(key)
 
+    def get_cached_stats_etag(self) -> Optional[str]:
+        """Get the ETag of the cached stats response"""
+        return self.get(f"{self.STATS_PREFIX}general:etag")
+
+    def _stores_key(self, lat: float, lng: float, radius: float) -> str:
+        # Coordinates rounded to ~100 m so nearby users share an entry
+        return f"{self.STORES_PREFIX}{round(lat, 3)}:{round(lng, 3)}:{radius}"
+
+    def cache_nearby_stores(self, lat: float, lng: float, radius: float, stores: list) -> bool:
+        """Cache nearby stores for a location"""
+        return self.set(self._stores_key(lat, lng, radius), stores, self.SHORT_TTL)
+
+    def get_cached_nearby_stores(self, lat: float, lng: float, radius: float) -> Optional[list]:
+        """Get cached nearby stores for a location"""
+        return self.get(self._stores_key(lat, lng, radius))
+
+    def cache_place_details(self, place_id: str, details: dict) -> bool:
+        """Cache place details (phone, full weekday_text)"""
+        return self.set(f"{self.PLACE_PREFIX}{place_id}", details, self.DEFAULT_TTL)
+
+    def get_cached_place_details(self, place_id: str) -> Optional[dict]:
+        """Get cached place details"""
+        return self.get(f"{self.PLACE_PREFIX}{place_id}")
+
     def cache_optimization(self, optimization_hash: str, result: dict) -> bool:
         """Cache optimization results"""
         key = f"{self.OPTIMIZATION_PREFIX}{optimization_hash}"
@@ -154,20 +354,58 @@ class CacheService:
         # Also invalidate related caches
         self.delete_pattern(f"{self.CATEGORY_PREFIX}*")
         self.delete_pattern(f"{self.SEARCH_PREFIX}*")
+        self.delete(f"{self.STATS_PREFIX}general")
+        self.delete(f"{self.STATS_PREFIX}general:etag")
+        self.delete_pattern(f"{self.API_PREFIX}catalog:*")
 
 
 # Helper decorator for caching function results
-def cached(prefix: str, ttl: int = 3600):
-    """Decorator to cache function results"""
+def cached(prefix: str, ttl: int = 3600, exclude: Iterable[str] = ()):
+    """
+    Decorator to cache function results (plain functions and async endpoints)
+
+    Parameters named in `exclude` (e.g. Depends-injected services) are left
+    out of the cache key.
+    """
+    exclude = frozenset(exclude)
+
     def decorator(func):
+        signature = inspect.signature(func)
+
+        def make_key(args, kwargs) -> str:
+            if exclude:
+                bound = signature.bind_partial(*args, **kwargs).arguments
+                args, kwargs = (), {k: v for k, v in bound.items() if k not in exclude}
+            # Create cache key from function name and arguments
+            digest = cache_service.hash_key([func.__module__, func.__qualname__, args, kwargs])
+            return f"{prefix}:{func.__name__}:{digest}"
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                # The Redis client is synchronous: run its calls in the threadpool
+                # so a slow or unreachable Redis does not block the event loop
+                cache = cache_service
+                if not await run_in_threadpool(cache.is_available):
+                    return await func(*args, **kwargs)
+
+                cache_key = make_key(args, kwargs)
+                cached_result = await run_in_threadpool(cache.get, cache_key)
+                if cached_result is not None:
+                    return cached_result
+
+                result = await func(*args, **kwargs)
+                await run_in_threadpool(cache.set, cache_key, result, ttl)
+                return result
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            cache = CacheService()
+            cache = cache_service
             if not cache.is_available():
                 return func(*args, **kwargs)
 
-            # Create cache key from function name and arguments
-            cache_key = f"{prefix}:{func.__name__}:{hash(str(args) + str(kwargs))}"
+            cache_key = make_key(args, kwargs)
 
             # Try to get from cache
             cached_result = cache.get(cache_key)
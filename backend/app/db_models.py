@@ -2,159 +2,211 @@
 SQLAlchemy database models for PostgreSQL
 """
 
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
 from sqlalchemy import (
-    Column, String, Float, Boolean, Integer,
-    DateTime, ForeignKey, JSON, Text, Index
+    String, Float, Boolean, Integer, SmallInteger,
+    DateTime, ForeignKey, JSON, Text, Index, event, select
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 from .database import Base
 
+# Bits of ProductDB.label_flags (labels compared in lowercase)
+LABEL_FLAGS = {
+    "organic": 1,
+    "local": 2,
+    "fair trade": 4,
+}
+ORGANIC_FLAG = LABEL_FLAGS["organic"]
+LOCAL_FLAG = LABEL_FLAGS["local"]
+
+
+def label_flags(labels: Optional[Iterable[str]]) -> int:
+    """Bitmask of the known labels in a product's label list"""
+    flags = 0
+    for label in labels or ():
+        flags |= LABEL_FLAGS.get(label.lower(), 0)
+    return flags
+
 
 class CategoryDB(Base):
     """Category model"""
     __tablename__ = "categories"
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String(100), unique=True, nullable=False, index=True)
-    description = Column(Text, nullable=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(100), unique=True, nullable=False, index=True)
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
 
     # Relationships
-    products = relationship("ProductDB", back_populates="category_rel")
+    products: Mapped[List["ProductDB"]] = relationship(back_populates="category_rel")
 
 
 class StoreDB(Base):
     """Store model"""
     __tablename__ = "stores"
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String(200), nullable=False, index=True)
-    address = Column(String(500), nullable=True)
-    latitude = Column(Float, nullable=True)
-    longitude = Column(Float, nullable=True)
-    phone = Column(String(50), nullable=True)
-    is_organic = Column(Boolean, default=False)
-    is_local = Column(Boolean, default=False)
-    rating = Column(Float, default=0.0)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(200), nullable=False, index=True)
+    address: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    latitude: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    longitude: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    phone: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    is_organic: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    is_local: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    rating: Mapped[Optional[float]] = mapped_column(Float, default=0.0)
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), onupdate=func.now())
 
 
 class ProductDB(Base):
     """Product model for database storage"""
     __tablename__ = "products"
 
-    id = Column(String(50), primary_key=True)
-    barcode = Column(String(50), nullable=True, index=True)
-    name = Column(String(300), nullable=False, index=True)
-    brand = Column(String(200), nullable=True)
-    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
-    category = Column(String(100), nullable=False, index=True)
-    price = Column(Float, nullable=False)
-    unit = Column(String(50), default="unit")
-    quantity = Column(Float, default=1.0)
-    store = Column(String(200), nullable=True)
+    id: Mapped[str] = mapped_column(String(50), primary_key=True)
+    barcode: Mapped[Optional[str]] = mapped_column(String(50), nullable=True, index=True)
+    name: Mapped[str] = mapped_column(String(300), nullable=False, index=True)
+    brand: Mapped[Optional[str]] = mapped_column(String(200), nullable=True)
+    category_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("categories.id"), nullable=True)
+    category: Mapped[str] = mapped_column(String(100), nullable=False, index=True)
+    price: Mapped[float] = mapped_column(Float, nullable=False)
+    unit: Mapped[Optional[str]] = mapped_column(String(50), default="unit")
+    quantity: Mapped[Optional[float]] = mapped_column(Float, default=1.0)
+    store: Mapped[Optional[str]] = mapped_column(String(200), nullable=True)
 
     # Nutritional data as JSON
-    nutrition = Column(JSON, nullable=True)
+    nutrition: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True)
 
     # Sustainability data as JSON
-    sustainability = Column(JSON, nullable=True)
+    sustainability: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True)
 
     # Product details
-    description = Column(Text, nullable=True)
-    ingredients = Column(JSON, nullable=True)  # List of strings
-    allergens = Column(JSON, nullable=True)    # List of strings
-    labels = Column(JSON, nullable=True)       # List of strings
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    ingredients: Mapped[Optional[List[str]]] = mapped_column(JSONB, nullable=True)
+    allergens: Mapped[Optional[List[str]]] = mapped_column(JSONB, nullable=True)
+    labels: Mapped[Optional[List[str]]] = mapped_column(JSONB, nullable=True)
+    # Known labels as bits (LABEL_FLAGS), kept in sync with labels on write
+    label_flags: Mapped[int] = mapped_column(SmallInteger, nullable=False, default=0, server_default="0")
 
     # Availability
-    in_stock = Column(Boolean, default=True)
-    stock_location = Column(JSON, nullable=True)  # Dict of store -> availability
+    in_stock: Mapped[Optional[bool]] = mapped_column(Boolean, default=True)
+    stock_location: Mapped[Optional[Dict[str, bool]]] = mapped_column(JSONB, nullable=True)
 
     # Media
-    image_url = Column(String(500), nullable=True)
+    image_url: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
 
     # Timestamps
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationships
-    category_rel = relationship("CategoryDB", back_populates="products")
+    category_rel: Mapped[Optional["CategoryDB"]] = relationship(back_populates="products")
 
     # Indexes for common queries
     __table_args__ = (
         Index('idx_product_category_price', 'category', 'price'),
-        Index('idx_product_name_search', 'name'),
+        # Covering index for category listings filtered by stock (index-only scans)
+        Index(
+            'idx_prod_cat_stock_price', 'category', 'in_stock', 'price',
+            postgresql_include=['id', 'name', 'brand'],
+        ),
+        # Trigram index for ILIKE '%...%' name search (requires pg_trgm)
+        Index(
+            'idx_prod_name_trgm', 'name',
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'},
+        ),
+        # GIN indexes for JSONB containment (@>, ?) filters
+        Index('idx_product_labels_gin', 'labels', postgresql_using='gin'),
+        Index('idx_product_allergens_gin', 'allergens', postgresql_using='gin'),
+        Index('idx_product_stock_location_gin', 'stock_location', postgresql_using='gin'),
+        Index('idx_label_flags', 'label_flags'),
+    )
+
+
+@event.listens_for(ProductDB, "before_insert")
+@event.listens_for(ProductDB, "before_update")
+def _sync_label_flags(mapper, connection, target) -> None:
+    target.label_flags = label_flags(target.labels)
+
+
+# Columns returned for Product responses (same fields as the Pydantic model)
+PRODUCT_FIELDS = tuple(
+    getattr(ProductDB, name) for name in (
+        "id", "barcode", "name", "brand", "category", "price", "unit", "quantity",
+        "store", "nutrition", "sustainability", "description", "ingredients",
+        "allergens", "labels", "in_stock", "stock_location", "image_url",
+        "created_at", "updated_at",
     )
+)
+
+
+def list_products(db, *criteria, columns=PRODUCT_FIELDS):
+    """
+    Read products as dict-like rows with a Core select (no ORM hydration)
 
-    def to_dict(self):
-        """Convert to dictionary for Pydantic model"""
-        return {
-            "id": self.id,
-            "barcode": self.barcode,
-            "name": self.name,
-            "brand": self.brand,
-            "category": self.category,
-            "price": self.price,
-            "unit": self.unit,
-            "quantity": self.quantity,
-            "store": self.store,
-            "nutrition": self.nutrition,
-            "sustainability": self.sustainability,
-            "description": self.description,
-            "ingredients": self.ingredients,
-            "allergens": self.allergens,
-            "labels": self.labels,
-            "in_stock": self.in_stock,
-            "stock_location": self.stock_location,
-            "image_url": self.image_url,
-            "created_at": self.created_at,
-            "updated_at": self.updated_at,
-        }
+    Pass only the columns an endpoint needs to cut the data read from Postgres.
+    """
+    stmt = select(*columns).where(*criteria)
+    return db.execute(stmt).mappings().all()
+
+
+def stream_products(db, *criteria, columns=PRODUCT_FIELDS, batch_size: int = 1000):
+    """
+    Iterate products in batches of dict-like rows through a server-side cursor
+
+    Only batch_size rows are held in memory at a time; for scans that aggregate
+    over the catalog instead of returning it.
+    """
+    stmt = select(*columns).where(*criteria).execution_options(
+        stream_results=True, yield_per=batch_size
+    )
+    return db.execute(stmt).mappings().partitions()
 
 
 class ShoppingListDB(Base):
     """Shopping list model"""
     __tablename__ = "shopping_lists"
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String(200), nullable=False)
-    user_id = Column(String(100), nullable=True)  # For future user system
-    budget = Column(Float, nullable=True)
-    optimization_mode = Column(String(50), default="balanced")
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(200), nullable=False)
+    user_id: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)  # For future user system
+    budget: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    optimization_mode: Mapped[Optional[str]] = mapped_column(String(50), default="balanced")
 
     # Items as JSON array
-    items = Column(JSON, default=[])
+    items: Mapped[Optional[List[Dict[str, Any]]]] = mapped_column(JSON, default=[])
 
     # Optimization results
-    optimized_items = Column(JSON, nullable=True)
-    total_cost = Column(Float, nullable=True)
-    total_savings = Column(Float, nullable=True)
+    optimized_items: Mapped[Optional[List[Dict[str, Any]]]] = mapped_column(JSON, nullable=True)
+    total_cost: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    total_savings: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), onupdate=func.now())
 
 
 class UserPreferencesDB(Base):
     """User preferences for personalized recommendations"""
     __tablename__ = "user_preferences"
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(String(100), unique=True, nullable=False, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[str] = mapped_column(String(100), unique=True, nullable=False, index=True)
 
     # Dietary preferences
-    dietary_restrictions = Column(JSON, default=[])  # vegan, vegetarian, etc.
-    allergens = Column(JSON, default=[])
+    dietary_restrictions: Mapped[Optional[List[str]]] = mapped_column(JSON, default=[])  # vegan, vegetarian, etc.
+    allergens: Mapped[Optional[List[str]]] = mapped_column(JSON, default=[])
 
     # Shopping preferences
-    preferred_stores = Column(JSON, default=[])
-    preferred_labels = Column(JSON, default=[])  # organic, local, fair-trade
+    preferred_stores: Mapped[Optional[List[str]]] = mapped_column(JSON, default=[])
+    preferred_labels: Mapped[Optional[List[str]]] = mapped_column(JSON, default=[])  # organic, local, fair-trade
 
     # Optimization preferences
-    price_weight = Column(Float, default=0.4)
-    sustainability_weight = Column(Float, default=0.3)
-    health_weight = Column(Float, default=0.3)
+    price_weight: Mapped[Optional[float]] = mapped_column(Float, default=0.4)
+    sustainability_weight: Mapped[Optional[float]] = mapped_column(Float, default=0.3)
+    health_weight: Mapped[Optional[float]] = mapped_column(Float, default=0.3)
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), onupdate=func.now())
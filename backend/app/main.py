@@ -3,15 +3,45 @@ LiquiVerde Smart Retail Platform - Backend API
 FastAPI application con optimización multi-objetivo de compras
 """
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
+import asyncio
+import os
+import re
 import uvicorn
 
 from .routes import products_router, shopping_list_router, recommendations_router
-from .database import init_db
+from .database import init_db, ping_database, engine
 from .cache import cache_service
+from .services.product_service import ProductService, get_product_service
+from .middleware import ETagMiddleware, etag_for, etag_matches
+
+
+# Palabras clave para clasificar tiendas, compiladas una vez como alternancias
+ORGANIC_KEYWORDS = ["organic", "orgánico", "organico", "natural", "bio", "eco", "verde", "saludable", "health", "whole"]
+# Large chains in Chile
+LARGE_CHAINS = ["jumbo", "líder", "lider", "santa isabel", "tottus", "unimarc", "walmart", "costco", "makro"]
+# Local store indicators
+LOCAL_KEYWORDS = ["local", "barrio", "vecino", "minimarket", "almacén", "almacen", "botillería", "botilleria", "express", "mini"]
+
+_ORGANIC_RE = re.compile("|".join(map(re.escape, ORGANIC_KEYWORDS)))
+_CHAIN_RE = re.compile("|".join(map(re.escape, LARGE_CHAINS)))
+_LOCAL_RE = re.compile("|".join(map(re.escape, LOCAL_KEYWORDS)))
+
+
+def check_organic(name: str) -> bool:
+    """Check if store likely has organic products based on name"""
+    return _ORGANIC_RE.search(name.lower()) is not None
+
+
+def check_local(name: str) -> bool:
+    """Check if store is local (not a large chain)"""
+    name_lower = name.lower()
+    return _LOCAL_RE.search(name_lower) is not None or _CHAIN_RE.search(name_lower) is None
 
 
 @asynccontextmanager
@@ -31,6 +61,9 @@ async def lifespan(app: FastAPI):
     else:
         print("Redis cache not available - running without cache")
 
+    # Catálogo compartido por las rutas: se carga y se indexa antes de recibir tráfico
+    await asyncio.to_thread(lambda: get_product_service().warmup())
+
     yield
 
     # Shutdown
@@ -41,6 +74,7 @@ app = FastAPI(
     title="LiquiVerde Smart Retail API",
     redoc_url=None,  # Disable ReDoc (use /docs Swagger UI instead)
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     description="""
     🌿 Plataforma de retail inteligente para compras sostenibles y económicas
 
@@ -69,20 +103,28 @@ app = FastAPI(
     },
 )
 
+# ETag / 304 para respuestas GET sin cambios (registrado primero: se calcula sobre el JSON sin comprimir)
+app.add_middleware(ETagMiddleware)
+
 # Configurar CORS para permitir frontend
+# Orígenes explícitos (con credenciales los navegadores no aceptan "*"); en producción vía CORS_ORIGINS
+CORS_ORIGINS = os.getenv(
+    "CORS_ORIGINS",
+    "http://localhost:5173,http://localhost:3000,http://localhost:8080",  # Vite dev server, alternativos
+).split(",")
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5173",  # Vite dev server
-        "http://localhost:3000",  # Alternative port
-        "http://localhost:8080",
-        "*",  # Para desarrollo - en producción usar dominios específicos
-    ],
+    allow_origins=[origin.strip() for origin in CORS_ORIGINS if origin.strip()],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=86400,  # Los navegadores cachean el preflight un día
 )
 
+# Compresión gzip de respuestas JSON grandes (catálogo, estadísticas, tiendas)
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=5)
+
 # Registrar routers
 app.include_router(products_router)
 app.include_router(shopping_list_router)
@@ -121,9 +163,6 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint with service status"""
-    from .database import SessionLocal
-    from sqlalchemy import text
-
     health = {
         "status": "healthy",
         "service": "liquiverde-api",
@@ -136,16 +175,15 @@ async def health_check():
 
     # Check database
     try:
-        db = SessionLocal()
-        db.execute(text("SELECT 1"))
-        db.close()
+        await ping_database()
         health["components"]["database"] = "up"
+        health["database_pool"] = engine.pool.status()
     except Exception as e:
         health["components"]["database"] = "down"
         health["status"] = "degraded"
 
-    # Check Redis
-    if cache_service.is_available():
+    # Check Redis (cliente síncrono: fuera del event loop)
+    if await run_in_threadpool(cache_service.is_available):
         health["components"]["cache"] = "up"
     else:
         health["components"]["cache"] = "down"
@@ -159,25 +197,13 @@ async def get_nearby_stores(lat: float, lng: float, radius: float = 5.0):
     """Busca tiendas cercanas usando Google Maps API"""
     from .services.external_api_service import ExternalAPIService
 
-    api_service = ExternalAPIService()
-    stores = await api_service.find_nearby_stores(lat, lng, radius)
-
-    def check_organic(name: str) -> bool:
-        """Check if store likely has organic products based on name"""
-        name_lower = name.lower()
-        organic_keywords = ["organic", "orgánico", "organico", "natural", "bio", "eco", "verde", "saludable", "health", "whole"]
-        return any(keyword in name_lower for keyword in organic_keywords)
-
-    def check_local(name: str) -> bool:
-        """Check if store is local (not a large chain)"""
-        name_lower = name.lower()
-        # Large chains in Chile
-        large_chains = ["jumbo", "líder", "lider", "santa isabel", "tottus", "unimarc", "walmart", "costco", "makro"]
-        is_chain = any(chain in name_lower for chain in large_chains)
-        # Local store indicators
-        local_keywords = ["local", "barrio", "vecino", "minimarket", "almacén", "almacen", "botillería", "botilleria", "express", "mini"]
-        is_local = any(keyword in name_lower for keyword in local_keywords)
-        return is_local or not is_chain
+    # El cliente Redis es síncrono: sus llamadas van al threadpool
+    stores = await run_in_threadpool(cache_service.get_cached_nearby_stores, lat, lng, radius)
+    if stores is None:
+        api_service = ExternalAPIService()
+        stores = await api_service.find_nearby_stores(lat, lng, radius)
+        if stores:
+            await run_in_threadpool(cache_service.cache_nearby_stores, lat, lng, radius, stores)
 
     return {
         "stores": [
@@ -202,18 +228,20 @@ async def get_nearby_stores(lat: float, lng: float, radius: float = 5.0):
 
 
 @app.get("/api/stats")
-async def get_stats():
-    """Estadísticas generales del catálogo"""
-    from .services.product_service import ProductService
+def get_stats(request: Request, service: ProductService = Depends(get_product_service)):
+    """Estadísticas generales del catálogo (sync: Redis y la consulta corren en el threadpool)"""
+    # El cliente ya tiene la versión en cache: 304 sin leer ni serializar las estadísticas
+    etag = cache_service.get_cached_stats_etag()
+    if etag is not None and etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
 
-    service = ProductService()
-    products = service.get_all_products()
-    categories = service.get_categories()
+    cached = cache_service.get_cached_stats()
+    if cached is not None:
+        return cached
 
-    # Calcular estadísticas
-    total_products = len(products)
+    stats = service.get_catalog_stats()
 
-    if total_products == 0:
+    if stats["total_products"] == 0:
         return {
             "total_products": 0,
             "categories_count": 0,
@@ -224,32 +252,25 @@ async def get_stats():
             "message": "No products in catalog",
         }
 
-    avg_price = sum(p.price for p in products) / total_products
-
-    # Productos por categoría
-    category_distribution = {}
-    for cat in categories:
-        cat_products = service.get_products_by_category(cat)
-        category_distribution[cat] = len(cat_products)
-
-    # Productos con diferentes labels
-    organic_count = sum(1 for p in products if p.labels and "organic" in [l.lower() for l in p.labels])
-    local_count = sum(1 for p in products if p.labels and "local" in [l.lower() for l in p.labels])
-
-    return {
-        "total_products": total_products,
-        "categories_count": len(categories),
-        "categories": category_distribution,
-        "average_price": round(avg_price, 2),
+    response = {
+        "total_products": stats["total_products"],
+        "categories_count": len(stats["categories"]),
+        "categories": stats["categories"],
+        "average_price": round(stats["average_price"], 2),
         "price_range": {
-            "min": min(p.price for p in products),
-            "max": max(p.price for p in products),
+            "min": stats["min_price"],
+            "max": stats["max_price"],
         },
         "labels": {
-            "organic": organic_count,
-            "local": local_count,
+            "organic": stats["organic"],
+            "local": stats["local"],
         },
     }
+    result = ORJSONResponse(response)
+    etag = etag_for(result.body)
+    result.headers["ETag"] = etag
+    cache_service.cache_stats(response, etag)
+    return result
 
 
 # Exception handlers
@@ -270,10 +291,11 @@ async def internal_error_handler(request, exc):
 
 
 if __name__ == "__main__":
-    # Ejecutar servidor
+    # Servidor de desarrollo; en producción: gunicorn -c gunicorn.conf.py app.main:app
+    debug = os.getenv("DEBUG", "false").lower() == "true"
     uvicorn.run(
         "app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,  # Auto-reload en desarrollo
+        host=os.getenv("API_HOST", "0.0.0.0"),
+        port=int(os.getenv("API_PORT", "8000")),
+        reload=debug,  # Auto-reload solo en desarrollo
     )
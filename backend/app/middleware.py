@@ -0,0 +1,87 @@
+"""
+HTTP middleware: ETags and conditional GET (If-None-Match -> 304)
+"""
+
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .cache import CacheService
+
+
+def etag_for(body: bytes) -> str:
+    """
+    ETag for a response body
+
+    Weak, because GZipMiddleware serves the same tag for the compressed and
+    identity encodings of the body.
+    """
+    return f'W/"{CacheService.hash_bytes(body)}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+class ETagMiddleware:
+    """
+    Add an ETag to GET 200 responses and answer a matching If-None-Match with 304
+
+    Only single-message bodies are hashed (streamed responses pass through);
+    an ETag set by the endpoint itself is kept instead of hashing the body.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        start_message: Optional[Message] = None
+
+        async def send_with_etag(message: Message) -> None:
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                if message["status"] == 200:
+                    start_message = message  # Held until the body is known
+                else:
+                    await send(message)
+                return
+
+            if start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            if message.get("more_body", False):
+                await send(start)
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            etag = headers.get("etag")
+            if etag is None:
+                etag = etag_for(message.get("body", b""))
+                headers["etag"] = etag
+            if etag_matches(if_none_match, etag):
+                del headers["content-length"]
+                del headers["content-type"]
+                await send({"type": "http.response.start", "status": 304, "headers": headers.raw})
+                await send({"type": "http.response.body", "body": b""})
+                return
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List, Dict
 from datetime import datetime
 
@@ -32,6 +32,9 @@ class SustainabilityScore(BaseModel):
 
 class Product(BaseModel):
     """Product model with all relevant information"""
+    # Allows Product.model_validate(product_db) straight from the ORM row
+    model_config = ConfigDict(from_attributes=True)
+
     id: str
     barcode: Optional[str] = None
     name: str
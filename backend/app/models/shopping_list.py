@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_serializer
 from typing import List, Optional, Dict
 from datetime import datetime
 from .product import Product, SustainabilityScore
@@ -42,6 +42,11 @@ class OptimizedProduct(BaseModel):
     savings: float = 0.0
     sustainability_impact: str = "neutral"
 
+    @field_serializer("savings", when_used="json")
+    def _round_savings(self, value: float) -> float:
+        """Round to cents only when serializing"""
+        return round(value, 2)
+
 
 class OptimizedShoppingList(BaseModel):
     """Optimized shopping list result"""
@@ -77,3 +82,17 @@ class OptimizedShoppingList(BaseModel):
     savings_opportunities: List[SavingsOpportunity] = []
 
     created_at: datetime = Field(default_factory=datetime.now)
+
+    @field_serializer(
+        "total_cost",
+        "estimated_savings",
+        "budget_used_percentage",
+        "total_carbon_footprint",
+        "total_water_usage",
+        "recyclable_percentage",
+        "optimization_score",
+        when_used="json",
+    )
+    def _round_metrics(self, value: float) -> float:
+        """Round summary metrics to 2 decimals only when serializing"""
+        return round(value, 2)
@@ -2,39 +2,98 @@
 Rutas de API para productos
 """
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from typing import List, Optional
-from ..services.product_service import ProductService
+import orjson
+from ..services.product_service import ProductService, get_product_service
 from ..services.external_api_service import ExternalAPIService
+from ..cache import CacheService, cached
+from ..middleware import etag_matches
 
 router = APIRouter(prefix="/api/products", tags=["products"])
 
-# Servicios compartidos
-product_service = ProductService()
+# Respuestas cacheadas en Redis; las del catálogo se invalidan al modificar productos
+CATALOG_CACHE = f"{CacheService.API_PREFIX}catalog"
+EXTERNAL_CACHE = f"{CacheService.API_PREFIX}external"
+
+# Cache HTTP de los listados del catálogo JSON (el ETag cambia con el catálogo)
+CATALOG_CACHE_CONTROL = "public, max-age=3600"
+
+# Servicios compartidos (el de productos se inyecta con Depends)
 external_api_service = ExternalAPIService()
 
 
+def _catalog_headers(request: Request, product_service: ProductService):
+    """
+    Headers de cache HTTP para un listado del catálogo, y si el cliente ya tiene
+    esa versión la respuesta 304 (sin armar el listado)
+    """
+    etag = product_service.catalog_etag()
+    if etag is None:
+        return None, None
+    headers = {"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return headers, Response(status_code=304, headers=headers)
+    return headers, None
+
+
 @router.get("/")
-async def get_all_products():
+async def get_all_products(
+    request: Request,
+    expand: bool = Query(True, description="False: solo los IDs de los productos"),
+    product_service: ProductService = Depends(get_product_service),
+):
     """Obtiene todos los productos disponibles"""
+    headers, not_modified = _catalog_headers(request, product_service)
+    if not_modified is not None:
+        return not_modified
+
     products = product_service.get_all_products()
-    return {"count": len(products), "products": [p.dict() for p in products]}
+    if not expand:
+        return ORJSONResponse({"count": len(products), "ids": [p.id for p in products]}, headers=headers)
+
+    # JSON transmitido por fragmentos con los bytes pre-serializados de cada producto
+    def body():
+        yield b'{"count":%d,"products":' % len(products)
+        yield from product_service.iter_products_json(products)
+        yield b"}"
+
+    return StreamingResponse(body(), media_type="application/json", headers=headers)
 
 
 @router.get("/categories")
-async def get_categories():
+@cached(CATALOG_CACHE, ttl=3600, exclude=("product_service",))
+async def get_categories(product_service: ProductService = Depends(get_product_service)):
     """Obtiene todas las categorías disponibles"""
     categories = product_service.get_categories()
     return {"categories": categories}
 
 
 @router.get("/catalog")
-async def get_catalog():
+async def get_catalog(
+    request: Request,
+    expand: bool = Query(True, description="False: solo los IDs de los productos"),
+    product_service: ProductService = Depends(get_product_service),
+):
     """Obtiene catálogo organizado por categorías"""
+    headers, not_modified = _catalog_headers(request, product_service)
+    if not_modified is not None:
+        return not_modified
+
     catalog = product_service.get_product_catalog()
-    return {
-        cat: [p.dict() for p in products] for cat, products in catalog.items()
-    }
+    if not expand:
+        return ORJSONResponse({cat: [p.id for p in products] for cat, products in catalog.items()}, headers=headers)
+
+    def body():
+        separator = b"{"
+        for cat, products in catalog.items():
+            yield separator + orjson.dumps(cat) + b":"
+            yield from product_service.iter_products_json(products)
+            separator = b","
+        yield b"}" if catalog else b"{}"
+
+    return StreamingResponse(body(), media_type="application/json", headers=headers)
 
 
 @router.get("/search")
@@ -45,6 +104,8 @@ async def search_products(
     max_price: Optional[float] = Query(None, description="Precio máximo"),
     labels: Optional[str] = Query(None, description="Labels separadas por coma"),
     store: Optional[str] = Query(None, description="Tienda"),
+    expand: bool = Query(True, description="False: solo los IDs de los productos"),
+    product_service: ProductService = Depends(get_product_service),
 ):
     """
     Busca productos con múltiples filtros
@@ -62,31 +123,39 @@ async def search_products(
         store=store,
     )
 
-    return {
-        "count": len(results),
-        "query": {
-            "text": q,
-            "category": category,
-            "min_price": min_price,
-            "max_price": max_price,
-            "labels": labels_list,
-            "store": store,
-        },
-        "results": [p.dict() for p in results],
+    query = {
+        "text": q,
+        "category": category,
+        "min_price": min_price,
+        "max_price": max_price,
+        "labels": labels_list,
+        "store": store,
     }
+    if not expand:
+        return {"count": len(results), "query": query, "ids": [p.id for p in results]}
+    body = b'{"count":%d,"query":%s,"results":%s}' % (
+        len(results), orjson.dumps(query), product_service.products_json(results)
+    )
+    return Response(content=body, media_type="application/json")
 
 
 @router.get("/{product_id}")
-async def get_product(product_id: str):
+async def get_product(
+    product_id: str,
+    product_service: ProductService = Depends(get_product_service),
+):
     """Obtiene un producto específico por ID"""
     product = product_service.get_product_by_id(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product.dict()
+    return product_service.product_dict(product)
 
 
 @router.get("/{product_id}/analyze")
-async def analyze_product(product_id: str):
+async def analyze_product(
+    product_id: str,
+    product_service: ProductService = Depends(get_product_service),
+):
     """
     Analiza un producto completo con:
     - Score de sostenibilidad
@@ -97,11 +166,15 @@ async def analyze_product(product_id: str):
     analysis = product_service.analyze_product(product_id)
     if not analysis:
         raise HTTPException(status_code=404, detail="Product not found")
-    return analysis.dict()
+    return analysis.model_dump(mode="json")
 
 
 @router.get("/barcode/{barcode}")
-async def get_product_by_barcode(barcode: str, use_external: bool = False):
+async def get_product_by_barcode(
+    barcode: str,
+    use_external: bool = False,
+    product_service: ProductService = Depends(get_product_service),
+):
     """
     Busca un producto por código de barras
 
@@ -115,7 +188,7 @@ async def get_product_by_barcode(barcode: str, use_external: bool = False):
     if product:
         return {
             "source": "local",
-            "product": product.dict(),
+            "product": product_service.product_dict(product),
         }
 
     # Si no existe y use_external=True, buscar en API externa
@@ -135,7 +208,10 @@ async def get_product_by_barcode(barcode: str, use_external: bool = False):
 
 
 @router.post("/compare")
-async def compare_products(product_ids: List[str]):
+async def compare_products(
+    product_ids: List[str],
+    product_service: ProductService = Depends(get_product_service),
+):
     """
     Compara múltiples productos
 
@@ -156,7 +232,10 @@ async def compare_products(product_ids: List[str]):
 
 
 @router.get("/{product_id}/carbon-footprint")
-async def get_carbon_footprint(product_id: str):
+async def get_carbon_footprint(
+    product_id: str,
+    product_service: ProductService = Depends(get_product_service),
+):
     """Calcula la huella de carbono estimada de un producto"""
     product = product_service.get_product_by_id(product_id)
     if not product:
@@ -185,6 +264,7 @@ async def get_carbon_footprint(product_id: str):
 
 
 @router.get("/external/search")
+@cached(EXTERNAL_CACHE, ttl=600)
 async def search_external_api(q: str, country: str = "chile"):
     """
     Busca productos en Open Food Facts API
@@ -2,24 +2,91 @@
 Rutas de API para recomendaciones y sustituciones inteligentes
 """
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
 from typing import List, Optional
-from ..services.product_service import ProductService
+import heapq
+import numpy as np
+from ..services.product_service import ProductService, get_product_service
 from ..algorithms import IntelligentSubstitutionEngine, SustainabilityScorer
+from ..cache import cached
+from .products import CATALOG_CACHE
 
 router = APIRouter(prefix="/api/recommendations", tags=["recommendations"])
 
-# Servicios
-product_service = ProductService()
+# Servicios (el de productos se inyecta con Depends)
 scorer = SustainabilityScorer()
 substitution_engine = IntelligentSubstitutionEngine(scorer)
 
 
+def _value_scores(products, scores) -> np.ndarray:
+    """
+    Value score = sostenibilidad / (precio normalizado), para todo el lote
+
+    Mayor sostenibilidad y menor precio = mejor value
+    """
+    prices = np.fromiter((p.price for p in products), dtype=np.float64, count=len(products))
+    overall = np.fromiter((s.overall_score for s in scores), dtype=np.float64, count=len(scores))
+    price_normalized = prices / 1000  # Normalizar precio
+    return overall / (1 + price_normalized)
+
+
+def _max_savings_percentages(products) -> List[float]:
+    """
+    Mayor ahorro porcentual posible de cada producto (redondeado como en las
+    sugerencias): contra el producto más barato de la categoría con otro id
+    """
+    prices = np.fromiter((p.price for p in products), dtype=np.float64, count=len(products))
+    order = np.argsort(prices, kind="stable").tolist()
+    cheapest_other = np.empty_like(prices)
+    for i, product in enumerate(products):
+        # Casi siempre el primero (o el segundo, si es el propio producto)
+        j = next((j for j in order if products[j].id != product.id), i)
+        cheapest_other[i] = prices[j]
+    savings_pct = (prices - cheapest_other) / prices * 100
+    return [round(pct, 2) for pct in savings_pct.tolist()]
+
+
+def _category_savings(products, min_savings_percentage: float, product_dict) -> List[dict]:
+    """Oportunidades de ahorro dentro de una categoría (product_dict: ProductService.product_dict)"""
+    opportunities = []
+    if len(products) < 2:
+        return opportunities
+
+    # Para cada producto, encontrar mejor sustituto; se descartan antes los que
+    # ni con la alternativa más barata de la categoría alcanzan el ahorro mínimo
+    max_savings = _max_savings_percentages(products)
+    for product, product_max_savings in zip(products, max_savings):
+        if product_max_savings < min_savings_percentage:
+            continue
+        alternatives = [p for p in products if p.id != product.id]
+        suggestions = substitution_engine.find_substitutions(
+            product,
+            alternatives,
+            focus="price_focused",
+            max_suggestions=1,
+        )
+
+        if suggestions:
+            best_sub = suggestions[0]
+            # Solo incluir si hay ahorro significativo
+            if best_sub.price_difference_percentage >= min_savings_percentage:
+                opportunities.append({
+                    "expensive_product": product_dict(product),
+                    "better_alternative": product_dict(best_sub.suggested_product),
+                    "savings": best_sub.price_difference,
+                    "savings_percentage": best_sub.price_difference_percentage,
+                    "sustainability_improvement": best_sub.sustainability_improvement,
+                })
+    return opportunities
+
+
 @router.get("/substitute/{product_id}")
-async def get_substitutions(
+def get_substitutions(
     product_id: str,
     focus: str = Query("balanced", description="price_focused, sustainability_focused, health_focused, balanced"),
     max_results: int = Query(5, ge=1, le=10),
+    product_service: ProductService = Depends(get_product_service),
 ):
     """
     Obtiene sugerencias de sustitución para un producto
@@ -43,7 +110,7 @@ async def get_substitutions(
 
     if len(category_products) < 2:
         return {
-            "original_product": product.dict(),
+            "original_product": product_service.product_dict(product),
             "suggestions": [],
             "message": "No alternative products available in this category",
         }
@@ -57,17 +124,18 @@ async def get_substitutions(
     )
 
     return {
-        "original_product": product.dict(),
+        "original_product": product_service.product_dict(product),
         "focus": focus,
-        "suggestions": [s.dict() for s in suggestions],
+        "suggestions": [s.model_dump(mode="json") for s in suggestions],
         "count": len(suggestions),
     }
 
 
 @router.post("/batch-substitute")
-async def batch_substitute(
+def batch_substitute(
     product_ids: List[str],
     focus: str = "balanced",
+    product_service: ProductService = Depends(get_product_service),
 ):
     """
     Obtiene sustituciones para múltiples productos simultáneamente
@@ -80,7 +148,7 @@ async def batch_substitute(
     }
     ```
     """
-    products = [product_service.get_product_by_id(pid) for pid in product_ids]
+    products = product_service.get_products_by_ids(product_ids)
     products = [p for p in products if p is not None]
 
     if not products:
@@ -93,7 +161,7 @@ async def batch_substitute(
     # Convertir a formato serializable
     serialized_results = {}
     for product_id, suggestions in results.items():
-        serialized_results[product_id] = [s.dict() for s in suggestions]
+        serialized_results[product_id] = [s.model_dump(mode="json") for s in suggestions]
 
     return {
         "focus": focus,
@@ -107,6 +175,7 @@ async def batch_substitute(
 async def get_similar_products(
     product_id: str,
     limit: int = Query(5, ge=1, le=20),
+    product_service: ProductService = Depends(get_product_service),
 ):
     """
     Encuentra productos similares basados en categoría, labels y características
@@ -118,34 +187,20 @@ async def get_similar_products(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    # Buscar en la misma categoría
-    similar = product_service.get_products_by_category(product.category)
-
-    # Filtrar el mismo producto
-    similar = [p for p in similar if p.id != product_id]
-
-    # Si tiene labels, priorizar productos con labels similares
-    if product.labels:
-        # Calcular overlap de labels
-        def label_similarity(p):
-            if not p.labels:
-                return 0
-            common = len(set(product.labels) & set(p.labels))
-            return common
-
-        similar.sort(key=label_similarity, reverse=True)
-
-    return {
-        "original_product": product.dict(),
-        "similar_products": [p.dict() for p in similar[:limit]],
-        "count": len(similar[:limit]),
-    }
+    # Misma categoría, priorizando productos con más labels en común
+    similar = product_service.get_similar_products(product, limit)
+    body = b'{"original_product":%s,"similar_products":%s,"count":%d}' % (
+        product_service.product_json(product), product_service.products_json(similar), len(similar)
+    )
+    return Response(content=body, media_type="application/json")
 
 
 @router.get("/top-sustainable")
-async def get_top_sustainable_products(
+@cached(CATALOG_CACHE, ttl=600, exclude=("product_service",))
+def get_top_sustainable_products(
     category: Optional[str] = None,
     limit: int = Query(10, ge=1, le=50),
+    product_service: ProductService = Depends(get_product_service),
 ):
     """
     Retorna los productos con mejor score de sostenibilidad
@@ -154,27 +209,19 @@ async def get_top_sustainable_products(
         category: Filtrar por categoría (opcional)
         limit: Número de productos a retornar
     """
-    if category:
-        products = product_service.get_products_by_category(category)
-    else:
-        products = product_service.get_all_products()
+    # Top N por sostenibilidad
+    top_products = product_service.get_top_sustainable(category, limit)
 
-    if not products:
+    if not top_products:
         return {"products": [], "count": 0}
 
-    # Rankear por sostenibilidad
-    ranked = scorer.rank_products(products)
-
-    # Tomar top N
-    top_products = ranked[:limit]
-
     return {
         "category": category or "all",
         "count": len(top_products),
         "products": [
             {
-                "product": p.dict(),
-                "sustainability_score": s.dict(),
+                "product": product_service.product_dict(p),
+                "sustainability_score": s.model_dump(mode="json"),
                 "rank": i + 1,
             }
             for i, (p, s) in enumerate(top_products)
@@ -183,89 +230,65 @@ async def get_top_sustainable_products(
 
 
 @router.get("/best-value")
-async def get_best_value_products(
+def get_best_value_products(
     category: Optional[str] = None,
     limit: int = Query(10, ge=1, le=50),
+    product_service: ProductService = Depends(get_product_service),
 ):
     """
     Retorna productos con mejor relación calidad-precio-sostenibilidad
 
     Combina bajo precio con alta sostenibilidad
     """
-    if category:
-        products = product_service.get_products_by_category(category)
-    else:
-        products = product_service.get_all_products()
-
-    if not products:
-        return {"products": [], "count": 0}
-
-    # Calcular "value score" para cada producto
-    scored_products = []
-    for product in products:
-        sus_score = scorer.calculate_score(product)
-
-        # Value score = sostenibilidad / (precio normalizado)
-        # Mayor sostenibilidad y menor precio = mejor value
-        price_normalized = product.price / 1000  # Normalizar precio
-        value_score = sus_score.overall_score / (1 + price_normalized)
+    # Calcular "value score" para cada producto, un lote a la vez en arrays
+    def score_products():
+        for batch in product_service.iter_product_batches(category):
+            scores = scorer.calculate_scores_batch(batch)
+            yield from zip(batch, scores, _value_scores(batch, scores).tolist())
 
-        scored_products.append((product, sus_score, value_score))
+    # Mejores N por value score (mismo resultado que ordenar todo y cortar)
+    scored_products = heapq.nlargest(limit, score_products(), key=lambda x: x[2])
 
-    # Ordenar por value score
-    scored_products.sort(key=lambda x: x[2], reverse=True)
+    if not scored_products:
+        return {"products": [], "count": 0}
 
     return {
         "category": category or "all",
-        "count": len(scored_products[:limit]),
+        "count": len(scored_products),
         "products": [
             {
-                "product": p.dict(),
-                "sustainability_score": s.dict(),
+                "product": product_service.product_dict(p),
+                "sustainability_score": s.model_dump(mode="json"),
                 "value_score": round(v, 2),
                 "rank": i + 1,
             }
-            for i, (p, s, v) in enumerate(scored_products[:limit])
+            for i, (p, s, v) in enumerate(scored_products)
         ],
     }
 
 
 @router.get("/savings-opportunities")
-async def get_savings_opportunities(min_savings_percentage: float = 10.0):
+def get_savings_opportunities(
+    min_savings_percentage: float = 10.0,
+    product_service: ProductService = Depends(get_product_service),
+):
     """
     Identifica oportunidades de ahorro: productos caros que tienen alternativas más baratas y sostenibles
 
     Retorna pares de (producto_caro, alternativa_mejor)
     """
-    opportunities = []
+    # Productos agrupados por categoría en una sola pasada (sin una consulta por categoría)
+    products = product_service.get_all_products()
+    by_category = {}
+    for product in products:
+        by_category.setdefault(product.category.lower(), []).append(product)
 
+    # Handler sync (threadpool de FastAPI): el trabajo es casi todo Python con el GIL tomado
+    opportunities = []
     for category in product_service.get_categories():
-        products = product_service.get_products_by_category(category)
-
-        if len(products) < 2:
-            continue
-
-        # Para cada producto, encontrar mejor sustituto
-        for product in products:
-            alternatives = [p for p in products if p.id != product.id]
-            suggestions = substitution_engine.find_substitutions(
-                product,
-                alternatives,
-                focus="price_focused",
-                max_suggestions=1,
-            )
-
-            if suggestions:
-                best_sub = suggestions[0]
-                # Solo incluir si hay ahorro significativo
-                if best_sub.price_difference_percentage >= min_savings_percentage:
-                    opportunities.append({
-                        "expensive_product": product.dict(),
-                        "better_alternative": best_sub.suggested_product.dict(),
-                        "savings": best_sub.price_difference,
-                        "savings_percentage": best_sub.price_difference_percentage,
-                        "sustainability_improvement": best_sub.sustainability_improvement,
-                    })
+        opportunities.extend(_category_savings(
+            by_category.get(category.lower(), []), min_savings_percentage, product_service.product_dict
+        ))
 
     # Ordenar por ahorro
     opportunities.sort(key=lambda x: x["savings"], reverse=True)
@@ -2,12 +2,16 @@
 Rutas de API para optimización de listas de compras
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response
 from typing import List, Optional
 from pydantic import BaseModel
+import numpy as np
+import orjson
 from ..models.shopping_list import ShoppingList, ShoppingListItem
-from ..services.product_service import ProductService
+from ..services.product_service import ProductService, get_product_service
 from ..algorithms import MultiObjectiveKnapsackOptimizer, SustainabilityScorer
+from ..middleware import etag_for, etag_matches
 
 
 class QuickOptimizeRequest(BaseModel):
@@ -18,14 +22,57 @@ class QuickOptimizeRequest(BaseModel):
 
 router = APIRouter(prefix="/api/shopping-list", tags=["shopping-list"])
 
-# Servicios
-product_service = ProductService()
+# Servicios (el de productos se inyecta con Depends)
 scorer = SustainabilityScorer()
 optimizer = MultiObjectiveKnapsackOptimizer(sustainability_scorer=scorer)
 
 
+# Templates de listas de compras comunes (estáticos: se construyen una sola vez)
+SHOPPING_TEMPLATES = {
+    "weekly_basics": {
+        "name": "Compra Semanal Básica",
+        "items": [
+            {"product_name": "Leche", "category": "dairy", "quantity": 2, "priority": 1},
+            {"product_name": "Pan", "category": "bread", "quantity": 1, "priority": 1},
+            {"product_name": "Huevos", "category": "eggs", "quantity": 1, "priority": 1},
+            {"product_name": "Arroz", "category": "cereals", "quantity": 1, "priority": 2},
+            {"product_name": "Lentejas", "category": "legumes", "quantity": 1, "priority": 2},
+            {"product_name": "Tomates", "category": "vegetable", "quantity": 1, "priority": 2},
+            {"product_name": "Manzanas", "category": "fruit", "quantity": 1, "priority": 2},
+        ],
+        "estimated_budget": 15000,
+    },
+    "healthy_week": {
+        "name": "Semana Saludable",
+        "items": [
+            {"product_name": "Yogurt Natural", "category": "dairy", "quantity": 1, "priority": 1},
+            {"product_name": "Avena", "category": "cereals", "quantity": 1, "priority": 1},
+            {"product_name": "Quinoa", "category": "cereals", "quantity": 1, "priority": 2},
+            {"product_name": "Lentejas Orgánicas", "category": "legumes", "quantity": 1, "priority": 2},
+            {"product_name": "Tomates Orgánicos", "category": "vegetable", "quantity": 1, "priority": 2},
+            {"product_name": "Aceite de Oliva", "category": "oils", "quantity": 1, "priority": 1},
+        ],
+        "estimated_budget": 20000,
+    },
+    "budget_friendly": {
+        "name": "Compra Económica",
+        "items": [
+            {"product_name": "Arroz", "category": "cereals", "quantity": 2, "priority": 1},
+            {"product_name": "Lentejas", "category": "legumes", "quantity": 2, "priority": 1},
+            {"product_name": "Pan", "category": "bread", "quantity": 1, "priority": 1},
+            {"product_name": "Huevos", "category": "eggs", "quantity": 1, "priority": 1},
+            {"product_name": "Leche", "category": "dairy", "quantity": 1, "priority": 2},
+        ],
+        "estimated_budget": 10000,
+    },
+}
+
+
 @router.post("/optimize")
-async def optimize_shopping_list(shopping_list: ShoppingList):
+def optimize_shopping_list(
+    shopping_list: ShoppingList,
+    product_service: ProductService = Depends(get_product_service),
+):
     """
     Optimiza una lista de compras usando el algoritmo de mochila multi-objetivo
 
@@ -65,13 +112,17 @@ async def optimize_shopping_list(shopping_list: ShoppingList):
     # Ejecutar optimización
     try:
         result = optimizer.optimize(shopping_list, catalog)
-        return result.dict()
+        # Modo json: aplica el redondeo de las métricas (field_serializer)
+        return result.model_dump(mode="json")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Optimization failed: {str(e)}")
 
 
 @router.post("/quick-optimize")
-async def quick_optimize(request: QuickOptimizeRequest):
+def quick_optimize(
+    request: QuickOptimizeRequest,
+    product_service: ProductService = Depends(get_product_service),
+):
     """
     Versión simplificada de optimización: solo nombres de productos
 
@@ -121,7 +172,7 @@ async def quick_optimize(request: QuickOptimizeRequest):
     result = optimizer.optimize(shopping_list, catalog)
 
     # Agregar warnings por productos no encontrados
-    result_dict = result.dict()
+    result_dict = result.model_dump(mode="json")
     if not_found:
         result_dict["warnings"] = result_dict.get("warnings", []) + [
             f"Producto '{name}' no encontrado en el catálogo" for name in not_found
@@ -132,7 +183,10 @@ async def quick_optimize(request: QuickOptimizeRequest):
 
 
 @router.post("/estimate")
-async def estimate_shopping_list(items: List[ShoppingListItem]):
+def estimate_shopping_list(
+    items: List[ShoppingListItem],
+    product_service: ProductService = Depends(get_product_service),
+):
     """
     Estima costo y sostenibilidad de una lista sin optimizar
 
@@ -140,7 +194,8 @@ async def estimate_shopping_list(items: List[ShoppingListItem]):
     """
     total_cost = 0
     total_items = 0
-    sustainability_scores = []
+    # Una fila por producto: overall, económico, ambiental, social, salud
+    scores = np.empty((len(items), 5), dtype=np.float64)
 
     for item in items:
         # Buscar productos de la categoría
@@ -159,71 +214,45 @@ async def estimate_shopping_list(items: List[ShoppingListItem]):
             total_cost += cost
 
             score = scorer.calculate_score(product)
-            sustainability_scores.append(score)
+            scores[total_items] = (
+                score.overall_score, score.economic_score, score.environmental_score,
+                score.social_score, score.health_score,
+            )
             total_items += 1
 
     if total_items == 0:
         raise HTTPException(status_code=404, detail="No products found for items")
 
-    avg_sustainability = sum(s.overall_score for s in sustainability_scores) / len(sustainability_scores)
+    # Promedios de las cinco columnas en una sola reducción (suma en orden, como sum())
+    avg_overall, avg_economic, avg_environmental, avg_social, avg_health = (
+        scores[:total_items].mean(axis=0).tolist()
+    )
 
     return {
         "total_cost": round(total_cost, 2),
         "total_items": total_items,
-        "average_sustainability_score": round(avg_sustainability, 2),
+        "average_sustainability_score": round(avg_overall, 2),
         "breakdown": {
-            "avg_economic": round(sum(s.economic_score for s in sustainability_scores) / len(sustainability_scores), 2),
-            "avg_environmental": round(sum(s.environmental_score for s in sustainability_scores) / len(sustainability_scores), 2),
-            "avg_social": round(sum(s.social_score for s in sustainability_scores) / len(sustainability_scores), 2),
-            "avg_health": round(sum(s.health_score for s in sustainability_scores) / len(sustainability_scores), 2),
+            "avg_economic": round(avg_economic, 2),
+            "avg_environmental": round(avg_environmental, 2),
+            "avg_social": round(avg_social, 2),
+            "avg_health": round(avg_health, 2),
         }
     }
 
 
+# Respuesta de /templates serializada una vez, con su ETag
+TEMPLATES_BODY = orjson.dumps({"templates": SHOPPING_TEMPLATES})
+TEMPLATES_HEADERS = {"ETag": etag_for(TEMPLATES_BODY), "Cache-Control": "public, max-age=3600"}
+
+
 @router.get("/templates")
-async def get_shopping_templates():
+async def get_shopping_templates(request: Request):
     """
     Retorna templates de listas de compras comunes
 
     Útil para que usuarios inicien rápido
     """
-    templates = {
-        "weekly_basics": {
-            "name": "Compra Semanal Básica",
-            "items": [
-                {"product_name": "Leche", "category": "dairy", "quantity": 2, "priority": 1},
-                {"product_name": "Pan", "category": "bread", "quantity": 1, "priority": 1},
-                {"product_name": "Huevos", "category": "eggs", "quantity": 1, "priority": 1},
-                {"product_name": "Arroz", "category": "cereals", "quantity": 1, "priority": 2},
-                {"product_name": "Lentejas", "category": "legumes", "quantity": 1, "priority": 2},
-                {"product_name": "Tomates", "category": "vegetable", "quantity": 1, "priority": 2},
-                {"product_name": "Manzanas", "category": "fruit", "quantity": 1, "priority": 2},
-            ],
-            "estimated_budget": 15000,
-        },
-        "healthy_week": {
-            "name": "Semana Saludable",
-            "items": [
-                {"product_name": "Yogurt Natural", "category": "dairy", "quantity": 1, "priority": 1},
-                {"product_name": "Avena", "category": "cereals", "quantity": 1, "priority": 1},
-                {"product_name": "Quinoa", "category": "cereals", "quantity": 1, "priority": 2},
-                {"product_name": "Lentejas Orgánicas", "category": "legumes", "quantity": 1, "priority": 2},
-                {"product_name": "Tomates Orgánicos", "category": "vegetable", "quantity": 1, "priority": 2},
-                {"product_name": "Aceite de Oliva", "category": "oils", "quantity": 1, "priority": 1},
-            ],
-            "estimated_budget": 20000,
-        },
-        "budget_friendly": {
-            "name": "Compra Económica",
-            "items": [
-                {"product_name": "Arroz", "category": "cereals", "quantity": 2, "priority": 1},
-                {"product_name": "Lentejas", "category": "legumes", "quantity": 2, "priority": 1},
-                {"product_name": "Pan", "category": "bread", "quantity": 1, "priority": 1},
-                {"product_name": "Huevos", "category": "eggs", "quantity": 1, "priority": 1},
-                {"product_name": "Leche", "category": "dairy", "quantity": 1, "priority": 2},
-            ],
-            "estimated_budget": 10000,
-        },
-    }
-
-    return {"templates": templates}
+    if etag_matches(request.headers.get("if-none-match"), TEMPLATES_HEADERS["ETag"]):
+        return Response(status_code=304, headers=TEMPLATES_HEADERS)
+    return Response(content=TEMPLATES_BODY, media_type="application/json", headers=TEMPLATES_HEADERS)
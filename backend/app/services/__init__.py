@@ -1,4 +1,4 @@
-from .product_service import ProductService
+from .product_service import ProductService, get_product_service
 from .external_api_service import ExternalAPIService
 
-__all__ = ["ProductService", "ExternalAPIService"]
+__all__ = ["ProductService", "ExternalAPIService", "get_product_service"]
@@ -6,10 +6,21 @@ Servicio para integración con APIs externas
 """
 
 import aiohttp
+import datetime
+import logging
 import os
 from typing import Optional, Dict, List
 import asyncio
 
+from starlette.concurrency import run_in_threadpool
+
+from ..cache import cache_service
+
+logger = logging.getLogger(__name__)
+
+# Tiendas más cercanas cuyos detalles (Place Details) se consultan en paralelo
+PLACE_DETAILS_STORES = 5
+
 
 class ExternalAPIService:
     """Servicio para consultar APIs externas de productos y sostenibilidad"""
@@ -253,13 +264,19 @@ class ExternalAPIService:
                                 }
                                 stores.append(store_data)
 
-                            # Fetch details for top 5 stores (hours and phone)
+                            # Fetch details for the closest stores (hours and phone), en paralelo
                             sorted_stores = sorted(stores, key=lambda x: x["distance_km"])
-                            for store in sorted_stores[:5]:
-                                if store.get("place_id"):
-                                    details = await self._get_place_details(session, store["place_id"])
-                                    if details:
-                                        store.update(details)
+
+                            async def enrich(store: Dict) -> None:
+                                details = await self._get_place_details(session, store["place_id"])
+                                if details:
+                                    store.update(details)
+
+                            await asyncio.gather(*(
+                                enrich(store)
+                                for store in sorted_stores[:PLACE_DETAILS_STORES]
+                                if store.get("place_id")
+                            ))
 
                             return sorted_stores
         except Exception as e:
@@ -269,8 +286,13 @@ class ExternalAPIService:
 
     async def _get_place_details(self, session, place_id: str) -> Optional[Dict]:
         """
-        Obtiene detalles de un lugar (horarios, teléfono)
+        Obtiene detalles de un lugar (horarios, teléfono), cacheados por place_id
         """
+        # El cliente Redis es síncrono: fuera del event loop
+        cached = await run_in_threadpool(cache_service.get_cached_place_details, place_id)
+        if cached is not None:
+            return self._format_place_details(cached)
+
         url = f"{self.google_maps_url}/place/details/json"
         params = {
             "place_id": place_id,
@@ -286,30 +308,41 @@ class ExternalAPIService:
                     data = await response.json()
                     if data.get("status") == "OK":
                         result = data.get("result", {})
-                        details = {}
+                        raw = {}
 
                         # Phone number
                         if result.get("formatted_phone_number"):
-                            details["phone"] = result["formatted_phone_number"]
+                            raw["phone"] = result["formatted_phone_number"]
 
-                        # Opening hours
+                        # Opening hours: se cachea la semana completa y el día
+                        # se elige al leer, para no servir el horario de ayer
                         opening_hours = result.get("opening_hours", {})
                         if opening_hours.get("weekday_text"):
-                            # Get today's hours
-                            import datetime
-                            today = datetime.datetime.now().weekday()
-                            weekday_text = opening_hours["weekday_text"]
-                            if today < len(weekday_text):
-                                details["hours"] = weekday_text[today]
-                            else:
-                                details["hours"] = weekday_text[0] if weekday_text else None
-
-                        return details if details else None
+                            raw["weekday_text"] = opening_hours["weekday_text"]
+
+                        if not raw:
+                            return None
+                        await run_in_threadpool(cache_service.cache_place_details, place_id, raw)
+                        return self._format_place_details(raw)
         except Exception as e:
-            print(f"Error getting place details: {e}")
+            logger.warning("Error getting place details: %s", e)
 
         return None
 
+    @staticmethod
+    def _format_place_details(raw: Dict) -> Dict:
+        """Convierte los detalles cacheados en teléfono y horario de hoy"""
+        details = {}
+        if raw.get("phone"):
+            details["phone"] = raw["phone"]
+
+        weekday_text = raw.get("weekday_text")
+        if weekday_text:
+            # Get today's hours
+            today = datetime.datetime.now().weekday()
+            details["hours"] = weekday_text[today] if today < len(weekday_text) else weekday_text[0]
+        return details
+
     def _calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         """Calculate distance between two points using Haversine formula"""
         import math
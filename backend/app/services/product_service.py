@@ -5,22 +5,152 @@ Con soporte para PostgreSQL y Redis cache
 """
 
 import json
-import hashlib
-from typing import List, Optional, Dict
+import threading
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import orjson
 from pathlib import Path
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import func, or_, text
 
-from ..models.product import Product, ProductAnalysis
+from ..models.product import Product, ProductAnalysis, SustainabilityScore
 from ..algorithms import SustainabilityScorer, IntelligentSubstitutionEngine
 from ..cache import cache_service
 from ..database import SessionLocal
-from ..db_models import ProductDB
+from ..db_models import LOCAL_FLAG, ORGANIC_FLAG, ProductDB, list_products, stream_products
+from ..stats_view import read_stats_rows
+
+# Bits en 1 de cada byte, para contar bits de arrays uint8 con np.take
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+@dataclass(slots=True)
+class _CatalogColumns:
+    """Catálogo en memoria en columnas (SoA) para filtrar búsquedas con máscaras NumPy"""
+    products: List[Product]
+    by_id: Dict[str, Product]    # primer producto con cada id
+    by_barcode: Dict[str, Product]  # primer producto con cada código de barras
+    by_category: Dict[str, List[Product]]  # categoría en minúsculas -> productos, en orden
+    prices: np.ndarray
+    category_codes: np.ndarray   # -1 nunca coincide
+    categories: Dict[str, int]   # categoría en minúsculas -> código
+    store_codes: np.ndarray      # -1 = sin tienda
+    stores: List[str]            # tienda en minúsculas por código
+    label_matrix: np.ndarray     # (productos, labels) bool
+    labels: Dict[str, int]       # label en minúsculas -> columna
+    label_bits: np.ndarray       # (productos, bytes) labels exactas como bitset empaquetado
+    exact_labels: Dict[str, int]  # label exacta -> bit
+    names_lc: List[str]
+    descriptions_lc: List[Optional[str]]
+    brands_lc: List[Optional[str]]
+    trigrams: Dict[str, np.ndarray]  # trigrama de nombre/descripción/marca -> índices (ordenados)
+
+    @classmethod
+    def build(cls, products: List[Product]) -> "_CatalogColumns":
+        categories: Dict[str, int] = {}
+        stores: Dict[str, int] = {}
+        labels: Dict[str, int] = {}
+        exact_labels: Dict[str, int] = {}
+        category_codes, store_codes, product_labels, product_exact = [], [], [], []
+        for p in products:
+            category_codes.append(categories.setdefault(p.category.lower(), len(categories)))
+            store_codes.append(stores.setdefault(p.store.lower(), len(stores)) if p.store else -1)
+            product_labels.append([
+                labels.setdefault(label.lower(), len(labels)) for label in p.labels or ()
+            ])
+            product_exact.append([
+                exact_labels.setdefault(label, len(exact_labels)) for label in p.labels or ()
+            ])
+
+        label_matrix = np.zeros((len(products), len(labels)), dtype=bool)
+        for i, columns in enumerate(product_labels):
+            label_matrix[i, columns] = True
+        exact_matrix = np.zeros((len(products), len(exact_labels)), dtype=bool)
+        for i, bits in enumerate(product_exact):
+            exact_matrix[i, bits] = True
+
+        names_lc = [p.name.lower() for p in products]
+        descriptions_lc = [p.description.lower() if p.description else None for p in products]
+        brands_lc = [p.brand.lower() if p.brand else None for p in products]
+
+        # Índice invertido de trigramas por campo (un trigrama no cruza de un campo a otro)
+        postings: Dict[str, List[int]] = {}
+        for i, fields in enumerate(zip(names_lc, descriptions_lc, brands_lc)):
+            grams = set()
+            for text in fields:
+                if text:
+                    grams.update(text[j:j + 3] for j in range(len(text) - 2))
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+
+        by_id: Dict[str, Product] = {}
+        by_barcode: Dict[str, Product] = {}
+        by_category: Dict[str, List[Product]] = {}
+        for p in products:
+            by_id.setdefault(p.id, p)
+            if p.barcode is not None:
+                by_barcode.setdefault(p.barcode, p)
+            by_category.setdefault(p.category.lower(), []).append(p)
+
+        return cls(
+            products=products,
+            by_id=by_id,
+            by_barcode=by_barcode,
+            by_category=by_category,
+            prices=np.fromiter((p.price for p in products), dtype=np.float64, count=len(products)),
+            category_codes=np.asarray(category_codes, dtype=np.int32),
+            categories=categories,
+            store_codes=np.asarray(store_codes, dtype=np.int32),
+            stores=list(stores),
+            label_matrix=label_matrix,
+            labels=labels,
+            label_bits=np.packbits(exact_matrix, axis=1),
+            exact_labels=exact_labels,
+            names_lc=names_lc,
+            descriptions_lc=descriptions_lc,
+            brands_lc=brands_lc,
+            trigrams={gram: np.asarray(ids, dtype=np.int32) for gram, ids in postings.items()},
+        )
+
+    def label_overlap(self, labels: List[str], indices: np.ndarray) -> np.ndarray:
+        """Cantidad de labels distintas en común con `labels` de cada producto en indices"""
+        reference = np.zeros(len(self.exact_labels), dtype=bool)
+        reference[[self.exact_labels[label] for label in labels if label in self.exact_labels]] = True
+        common = self.label_bits[indices] & np.packbits(reference)
+        return np.take(_POPCOUNT, common).sum(axis=1, dtype=np.int64)
+
+    def text_candidates(self, query_lower: str) -> Optional[np.ndarray]:
+        """
+        Índices que contienen todos los trigramas de la consulta (superconjunto de
+        los que la contienen como substring); None si es muy corta para el índice
+        """
+        if len(query_lower) < 3:
+            return None
+        grams = {query_lower[j:j + 3] for j in range(len(query_lower) - 2)}
+        lists = sorted((self.trigrams.get(gram) for gram in grams), key=lambda ids: 0 if ids is None else ids.size)
+        if lists[0] is None:
+            return np.empty(0, dtype=np.int32)
+        candidates = lists[0]
+        for ids in lists[1:]:
+            candidates = np.intersect1d(candidates, ids, assume_unique=True)
+            if candidates.size == 0:
+                break
+        return candidates
 
 
 class ProductService:
     """Servicio para gestión de productos con soporte de DB y cache"""
 
+    # Productos por lote al recorrer el catálogo con iter_product_batches
+    STREAM_BATCH_SIZE = 1000
+    # Productos por fragmento al transmitir arrays JSON con iter_products_json
+    JSON_CHUNK_SIZE = 500
+    # Consultas (id, limit) de get_similar_products recordadas para el catálogo JSON
+    SIMILAR_CACHE_SIZE = 1024
+
     def __init__(self, dataset_path: str = "data/products_dataset.json", use_db: bool = True):
         self.dataset_path = dataset_path
         self.products: List[Product] = []
@@ -28,6 +158,19 @@ class ProductService:
         self.substitution_engine = IntelligentSubstitutionEngine(self.scorer)
         self.use_db = use_db
         self._db_available = False
+        # Productos del catálogo JSON ya serializados (id -> producto, dict, bytes JSON)
+        self._serialized: Dict[str, Tuple[Product, dict, bytes]] = {}
+        # Columnas e índices del catálogo JSON (se arman al primer uso)
+        self._columns: Optional[_CatalogColumns] = None
+        # Ranking completo por sostenibilidad del catálogo JSON, por categoría (None = todas)
+        self._rankings: Dict[Optional[str], List[Tuple[Product, SustainabilityScore]]] = {}
+        self._rankings_for: Optional[List[Product]] = None
+        # ETag del catálogo JSON y la lista de productos para la que se calculó
+        self._etag: Optional[str] = None
+        self._etag_for: Optional[List[Product]] = None
+        # Memo LRU de productos similares, válido para unas columnas del catálogo JSON
+        self._similar: Optional[Callable[[str, int], Tuple[Product, ...]]] = None
+        self._similar_for: Optional[_CatalogColumns] = None
 
         # Try to use database, fallback to JSON
         if use_db:
@@ -40,7 +183,7 @@ class ProductService:
         """Check if database is available"""
         try:
             db = SessionLocal()
-            db.execute("SELECT 1")
+            db.execute(text("SELECT 1"))
             count = db.query(ProductDB).count()
             db.close()
             if count > 0:
@@ -65,6 +208,10 @@ class ProductService:
                 with open(path, "r", encoding="utf-8") as f:
                     data = json.load(f)
                     self.products = [Product(**p) for p in data.get("products", [])]
+                self._serialized = {}
+                for p in self.products:
+                    data = p.model_dump(mode="json")
+                    self._serialized[p.id] = (p, data, orjson.dumps(data))
                 print(f"Loaded {len(self.products)} products from JSON")
             else:
                 print(f"Dataset not found at {path}, using empty product list")
@@ -72,13 +219,58 @@ class ProductService:
             print(f"Error loading products: {e}")
             self.products = []
 
+    def product_json(self, product: Product) -> bytes:
+        """JSON de un producto; los del catálogo JSON se serializan una sola vez"""
+        entry = self._serialized.get(product.id)
+        if entry is not None and entry[0] is product:
+            return entry[2]
+        return orjson.dumps(product.model_dump(mode="json"))
+
+    def product_dict(self, product: Product) -> dict:
+        """
+        Dict (modo json) de un producto para respuestas; los del catálogo JSON se vuelcan
+        una sola vez (compartido entre respuestas: no modificar)
+        """
+        entry = self._serialized.get(product.id)
+        if entry is not None and entry[0] is product:
+            return entry[1]
+        return product.model_dump(mode="json")
+
+    def catalog_etag(self) -> Optional[str]:
+        """
+        ETag del contenido del catálogo JSON, recalculado solo si cambia la lista de
+        productos; None con base de datos (otros workers pueden modificar el catálogo)
+        """
+        if self._db_available:
+            return None
+        if self._etag_for is not self.products:
+            digest = cache_service.hash_bytes(b"".join([self.product_json(p) for p in self.products]))
+            self._etag = f'W/"{digest}"'
+            self._etag_for = self.products
+        return self._etag
+
+    def products_json(self, products: List[Product]) -> bytes:
+        """Array JSON de productos, armado concatenando el JSON de cada uno"""
+        return b"[" + b",".join([self.product_json(p) for p in products]) + b"]"
+
+    def iter_products_json(self, products: List[Product]) -> Iterator[bytes]:
+        """Array JSON de productos en fragmentos, para respuestas en streaming"""
+        if not products:
+            yield b"[]"
+            return
+        size = self.JSON_CHUNK_SIZE
+        for start in range(0, len(products), size):
+            chunk = b",".join([self.product_json(p) for p in products[start:start + size]])
+            yield (b"," if start else b"[") + chunk
+        yield b"]"
+
     def _get_db(self):
         """Get database session"""
         return SessionLocal()
 
     def _product_db_to_model(self, product_db: ProductDB) -> Product:
         """Convert database model to Pydantic model"""
-        return Product(**product_db.to_dict())
+        return Product.model_validate(product_db)
 
     def get_all_products(self) -> List[Product]:
         """Obtiene todos los productos"""
@@ -90,10 +282,9 @@ class ProductService:
         if self._db_available:
             db = self._get_db()
             try:
-                products_db = db.query(ProductDB).all()
-                products = [self._product_db_to_model(p) for p in products_db]
+                products = [Product.model_validate(row) for row in list_products(db)]
                 # Cache results
-                cache_service.cache_category_products("all", [p.dict() for p in products])
+                cache_service.cache_category_products("all", [p.model_dump(mode="json") for p in products])
                 return products
             finally:
                 db.close()
@@ -114,16 +305,36 @@ class ProductService:
                 if product_db:
                     product = self._product_db_to_model(product_db)
                     # Cache result
-                    cache_service.cache_product(product_id, product.dict())
+                    cache_service.cache_product(product_id, product.model_dump(mode="json"))
                     return product
                 return None
             finally:
                 db.close()
 
-        for product in self.products:
-            if product.id == product_id:
-                return product
-        return None
+        return self._catalog_columns().by_id.get(product_id)
+
+    def get_products_by_ids(self, product_ids: List[str]) -> List[Optional[Product]]:
+        """Busca varios productos por ID (None si no existe), en el orden recibido"""
+        # Una sola ida a Redis para todos los IDs
+        cached = cache_service.get_cached_products(product_ids)
+        found = {pid: Product(**data) for pid, data in zip(product_ids, cached) if data}
+
+        missing = [pid for pid in dict.fromkeys(product_ids) if pid not in found]
+        if missing:
+            if self._db_available:
+                db = self._get_db()
+                try:
+                    rows = db.query(ProductDB).filter(ProductDB.id.in_(missing)).all()
+                    loaded = {row.id: self._product_db_to_model(row) for row in rows}
+                finally:
+                    db.close()
+                cache_service.cache_products({pid: p.model_dump(mode="json") for pid, p in loaded.items()})
+            else:
+                by_id = self._catalog_columns().by_id
+                loaded = {pid: by_id[pid] for pid in missing if pid in by_id}
+            found.update(loaded)
+
+        return [found.get(pid) for pid in product_ids]
 
     def get_product_by_barcode(self, barcode: str) -> Optional[Product]:
         """Busca un producto por código de barras"""
@@ -137,10 +348,7 @@ class ProductService:
             finally:
                 db.close()
 
-        for product in self.products:
-            if product.barcode == barcode:
-                return product
-        return None
+        return self._catalog_columns().by_barcode.get(barcode)
 
     def search_products(
         self,
@@ -166,9 +374,7 @@ class ProductService:
             Lista de productos que coinciden
         """
         # Create cache key from search parameters
-        cache_key = hashlib.md5(
-            f"{query}:{category}:{min_price}:{max_price}:{labels}:{store}".encode()
-        ).hexdigest()
+        cache_key = cache_service.hash_key([query, category, min_price, max_price, labels, store])
 
         # Try cache first
         cached = cache_service.get_cached_search(cache_key)
@@ -180,12 +386,12 @@ class ProductService:
         if self._db_available:
             db = self._get_db()
             try:
-                query_builder = db.query(ProductDB)
+                criteria = []
 
                 # Apply filters
                 if query:
                     query_lower = f"%{query.lower()}%"
-                    query_builder = query_builder.filter(
+                    criteria.append(
                         or_(
                             ProductDB.name.ilike(query_lower),
                             ProductDB.description.ilike(query_lower),
@@ -194,23 +400,18 @@ class ProductService:
                     )
 
                 if category:
-                    query_builder = query_builder.filter(
-                        ProductDB.category.ilike(category)
-                    )
+                    criteria.append(ProductDB.category.ilike(category))
 
                 if min_price is not None:
-                    query_builder = query_builder.filter(ProductDB.price >= min_price)
+                    criteria.append(ProductDB.price >= min_price)
 
                 if max_price is not None:
-                    query_builder = query_builder.filter(ProductDB.price <= max_price)
+                    criteria.append(ProductDB.price <= max_price)
 
                 if store:
-                    query_builder = query_builder.filter(
-                        ProductDB.store.ilike(f"%{store}%")
-                    )
+                    criteria.append(ProductDB.store.ilike(f"%{store}%"))
 
-                products_db = query_builder.all()
-                results = [self._product_db_to_model(p) for p in products_db]
+                results = [Product.model_validate(row) for row in list_products(db, *criteria)]
 
                 # Filter by labels (JSON field, filter in Python)
                 if labels:
@@ -226,45 +427,84 @@ class ProductService:
                 db.close()
         else:
             # Use in-memory products
-            results = self.products.copy()
-
-            if query:
-                query_lower = query.lower()
-                results = [
-                    p for p in results
-                    if query_lower in p.name.lower()
-                    or (p.description and query_lower in p.description.lower())
-                    or (p.brand and query_lower in p.brand.lower())
-                ]
-
-            if category:
-                results = [p for p in results if p.category.lower() == category.lower()]
-
-            if min_price is not None:
-                results = [p for p in results if p.price >= min_price]
-            if max_price is not None:
-                results = [p for p in results if p.price <= max_price]
-
-            if labels:
-                results = [
-                    p for p in results
-                    if p.labels and any(
-                        label.lower() in [l.lower() for l in p.labels]
-                        for label in labels
-                    )
-                ]
-
-            if store:
-                results = [
-                    p for p in results
-                    if p.store and store.lower() in p.store.lower()
-                ]
+            results = self._search_in_memory(query, category, min_price, max_price, labels, store)
 
         # Cache results
-        cache_service.cache_search_results(cache_key, [p.dict() for p in results])
+        cache_service.cache_search_results(cache_key, [self.product_dict(p) for p in results])
 
         return results
 
+    def _catalog_columns(self) -> _CatalogColumns:
+        """Columnas e índices del catálogo JSON (se rearman si cambia la lista)"""
+        columns = self._columns
+        if columns is None or columns.products is not self.products:
+            columns = self._columns = _CatalogColumns.build(self.products)
+        return columns
+
+    def warmup(self) -> None:
+        """
+        Arma de antemano lo que el catálogo JSON construye al primer uso: columnas,
+        índice de trigramas y ranking de sostenibilidad (los kernels Numba ya se
+        compilan al importarse)
+        """
+        if self._db_available:
+            return
+        self._catalog_columns()
+        self.get_top_sustainable()
+
+    def _search_in_memory(
+        self,
+        query: str,
+        category: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        labels: Optional[List[str]],
+        store: Optional[str],
+    ) -> List[Product]:
+        """Filtros de search_products sobre el catálogo JSON como una sola máscara"""
+        columns = self._catalog_columns()
+
+        mask = np.ones(len(columns.products), dtype=bool)
+
+        # Texto libre: el índice de trigramas descarta de entrada los que no pueden contenerlo
+        query_lower = query.lower() if query else ""
+        candidates = columns.text_candidates(query_lower) if query_lower else None
+        if candidates is not None:
+            mask[:] = False
+            mask[candidates] = True
+
+        if category:
+            mask &= columns.category_codes == columns.categories.get(category.lower(), -1)
+
+        if min_price is not None:
+            mask &= columns.prices >= min_price
+        if max_price is not None:
+            mask &= columns.prices <= max_price
+
+        if labels:
+            # Basta con una de las labels pedidas
+            wanted = [columns.labels[label.lower()] for label in labels if label.lower() in columns.labels]
+            mask &= columns.label_matrix[:, wanted].any(axis=1)
+
+        if store:
+            store_lower = store.lower()
+            matching = [code for code, name in enumerate(columns.stores) if store_lower in name]
+            mask &= np.isin(columns.store_codes, matching)
+
+        indices = np.flatnonzero(mask).tolist()
+
+        # Confirmar el substring solo sobre los productos que pasaron los demás filtros
+        if query_lower:
+            names, descriptions, brands = columns.names_lc, columns.descriptions_lc, columns.brands_lc
+            indices = [
+                i for i in indices
+                if query_lower in names[i]
+                or (descriptions[i] and query_lower in descriptions[i])
+                or (brands[i] and query_lower in brands[i])
+            ]
+
+        return [columns.products[i] for i in indices]
+
     def get_products_by_category(self, category: str) -> List[Product]:
         """Obtiene todos los productos de una categoría"""
         # Try cache first
@@ -275,20 +515,114 @@ class ProductService:
         if self._db_available:
             db = self._get_db()
             try:
-                products_db = db.query(ProductDB).filter(
-                    ProductDB.category.ilike(category)
-                ).all()
-                products = [self._product_db_to_model(p) for p in products_db]
+                rows = list_products(db, ProductDB.category.ilike(category))
+                products = [Product.model_validate(row) for row in rows]
                 # Cache results
-                cache_service.cache_category_products(category, [p.dict() for p in products])
+                cache_service.cache_category_products(category, [p.model_dump(mode="json") for p in products])
                 return products
             finally:
                 db.close()
 
-        products = [p for p in self.products if p.category.lower() == category.lower()]
-        cache_service.cache_category_products(category, [p.dict() for p in products])
+        # Copia: quien llama puede modificar la lista
+        products = list(self._catalog_columns().by_category.get(category.lower(), ()))
+        cache_service.cache_category_products(category, [self.product_dict(p) for p in products])
         return products
 
+    def iter_product_batches(self, category: Optional[str] = None) -> Iterator[List[Product]]:
+        """
+        Recorre el catálogo (o una categoría) en lotes de STREAM_BATCH_SIZE productos
+
+        Para agregaciones que no necesitan la lista completa: sin cache, la base de
+        datos se lee con un cursor del servidor en vez de materializar todas las filas.
+        """
+        cached = cache_service.get_cached_category(category or "all")
+        if cached:
+            products = [Product(**p) for p in cached]
+        elif self._db_available:
+            criteria = [ProductDB.category.ilike(category)] if category else []
+            db = self._get_db()
+            try:
+                for rows in stream_products(db, *criteria, batch_size=self.STREAM_BATCH_SIZE):
+                    yield [Product.model_validate(row) for row in rows]
+            finally:
+                db.close()
+            return
+        elif category:
+            products = [p for p in self.products if p.category.lower() == category.lower()]
+        else:
+            products = self.products
+
+        for start in range(0, len(products), self.STREAM_BATCH_SIZE):
+            yield products[start:start + self.STREAM_BATCH_SIZE]
+
+    def get_similar_products(self, product: Product, limit: int = 5) -> List[Product]:
+        """
+        Productos de la misma categoría, primero los que comparten más labels
+
+        Los empates (y todos, si el producto no tiene labels) siguen el orden del catálogo.
+        """
+        if self._db_available:
+            similar = [p for p in self.get_products_by_category(product.category) if p.id != product.id]
+            if product.labels:
+                labels = set(product.labels)
+                similar.sort(key=lambda p: len(labels.intersection(p.labels or ())), reverse=True)
+            return similar[:limit]
+
+        columns = self._catalog_columns()
+        if product.id not in columns.by_id:
+            return self._similar_in_memory(columns, product, limit)
+        if self._similar_for is not columns:
+            # Catálogo nuevo: se descarta el memo anterior
+            self._similar = lru_cache(maxsize=self.SIMILAR_CACHE_SIZE)(
+                partial(self._memo_similar, columns)
+            )
+            self._similar_for = columns
+        return list(self._similar(product.id, limit))
+
+    def _memo_similar(self, columns: _CatalogColumns, product_id: str, limit: int) -> Tuple[Product, ...]:
+        return tuple(self._similar_in_memory(columns, columns.by_id[product_id], limit))
+
+    def _similar_in_memory(self, columns: _CatalogColumns, product: Product, limit: int) -> List[Product]:
+        """get_similar_products sobre las columnas del catálogo JSON"""
+        code = columns.categories.get(product.category.lower(), -1)
+        indices = np.flatnonzero(columns.category_codes == code)
+        indices = indices[[columns.products[i].id != product.id for i in indices.tolist()]]
+        if product.labels:
+            # Orden estable: a igual cantidad de labels comunes se mantiene el del catálogo
+            overlap = columns.label_overlap(product.labels, indices)
+            indices = indices[np.argsort(-overlap, kind="stable")]
+        return [columns.products[i] for i in indices[:limit].tolist()]
+
+    def get_top_sustainable(
+        self, category: Optional[str] = None, limit: int = 10
+    ) -> List[Tuple[Product, SustainabilityScore]]:
+        """
+        Los `limit` productos con mejor score de sostenibilidad (de una categoría si se indica)
+
+        Con el catálogo JSON el ranking completo se calcula una vez por categoría y
+        cada consulta solo lo corta; con base de datos se recorre el catálogo en lotes.
+        """
+        if self._db_available:
+            top: List[Tuple[Product, SustainabilityScore]] = []
+            for batch in self.iter_product_batches(category):
+                # Los mejores hasta ahora van primero: los empates conservan el orden del catálogo
+                top = self.scorer.rank_products_topk([p for p, _ in top] + batch, limit)
+            return top
+
+        if self._rankings_for is not self.products:
+            self._rankings = {}
+            self._rankings_for = self.products
+        key = category.lower() if category else None
+        ranked = self._rankings.get(key)
+        if ranked is None:
+            products = self.products if key is None else [
+                p for p in self.products if p.category.lower() == key
+            ]
+            ranked = self.scorer.rank_products(products)
+            if ranked:  # Categorías inexistentes no se guardan
+                self._rankings[key] = ranked
+        return ranked[:limit]
+
     def get_categories(self) -> List[str]:
         """Obtiene lista de todas las categorías disponibles"""
         if self._db_available:
@@ -302,6 +636,61 @@ class ProductService:
         categories = set(p.category for p in self.products)
         return sorted(list(categories))
 
+    def get_catalog_stats(self) -> Dict:
+        """
+        Estadísticas agregadas del catálogo (conteos, precios y labels)
+
+        Con base de datos se leen de la vista materializada product_stats_mv;
+        si la vista no existe se calculan en una consulta agrupada por categoría.
+        """
+        if self._db_available:
+            db = self._get_db()
+            try:
+                rows = read_stats_rows(db)
+            except Exception as e:
+                print(f"Stats view not available, aggregating products: {e}")
+                db.rollback()
+                # Labels organic/local leídas del bitmask label_flags (sin parsear JSONB)
+                flags = ProductDB.label_flags
+                rows = db.query(
+                    ProductDB.category,
+                    func.count(ProductDB.id),
+                    func.sum(ProductDB.price),
+                    func.min(ProductDB.price),
+                    func.max(ProductDB.price),
+                    func.count(ProductDB.id).filter(flags.op("&")(ORGANIC_FLAG) != 0),
+                    func.count(ProductDB.id).filter(flags.op("&")(LOCAL_FLAG) != 0),
+                ).group_by(ProductDB.category).all()
+            finally:
+                db.close()
+        else:
+            groups: Dict[str, list] = {}
+            for p in self.products:
+                labels = {label.lower() for label in p.labels} if p.labels else set()
+                group = groups.get(p.category)
+                if group is None:
+                    groups[p.category] = [p.category, 1, p.price, p.price, p.price,
+                                          int("organic" in labels), int("local" in labels)]
+                else:
+                    group[1] += 1
+                    group[2] += p.price
+                    group[3] = min(group[3], p.price)
+                    group[4] = max(group[4], p.price)
+                    group[5] += "organic" in labels
+                    group[6] += "local" in labels
+            rows = list(groups.values())
+
+        total = sum(row[1] for row in rows)
+        return {
+            "total_products": total,
+            "categories": {row[0]: row[1] for row in sorted(rows, key=lambda row: row[0])},
+            "average_price": sum(row[2] for row in rows) / total if total else 0,
+            "min_price": min((row[3] for row in rows), default=0),
+            "max_price": max((row[4] for row in rows), default=0),
+            "organic": sum(row[5] for row in rows),
+            "local": sum(row[6] for row in rows),
+        }
+
     def analyze_product(self, product_id: str) -> Optional[ProductAnalysis]:
         """
         Analiza un producto completo con sostenibilidad y alternativas
@@ -315,9 +704,16 @@ class ProductService:
 
         # Calcular sustainability score
         sustainability = self.scorer.calculate_score(product)
+        return self._analyze(product, sustainability, self.get_products_by_category(product.category))
 
+    def _analyze(
+        self,
+        product: Product,
+        sustainability: SustainabilityScore,
+        category_products: List[Product],
+    ) -> ProductAnalysis:
+        """Arma el análisis de un producto con su score y los productos de su categoría"""
         # Encontrar alternativas de la misma categoría
-        category_products = self.get_products_by_category(product.category)
         alternatives = [p for p in category_products if p.id != product.id][:5]
 
         # Calcular potencial de ahorro (vs más caro de categoría)
@@ -367,24 +763,31 @@ class ProductService:
 
     def compare_products(self, product_ids: List[str]) -> Dict:
         """Compara múltiples productos"""
-        products = [self.get_product_by_id(pid) for pid in product_ids]
+        products = self.get_products_by_ids(product_ids)
         products = [p for p in products if p is not None]
 
         if len(products) < 2:
             return {"error": "Need at least 2 products to compare"}
 
-        # Analizar cada producto
-        analyses = [self.analyze_product(p.id) for p in products]
-
-        # Encontrar mejor en cada dimensión
-        best_price = min(products, key=lambda p: p.price)
-
-        scored_products = [(p, self.scorer.calculate_score(p)) for p in products]
-        best_sustainability = max(scored_products, key=lambda x: x[1].overall_score)[0]
-        best_health = max(scored_products, key=lambda x: x[1].health_score)[0]
+        # Scores en lote; cada categoría se consulta una sola vez
+        scores = self.scorer.calculate_scores_batch(products)
+        by_category: Dict[str, List[Product]] = {}
+        for p in products:
+            if p.category not in by_category:
+                by_category[p.category] = self.get_products_by_category(p.category)
+        analyses = [self._analyze(p, s, by_category[p.category]) for p, s in zip(products, scores)]
+
+        # Encontrar mejor en cada dimensión (argmin/argmax: primero en caso de empate)
+        n = len(products)
+        prices = np.fromiter((p.price for p in products), dtype=np.float64, count=n)
+        overall = np.fromiter((s.overall_score for s in scores), dtype=np.float64, count=n)
+        health = np.fromiter((s.health_score for s in scores), dtype=np.float64, count=n)
+        best_price = products[int(prices.argmin())]
+        best_sustainability = products[int(overall.argmax())]
+        best_health = products[int(health.argmax())]
 
         return {
-            "products": [a.dict() for a in analyses if a],
+            "products": [a.model_dump(mode="json") for a in analyses],
             "best_price": {"id": best_price.id, "name": best_price.name, "price": best_price.price},
             "best_sustainability": {
                 "id": best_sustainability.id,
@@ -427,7 +830,7 @@ class ProductService:
             product, category_products, focus=focus, max_suggestions=max_results
         )
 
-        return [s.dict() for s in suggestions]
+        return [s.model_dump(mode="json") for s in suggestions]
 
     def add_product(self, product_data: dict) -> Optional[Product]:
         """Add a new product to the database"""
@@ -501,3 +904,18 @@ class ProductService:
             return False
         finally:
             db.close()
+
+
+# Instancia compartida por las rutas (ver get_product_service)
+_shared_service: Optional[ProductService] = None
+_shared_lock = threading.Lock()
+
+
+def get_product_service() -> ProductService:
+    """ProductService compartido: el catálogo se carga una sola vez por proceso"""
+    global _shared_service
+    if _shared_service is None:
+        with _shared_lock:
+            if _shared_service is None:
+                _shared_service = ProductService()
+    return _shared_service
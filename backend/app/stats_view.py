@@ -0,0 +1,145 @@
+"""
+Materialized view with per-category catalog aggregates for /api/stats
+
+Commits that touch products wake a background thread that refreshes the view,
+at most once every STATS_REFRESH_INTERVAL seconds across workers; a skipped
+refresh is left pending and retried once the interval has passed. Requests
+never run the refresh themselves.
+"""
+
+import logging
+import threading
+from typing import Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from .cache import cache_service
+from .database import engine
+from .db_models import ProductDB
+
+logger = logging.getLogger(__name__)
+
+STATS_VIEW = "product_stats_mv"
+STATS_REFRESH_INTERVAL = 30  # seconds
+
+_REFRESH_LOCK_KEY = "lock:product_stats_refresh"
+_REFRESH_PENDING_KEY = "stats:refresh_pending"
+_SESSION_FLAG = "product_stats_dirty"
+
+CREATE_STATS_VIEW_SQL = f"""
+CREATE MATERIALIZED VIEW IF NOT EXISTS {STATS_VIEW} AS
+SELECT
+    category,
+    count(*) AS product_count,
+    sum(price) AS price_sum,
+    min(price) AS price_min,
+    max(price) AS price_max,
+    count(*) FILTER (WHERE label_flags & 1 <> 0) AS organic_count,  -- ORGANIC_FLAG
+    count(*) FILTER (WHERE label_flags & 2 <> 0) AS local_count     -- LOCAL_FLAG
+FROM products
+GROUP BY category
+"""
+
+# REFRESH ... CONCURRENTLY needs a unique index on the view
+CREATE_STATS_VIEW_INDEX_SQL = (
+    f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{STATS_VIEW}_category ON {STATS_VIEW} (category)"
+)
+
+
+def create_stats_view(conn) -> None:
+    """Create the stats view and its unique index if missing"""
+    conn.execute(text(CREATE_STATS_VIEW_SQL))
+    conn.execute(text(CREATE_STATS_VIEW_INDEX_SQL))
+
+
+def read_stats_rows(db) -> list:
+    """Per-category rows (category, count, price sum, min, max, organic, local)"""
+    # A refresh left pending by another worker is handed to this one's refresher
+    if cache_service.get(_REFRESH_PENDING_KEY):
+        request_stats_refresh()
+    result = db.execute(text(
+        f"SELECT category, product_count, price_sum, price_min, price_max, "
+        f"organic_count, local_count FROM {STATS_VIEW}"
+    ))
+    return [tuple(row) for row in result]
+
+
+def refresh_stats_view(force: bool = False) -> bool:
+    """Refresh the view unless another refresh ran in the last interval"""
+    if not force and not cache_service.try_lock(_REFRESH_LOCK_KEY, STATS_REFRESH_INTERVAL):
+        cache_service.set(_REFRESH_PENDING_KEY, True, cache_service.DEFAULT_TTL)
+        return False
+    cache_service.delete(_REFRESH_PENDING_KEY)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {STATS_VIEW}"))
+        return True
+    except Exception as e:
+        logger.warning("Stats view refresh failed: %s", e)
+        return False
+
+
+_refresh_requested = threading.Event()
+_refresher: Optional[threading.Thread] = None
+_refresher_lock = threading.Lock()
+
+
+def request_stats_refresh() -> None:
+    """Ask the background refresher to rebuild the view; returns immediately"""
+    global _refresher
+    # Started lazily so each forked worker runs its own thread
+    if _refresher is None or not _refresher.is_alive():
+        with _refresher_lock:
+            if _refresher is None or not _refresher.is_alive():
+                _refresher = threading.Thread(
+                    target=_refresh_loop, name="stats-view-refresher", daemon=True
+                )
+                _refresher.start()
+    _refresh_requested.set()
+
+
+def _refresh_step(requested: bool) -> bool:
+    """Run one refresh attempt; True while a skipped refresh is still pending"""
+    if requested or cache_service.get(_REFRESH_PENDING_KEY):
+        refresh_stats_view()
+    return bool(cache_service.get(_REFRESH_PENDING_KEY))
+
+
+def _refresh_loop() -> None:
+    retry = False
+    while True:
+        # Sleep until asked, or until the lock window of a skipped refresh expires
+        requested = _refresh_requested.wait(STATS_REFRESH_INTERVAL if retry else None)
+        _refresh_requested.clear()
+        try:
+            retry = _refresh_step(requested)
+        except Exception as e:
+            logger.warning("Stats view refresher error: %s", e)
+            retry = True
+
+
+def _mark_stats_dirty(mapper, connection, target) -> None:
+    session = Session.object_session(target)
+    if session is not None:
+        session.info[_SESSION_FLAG] = True
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(ProductDB, _event_name, _mark_stats_dirty)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_writes(orm_execute_state) -> None:
+    # query(...).delete()/update() and insert() statements skip the mapper events
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ is ProductDB:
+        orm_execute_state.session.info[_SESSION_FLAG] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _refresh_after_commit(session) -> None:
+    if session.info.pop(_SESSION_FLAG, False):
+        request_stats_refresh()
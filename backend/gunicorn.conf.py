@@ -0,0 +1,24 @@
+"""
+Gunicorn configuration for production: uvicorn workers (uvloop + httptools)
+
+    gunicorn -c gunicorn.conf.py app.main:app
+"""
+
+import os
+
+bind = f"{os.getenv('API_HOST', '0.0.0.0')}:{os.getenv('API_PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+# UvicornWorker picks uvloop and httptools when installed (uvicorn[standard])
+worker_class = "uvicorn.workers.UvicornWorker"
+backlog = 2048
+keepalive = 15  # timeout_keep_alive of each uvicorn worker
+# Import the app once in the master so workers share it copy-on-write
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Connections opened while importing the app belong to the master process
+    from app.database import async_engine, engine
+    engine.dispose(close=False)
+    if async_engine is not None:
+        async_engine.sync_engine.dispose(close=False)
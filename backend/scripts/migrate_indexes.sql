@@ -0,0 +1,14 @@
+-- LiquiVerde: product indexes matching the API query predicates
+-- Run once on databases created before these indexes were added:
+--   psql -U liquiverde -d liquiverde -f scripts/migrate_indexes.sql
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_prod_cat_stock_price
+    ON products (category, in_stock, price) INCLUDE (id, name, brand);
+
+CREATE INDEX IF NOT EXISTS idx_prod_name_trgm
+    ON products USING gin (name gin_trgm_ops);
+
+-- Superseded by the trigram index
+DROP INDEX IF EXISTS idx_product_name_search;
@@ -0,0 +1,19 @@
+-- LiquiVerde: migrate product JSON columns to JSONB and add GIN indexes
+-- Run once on databases created before the JSONB change:
+--   psql -U liquiverde -d liquiverde -f scripts/migrate_jsonb.sql
+
+BEGIN;
+
+ALTER TABLE products
+    ALTER COLUMN nutrition TYPE jsonb USING nutrition::jsonb,
+    ALTER COLUMN sustainability TYPE jsonb USING sustainability::jsonb,
+    ALTER COLUMN ingredients TYPE jsonb USING ingredients::jsonb,
+    ALTER COLUMN allergens TYPE jsonb USING allergens::jsonb,
+    ALTER COLUMN labels TYPE jsonb USING labels::jsonb,
+    ALTER COLUMN stock_location TYPE jsonb USING stock_location::jsonb;
+
+CREATE INDEX IF NOT EXISTS idx_product_labels_gin ON products USING gin (labels);
+CREATE INDEX IF NOT EXISTS idx_product_allergens_gin ON products USING gin (allergens);
+CREATE INDEX IF NOT EXISTS idx_product_stock_location_gin ON products USING gin (stock_location);
+
+COMMIT;
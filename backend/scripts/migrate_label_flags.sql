@@ -0,0 +1,23 @@
+-- LiquiVerde: label_flags bitmask column (organic = 1, local = 2, fair trade = 4)
+-- Run once on databases created before the column was added:
+--   psql -U liquiverde -d liquiverde -f scripts/migrate_label_flags.sql
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS label_flags SMALLINT NOT NULL DEFAULT 0;
+
+UPDATE products p
+SET label_flags = coalesce((
+    SELECT bit_or(CASE lower(l)
+                      WHEN 'organic' THEN 1
+                      WHEN 'local' THEN 2
+                      WHEN 'fair trade' THEN 4
+                      ELSE 0
+                  END)
+    FROM jsonb_array_elements_text(p.labels) AS l
+), 0)
+WHERE jsonb_typeof(p.labels) = 'array';
+
+CREATE INDEX IF NOT EXISTS idx_label_flags ON products (label_flags);
+
+-- The stats view now counts organic/local from label_flags
+DROP MATERIALIZED VIEW IF EXISTS product_stats_mv;
+\ir migrate_stats_view.sql
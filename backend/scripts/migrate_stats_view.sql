@@ -0,0 +1,18 @@
+-- LiquiVerde: materialized view backing /api/stats
+-- Run once on databases created before the view was added:
+--   psql -U liquiverde -d liquiverde -f scripts/migrate_stats_view.sql
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS product_stats_mv AS
+SELECT
+    category,
+    count(*) AS product_count,
+    sum(price) AS price_sum,
+    min(price) AS price_min,
+    max(price) AS price_max,
+    count(*) FILTER (WHERE label_flags & 1 <> 0) AS organic_count,  -- ORGANIC_FLAG
+    count(*) FILTER (WHERE label_flags & 2 <> 0) AS local_count     -- LOCAL_FLAG
+FROM products
+GROUP BY category;
+
+-- Required by REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_product_stats_mv_category ON product_stats_mv (category);
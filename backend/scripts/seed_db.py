@@ -9,6 +9,7 @@ from pathlib import Path
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from app.bulk import bulk_upsert_products
 from app.database import SessionLocal, init_db
 from app.db_models import ProductDB, CategoryDB, StoreDB
 
@@ -47,6 +48,7 @@ def seed_database(json_path: str = "data/products_dataset.json"):
         categories = {}
 
         # Insert products
+        rows = []
         for product_data in products_data:
             # Get or create category
             category_name = product_data.get("category", "Other")
@@ -56,29 +58,31 @@ def seed_database(json_path: str = "data/products_dataset.json"):
                 db.flush()
                 categories[category_name] = category.id
 
-            # Create product
-            product = ProductDB(
-                id=product_data["id"],
-                barcode=product_data.get("barcode"),
-                name=product_data["name"],
-                brand=product_data.get("brand"),
-                category=category_name,
-                category_id=categories[category_name],
-                price=product_data["price"],
-                unit=product_data.get("unit", "unit"),
-                quantity=product_data.get("quantity", 1.0),
-                store=product_data.get("store"),
-                nutrition=product_data.get("nutrition"),
-                sustainability=product_data.get("sustainability"),
-                description=product_data.get("description"),
-                ingredients=product_data.get("ingredients"),
-                allergens=product_data.get("allergens"),
-                labels=product_data.get("labels"),
-                in_stock=product_data.get("in_stock", True),
-                stock_location=product_data.get("stock_location"),
-                image_url=product_data.get("image_url"),
-            )
-            db.add(product)
+            rows.append({
+                "id": product_data["id"],
+                "barcode": product_data.get("barcode"),
+                "name": product_data["name"],
+                "brand": product_data.get("brand"),
+                "category": category_name,
+                "category_id": categories[category_name],
+                "price": product_data["price"],
+                "unit": product_data.get("unit", "unit"),
+                "quantity": product_data.get("quantity", 1.0),
+                "store": product_data.get("store"),
+                "nutrition": product_data.get("nutrition"),
+                "sustainability": product_data.get("sustainability"),
+                "description": product_data.get("description"),
+                "ingredients": product_data.get("ingredients"),
+                "allergens": product_data.get("allergens"),
+                "labels": product_data.get("labels"),
+                "in_stock": product_data.get("in_stock", True),
+                "stock_location": product_data.get("stock_location"),
+                "image_url": product_data.get("image_url"),
+            })
+
+        # Categories must exist before the products that reference them
+        db.commit()
+        bulk_upsert_products(rows)
 
         # Add sample stores
         stores = [
@@ -66,6 +66,36 @@ class TestStatsEndpoint:
         assert "categories" in data
         assert isinstance(data["categories"], dict)
 
+    def test_stats_etag_not_modified(self):
+        """Test stats responses carry an ETag and a matching If-None-Match gets 304"""
+        response = client.get("/api/stats")
+        etag = response.headers.get("etag")
+
+        assert etag
+        revalidated = client.get("/api/stats", headers={"If-None-Match": etag})
+        assert revalidated.status_code == 304
+        assert revalidated.headers["etag"] == etag
+        assert revalidated.content == b""
+
+    def test_catalog_etag_not_modified(self):
+        """Test catalog listings are cacheable and revalidate with 304"""
+        response = client.get("/api/products/catalog")
+        etag = response.headers.get("etag")
+
+        assert response.status_code == 200
+        assert etag
+        assert "max-age" in response.headers["cache-control"]
+        revalidated = client.get("/api/products/catalog", headers={"If-None-Match": etag})
+        assert revalidated.status_code == 304
+        assert revalidated.content == b""
+
+    def test_product_list_gzip(self):
+        """Test large JSON responses are gzip-compressed when accepted"""
+        response = client.get("/api/products/", headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == 200
+        assert response.headers.get("content-encoding") == "gzip"
+
 
 class TestProductsEndpoints:
     """Test products API endpoints"""
@@ -81,6 +111,17 @@ class TestProductsEndpoints:
         assert isinstance(data["products"], list)
         assert data["count"] == 20  # Dataset has 20 products
 
+    def test_get_product_ids_only(self):
+        """Test expand=false returns only product IDs"""
+        full = client.get("/api/products/").json()
+        response = client.get("/api/products/", params={"expand": "false"})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert "products" not in data
+        assert data["count"] == full["count"]
+        assert data["ids"] == [p["id"] for p in full["products"]]
+
     def test_get_categories(self):
         """Test getting product categories"""
         response = client.get("/api/products/categories")
@@ -91,6 +132,27 @@ class TestProductsEndpoints:
         assert isinstance(data["categories"], list)
         assert len(data["categories"]) == 10  # Dataset has 10 categories
 
+    def test_cached_routes_honor_dependency_overrides(self):
+        """Test that cached routes get the product service through Depends"""
+        from app.services.product_service import get_product_service
+
+        class StubService:
+            def get_categories(self):
+                return ["stub"]
+
+            def get_top_sustainable(self, category, limit):
+                return []
+
+        app.dependency_overrides[get_product_service] = StubService
+        try:
+            categories = client.get("/api/products/categories").json()
+            top = client.get("/api/recommendations/top-sustainable").json()
+        finally:
+            app.dependency_overrides.clear()
+
+        assert categories == {"categories": ["stub"]}
+        assert top == {"products": [], "count": 0}
+
     def test_search_products(self):
         """Test product search"""
         response = client.get("/api/products/search", params={"q": "leche"})
@@ -174,6 +236,31 @@ class TestShoppingListEndpoints:
         data = response.json()
         assert "optimized_items" in data or "total_cost" in data
 
+    def test_optimize_metrics_rounded(self):
+        """Test summary metrics are returned rounded to 2 decimals"""
+        shopping_list = {
+            "items": [
+                {"product_name": "Leche", "category": "dairy", "quantity": 1, "priority": 1},
+                {"product_name": "Pan", "category": "bread", "quantity": 3, "priority": 2},
+                {"product_name": "Arroz", "category": "cereals", "quantity": 1, "priority": 2},
+            ],
+            "budget": 7000,
+            "optimize_for": "balanced"
+        }
+
+        for path, body in [
+            ("/api/shopping-list/optimize", shopping_list),
+            ("/api/shopping-list/quick-optimize", {"product_names": ["leche", "pan", "arroz"], "budget": 7000}),
+        ]:
+            response = client.post(path, json=body)
+
+            assert response.status_code == 200
+            data = response.json()
+            for key in ("total_cost", "estimated_savings", "budget_used_percentage", "optimization_score"):
+                assert data[key] == round(data[key], 2)
+            for item in data["optimized_items"]:
+                assert item["savings"] == round(item["savings"], 2)
+
     def test_quick_optimize(self):
         """Test quick optimization endpoint"""
         request_data = {
@@ -0,0 +1,140 @@
+"""
+Tests for bulk product upserts
+"""
+
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from app import bulk
+from app.database import engine, init_db
+
+
+def _row(product_id, price, labels, nutrition=None):
+    return {
+        "id": product_id,
+        "barcode": None,
+        "name": f"Producto {product_id}",
+        "brand": "TestBrand",
+        "category": "bulk_test",
+        "price": price,
+        "unit": "unit",
+        "quantity": 1.0,
+        "store": "Test Store",
+        "nutrition": nutrition,
+        "labels": labels,
+        "in_stock": True,
+    }
+
+
+class _RecordingConnection:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, stmt):
+        self.statements.append(stmt)
+
+
+class _RecordingEngine:
+    def __init__(self):
+        self.conn = _RecordingConnection()
+
+    @contextmanager
+    def begin(self):
+        yield self.conn
+
+
+class TestBulkUpsertStatement:
+    """Multi-VALUES ON CONFLICT path, checked on the compiled statement"""
+
+    @pytest.fixture
+    def recorded(self, monkeypatch):
+        recording = _RecordingEngine()
+        refreshes = []
+        monkeypatch.setattr(bulk, "engine", recording)
+        monkeypatch.setattr(bulk, "refresh_stats_view", lambda: refreshes.append(True))
+        return recording.conn, refreshes
+
+    def test_small_batch_uses_single_on_conflict_insert(self, recorded):
+        """Test that a small batch is one INSERT ... ON CONFLICT (id) DO UPDATE"""
+        conn, refreshes = recorded
+        rows = [_row("b1", 1000.0, ["Organic"]), _row("b2", 2000.0, None)]
+
+        assert bulk.bulk_upsert_products(rows) == 2
+        assert len(conn.statements) == 1
+        assert refreshes == [True]
+
+        sql = str(conn.statements[0].compile(dialect=postgresql.dialect()))
+        assert "ON CONFLICT (id) DO UPDATE SET" in sql
+        assert "price = excluded.price" in sql
+        assert "label_flags = excluded.label_flags" in sql
+        assert "updated_at = now()" in sql
+        assert "id = excluded.id" not in sql
+
+    def test_small_batch_computes_flags_and_null_json(self, recorded):
+        """Test that label_flags is derived from labels and None JSONB binds SQL NULL"""
+        conn, _ = recorded
+        bulk.bulk_upsert_products([_row("b1", 1000.0, ["Organic", "Local"])])
+
+        params = conn.statements[0].compile(dialect=postgresql.dialect()).params
+        assert params["label_flags_m0"] == 3
+        assert "nutrition_m0" not in params  # rendered as NULL literal, not JSON 'null'
+
+    def test_empty_batch_is_noop(self, recorded):
+        """Test that an empty batch touches neither the database nor the view"""
+        conn, refreshes = recorded
+        assert bulk.bulk_upsert_products([]) == 0
+        assert conn.statements == [] and refreshes == []
+
+
+def _postgres_available():
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+    except Exception:
+        return False
+
+
+@pytest.mark.skipif(not _postgres_available(), reason="PostgreSQL not available")
+class TestBulkUpsertPostgres:
+    """Upsert semantics against a real PostgreSQL database"""
+
+    IDS = ("bulk_test_1", "bulk_test_2")
+
+    @pytest.fixture(autouse=True)
+    def products_table(self, monkeypatch):
+        init_db()
+        monkeypatch.setattr(bulk, "refresh_stats_view", lambda: None)
+        yield
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM products WHERE id = ANY(:ids)"), {"ids": list(self.IDS)})
+
+    def _fetch(self):
+        with engine.connect() as conn:
+            result = conn.execute(
+                text(
+                    "SELECT id, price, labels, label_flags, nutrition IS NULL, updated_at "
+                    "FROM products WHERE id = ANY(:ids) ORDER BY id"
+                ),
+                {"ids": list(self.IDS)},
+            )
+            return {row[0]: row[1:] for row in result}
+
+    def test_upsert_inserts_then_updates(self):
+        """Test that a second batch updates existing rows by id and inserts new ones"""
+        bulk.bulk_upsert_products([_row(self.IDS[0], 1000.0, ["Organic"], {"proteins": 1.0})])
+        price, labels, flags, nutrition_null, updated_at = self._fetch()[self.IDS[0]]
+        assert (price, labels, flags, nutrition_null, updated_at) == (1000.0, ["Organic"], 1, False, None)
+
+        bulk.bulk_upsert_products([
+            _row(self.IDS[0], 1200.0, ["Local"]),
+            _row(self.IDS[1], 500.0, None),
+        ])
+        rows = self._fetch()
+        price, labels, flags, nutrition_null, updated_at = rows[self.IDS[0]]
+        assert (price, labels, flags, nutrition_null) == (1200.0, ["Local"], 2, True)
+        assert updated_at is not None
+        assert rows[self.IDS[1]][:4] == (500.0, None, 0, True)
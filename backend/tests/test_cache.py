@@ -0,0 +1,90 @@
+"""
+Tests for the cached decorator
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from app.cache import cache_service, cached
+
+
+class _ThreadRecordingRedis:
+    """In-memory Redis stand-in that records which thread ran each command"""
+
+    def __init__(self):
+        self.data = {}
+        self.threads = []
+
+    def ping(self):
+        self.threads.append(threading.get_ident())
+        return True
+
+    def get(self, key):
+        self.threads.append(threading.get_ident())
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.threads.append(threading.get_ident())
+        self.data[key] = value
+        return True
+
+
+class TestCachedDecorator:
+    """Test suite for the cached decorator"""
+
+    @pytest.fixture
+    def redis(self, monkeypatch):
+        fake = _ThreadRecordingRedis()
+        monkeypatch.setattr(cache_service, "client", fake)
+        monkeypatch.setattr(cache_service, "_checked_until", 0.0)
+        monkeypatch.setattr(cache_service, "_suspended_until", 0.0)
+        monkeypatch.setattr(cache_service, "_consecutive_failures", 0)
+        return fake
+
+    def test_async_wrapper_caches_off_event_loop(self, redis):
+        """Test that async endpoints reuse cached results without Redis calls on the loop thread"""
+        calls = []
+
+        @cached("test", ttl=60)
+        async def endpoint(value: int):
+            calls.append(value)
+            return {"value": value}
+
+        async def run():
+            loop_thread = threading.get_ident()
+            first = await endpoint(1)
+            second = await endpoint(1)
+            return loop_thread, first, second
+
+        loop_thread, first, second = asyncio.run(run())
+
+        assert first == second == {"value": 1}
+        assert calls == [1]
+        assert redis.threads and loop_thread not in redis.threads
+
+    def test_sync_wrapper_caches(self, redis):
+        """Test that plain functions reuse cached results"""
+        calls = []
+
+        @cached("test", ttl=60)
+        def compute(value: int):
+            calls.append(value)
+            return [value, value]
+
+        assert compute(2) == compute(2) == [2, 2]
+        assert calls == [2]
+
+    def test_excluded_params_left_out_of_key(self, redis):
+        """Test that excluded (injected) parameters do not split the cache"""
+        calls = []
+
+        @cached("test", ttl=60, exclude=("service",))
+        def lookup(value: int, service=None):
+            calls.append(service)
+            return {"value": value}
+
+        assert lookup(3, service="a") == lookup(3, service="b") == {"value": 3}
+        assert lookup(value=3, service="c") == {"value": 3}
+        assert calls == ["a"]
@@ -300,3 +300,62 @@ class TestMultiObjectiveKnapsackOptimizer:
 
         # Should have some savings calculated
         assert result.estimated_savings >= 0
+
+    def test_candidate_matching_keeps_substring_semantics(self, knapsack_optimizer):
+        """Test that name matching still finds words inside longer product names"""
+        dairy_products = [
+            Product(id="milk1", name="Leche Entera 1L", category="dairy", price=1000.0),
+            Product(id="milk2", name="Semileche Descremada", category="dairy", price=900.0),
+            Product(id="yog1", name="Yogurt Natural", category="dairy", price=700.0),
+        ]
+        item = ShoppingListItem(product_name="Lech", category="dairy", quantity=1, priority=1)
+
+        candidates = knapsack_optimizer._find_candidate_products(item, {"dairy": dairy_products})
+
+        assert [p.id for p in candidates] == ["milk1", "milk2"]
+
+    def test_preference_threshold_counts_duplicates(self, knapsack_optimizer):
+        """Test that repeated preferences weigh in the 50% match threshold"""
+        dairy_products = [
+            Product(id="org", name="Leche A", category="dairy", price=1000.0, labels=["Organic"]),
+            Product(id="loc", name="Leche B", category="dairy", price=900.0, labels=["Local"]),
+        ]
+        item = ShoppingListItem(
+            product_name="Leche", category="dairy", quantity=1, priority=1,
+            preferences=["organic", "Organic", "local"],
+        )
+
+        candidates = knapsack_optimizer._find_candidate_products(item, {"dairy": dairy_products})
+
+        assert [p.id for p in candidates] == ["org"]
+
+    def test_budget_fit_uses_exact_knapsack(self, knapsack_optimizer):
+        """Test that budget fitting finds the optimal subset where greedy would not"""
+        available_products = {
+            "dairy": [Product(id="a", name="Queso Gauda", category="dairy", price=510.0)],
+            "bakery": [Product(id="b", name="Pan Integral", category="bakery", price=500.0)],
+            "fruits": [Product(id="c", name="Manzana Roja", category="fruits", price=500.0)],
+        }
+        items = [
+            ShoppingListItem(product_name="Queso", category="dairy", quantity=1, priority=1),
+            ShoppingListItem(product_name="Pan", category="bakery", quantity=1, priority=2),
+            ShoppingListItem(product_name="Manzana", category="fruits", quantity=1, priority=2),
+        ]
+        shopping_list = ShoppingList(items=items, budget=1000.0, optimize_for="price")
+
+        result = knapsack_optimizer.optimize(shopping_list, available_products)
+
+        # Greedy por eficiencia tomaría solo "a" (valor 5); la DP toma "b" + "c" (valor 8)
+        assert sorted(p.selected_product.id for p in result.optimized_items) == ["b", "c"]
+        assert result.total_cost <= shopping_list.budget
+
+    def test_metrics_rounded_on_serialization(self, knapsack_optimizer, product_list):
+        """Test that summary metrics keep full precision and are rounded in JSON output"""
+        items = [ShoppingListItem(product_name="Leche", category="dairy", quantity=1, priority=1)]
+        shopping_list = ShoppingList(items=items, budget=3000.0, optimize_for="balanced")
+
+        result = knapsack_optimizer.optimize(shopping_list, {"dairy": product_list})
+        data = result.model_dump(mode="json")
+
+        assert data["budget_used_percentage"] == round(result.budget_used_percentage, 2)
+        assert data["optimization_score"] == round(result.optimization_score, 2)
@@ -0,0 +1,180 @@
+"""
+Tests for the throttled refresh of the product stats view
+"""
+
+import time
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app import stats_view
+from app.cache import cache_service
+
+
+class _FakeRedis:
+    """In-memory stand-in for the few Redis commands the refresh uses (TTLs ignored)"""
+
+    def __init__(self):
+        self.data = {}
+
+    def ping(self):
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+        return True
+
+    def delete(self, key):
+        return 1 if self.data.pop(key, None) is not None else 0
+
+
+class _RecordingConnection:
+    def __init__(self, statements):
+        self.statements = statements
+
+    def execute(self, stmt):
+        self.statements.append(str(stmt))
+
+
+class _RecordingEngine:
+    def __init__(self):
+        self.statements = []
+
+    @contextmanager
+    def begin(self):
+        yield _RecordingConnection(self.statements)
+
+    def refreshes(self):
+        return sum("REFRESH MATERIALIZED VIEW" in sql for sql in self.statements)
+
+
+class _EmptyResultDb:
+    def execute(self, stmt):
+        return []
+
+
+class TestStatsViewRefresh:
+    """Refresh throttling through the Redis lock and pending flag"""
+
+    @pytest.fixture
+    def redis(self, monkeypatch):
+        fake = _FakeRedis()
+        monkeypatch.setattr(cache_service, "client", fake)
+        monkeypatch.setattr(cache_service, "_suspended_until", 0.0)
+        monkeypatch.setattr(cache_service, "_consecutive_failures", 0)
+        return fake
+
+    @pytest.fixture
+    def db_engine(self, monkeypatch):
+        recording = _RecordingEngine()
+        monkeypatch.setattr(stats_view, "engine", recording)
+        return recording
+
+    @pytest.fixture
+    def requests(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(stats_view, "request_stats_refresh", lambda: calls.append(True))
+        return calls
+
+    def _hold_lock(self, redis):
+        redis.data[stats_view._REFRESH_LOCK_KEY] = b"1"
+
+    def _release_lock(self, redis):
+        redis.data.pop(stats_view._REFRESH_LOCK_KEY, None)
+
+    def _pending(self):
+        return bool(cache_service.get(stats_view._REFRESH_PENDING_KEY))
+
+    def test_refresh_takes_lock(self, redis, db_engine):
+        """Test that a free lock is taken and the view refreshed"""
+        assert stats_view.refresh_stats_view() is True
+        assert db_engine.refreshes() == 1
+        assert stats_view._REFRESH_LOCK_KEY in redis.data
+        assert not self._pending()
+
+    def test_refresh_skipped_while_locked_sets_pending(self, redis, db_engine):
+        """Test that a refresh inside the interval is skipped and left pending"""
+        self._hold_lock(redis)
+
+        assert stats_view.refresh_stats_view() is False
+        assert db_engine.refreshes() == 0
+        assert self._pending()
+
+    def test_read_with_pending_requests_background_refresh(self, redis, db_engine, requests):
+        """Test that a stats read hands a pending refresh to the refresher without running it"""
+        self._hold_lock(redis)
+        stats_view.refresh_stats_view()
+
+        stats_view.read_stats_rows(_EmptyResultDb())
+        assert requests == [True]
+        assert db_engine.refreshes() == 0
+        assert self._pending()
+
+    def test_read_without_pending_does_not_request(self, redis, db_engine, requests):
+        """Test that plain stats reads leave the refresher alone"""
+        stats_view.read_stats_rows(_EmptyResultDb())
+        assert requests == []
+
+    def test_refresher_retries_pending_after_release(self, redis, db_engine):
+        """Test that a refresh skipped under the lock is retried and runs once released"""
+        self._hold_lock(redis)
+        assert stats_view._refresh_step(True) is True
+        assert db_engine.refreshes() == 0
+        assert self._pending()
+
+        # Retry while still locked keeps it pending
+        assert stats_view._refresh_step(False) is True
+        assert db_engine.refreshes() == 0
+
+        self._release_lock(redis)
+        assert stats_view._refresh_step(False) is False
+        assert db_engine.refreshes() == 1
+        assert not self._pending()
+
+    def test_refresher_idle_without_pending(self, redis, db_engine):
+        """Test that a timed-out retry with nothing pending does not refresh"""
+        assert stats_view._refresh_step(False) is False
+        assert db_engine.refreshes() == 0
+
+    def test_force_ignores_lock(self, redis, db_engine):
+        """Test that force=True refreshes even while the lock is held"""
+        self._hold_lock(redis)
+        assert stats_view.refresh_stats_view(force=True) is True
+        assert db_engine.refreshes() == 1
+
+    def test_dirty_commit_requests_refresh_without_running_it(self, redis, db_engine, requests):
+        """Test that commits touching products only wake the refresher"""
+        session = Session()
+        session.info[stats_view._SESSION_FLAG] = True
+        session.commit()
+        session.close()
+
+        assert requests == [True]
+        assert db_engine.refreshes() == 0
+
+    def test_clean_commit_does_not_request(self, redis, db_engine, requests):
+        """Test that commits without product writes leave the view alone"""
+        session = Session()
+        session.commit()
+        session.close()
+        assert requests == []
+
+    def test_background_refresher_runs_requested_refresh(self, redis, db_engine):
+        """Test that a request is picked up by the refresher thread"""
+        stats_view.request_stats_refresh()
+
+        deadline = time.monotonic() + 5
+        while db_engine.refreshes() == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert db_engine.refreshes() == 1
+        assert stats_view._refresher.is_alive()
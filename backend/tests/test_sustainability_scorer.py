@@ -201,3 +201,49 @@ class TestSustainabilityScorer:
 
         assert score is not None
         assert 0 <= score.overall_score <= 100
+
+    def test_score_cache_reflects_product_changes(self, sustainability_scorer, sample_product):
+        """Test that cached scores are reused but not for a modified product"""
+        first = sustainability_scorer.calculate_score(sample_product)
+        assert sustainability_scorer.calculate_score(sample_product) is first
+
+        cheaper = sample_product.model_copy(update={"price": 500.0})
+        cheaper_score = sustainability_scorer.calculate_score(cheaper)
+
+        assert cheaper_score is not first
+        assert cheaper_score.economic_score > first.economic_score
+
+    def test_batch_scores_match_single_scores(
+        self, sample_product, sample_product_organic, sample_product_cheap
+    ):
+        """Test that batch scoring returns the same scores as scoring one by one"""
+        products = [sample_product, sample_product_organic, sample_product_cheap,
+                    Product(id="bare", name="Sin datos", category="test", price=2500.0)]
+
+        batch = SustainabilityScorer().calculate_scores_batch(products)
+        single = [SustainabilityScorer().calculate_score(p) for p in products]
+
+        assert batch == single
+
+    def test_rank_products_topk_matches_full_ranking(self, sustainability_scorer, product_list):
+        """Test that top-k ranking is the prefix of the full ranking, ties in input order"""
+        products = product_list + product_list
+
+        ranked = sustainability_scorer.rank_products(products)
+        top = sustainability_scorer.rank_products_topk(products, 3)
+
+        scores = [s.overall_score for _, s in ranked]
+        assert scores == sorted(scores, reverse=True)
+        assert [id(p) for p, _ in top] == [id(p) for p, _ in ranked[:3]]
+
+    def test_label_bits_unique_under_concurrency(self):
+        """Test that labels first seen from several threads get distinct bits"""
+        from concurrent.futures import ThreadPoolExecutor
+        from app.algorithms import sustainability_scorer as module
+
+        labels = [f"etiqueta-concurrente-{i}" for i in range(200)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda i: module.label_profile(labels[i::8]), range(8)))
+
+        bits = [module._LABEL_BITS[label] for label in labels]
+        assert len(set(bits)) == len(bits)